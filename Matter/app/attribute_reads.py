@@ -0,0 +1,110 @@
+"""
+Batched multi-attribute reads through a single chip-tool invocation
+
+All attribute paths an endpoint needs are read with one
+`chip-tool any read-by-id <clusters> <attributes> <node> <endpoints>` call.
+chip-tool pairs the comma-separated cluster, attribute and endpoint lists
+element-wise into paths and logs every report as
+
+    [TOO] Endpoint: 1 Cluster: 0x0000_0028 Attribute 0x0000_0001 DataVersion: 1
+    [TOO]   VendorName: NOUS
+
+which is mapped back to the field names the caller asked for.
+"""
+
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from fastapi import Request
+
+from .chip_tool_runner import ChipToolRunner
+
+class AttributePath(NamedTuple):
+    endpoint: int
+    cluster: int
+    attribute: int
+
+_REPORT_HEADER = re.compile(
+    r"Endpoint: (\d+) Cluster: 0x([0-9A-Fa-f_]+) Attribute 0x([0-9A-Fa-f_]+)"
+)
+_LOG_PREFIX = re.compile(r"^.*?\[TOO\]\s?")
+_KEY_VALUE = re.compile(r"^\s*([\w ]+?):\s*(.*?)\s*$")
+
+def build_read_command(node_id: str, paths: Dict[str, AttributePath]) -> List[str]:
+    """chip-tool arguments reading every path in one interaction"""
+    unique = list(dict.fromkeys(paths.values()))
+    return [
+        "any", "read-by-id",
+        ",".join(f"0x{path.cluster:04X}" for path in unique),
+        ",".join(f"0x{path.attribute:04X}" for path in unique),
+        str(node_id),
+        ",".join(str(path.endpoint) for path in unique)
+    ]
+
+def parse_read_output(stdout: str, paths: Dict[str, AttributePath]) -> Dict[str, Any]:
+    """Map attribute reports in chip-tool output back to field names
+
+    Fields whose path produced no report (e.g. unsupported attributes) are None.
+    Struct values are returned as dicts of their logged members.
+    """
+    reports: Dict[AttributePath, Any] = {}
+    current: Optional[AttributePath] = None
+    struct: Optional[Dict] = None
+
+    for line in stdout.splitlines():
+        if "[TOO]" not in line:
+            continue
+        header = _REPORT_HEADER.search(line)
+        if header:
+            current = AttributePath(
+                int(header.group(1)),
+                int(header.group(2).replace("_", ""), 16),
+                int(header.group(3).replace("_", ""), 16)
+            )
+            struct = None
+            continue
+        if current is None:
+            continue
+
+        text = _LOG_PREFIX.sub("", line)
+        if struct is not None:
+            if text.strip() == "}":
+                reports[current] = struct
+                current, struct = None, None
+                continue
+            match = _KEY_VALUE.match(text)
+            if match:
+                struct[match.group(1)] = _convert(match.group(2))
+            continue
+
+        match = _KEY_VALUE.match(text)
+        if not match:
+            continue
+        if match.group(2) == "{":
+            struct = {}
+        else:
+            reports[current] = _convert(match.group(2))
+            current = None
+
+    return {field: reports.get(path) for field, path in paths.items()}
+
+async def read_attributes(runner: ChipToolRunner, node_id: str, paths: Dict[str, AttributePath],
+                          request: Optional[Request] = None, timeout: Optional[float] = None) -> Dict:
+    """Read named attribute paths from a node with one chip-tool process"""
+    result = await runner.run(build_read_command(node_id, paths), timeout=timeout, request=request)
+    result["fields"] = parse_read_output(result["stdout"], paths) if result["return_code"] == 0 else {
+        field: None for field in paths
+    }
+    return result
+
+def _convert(value: str) -> Any:
+    if value.upper() in ("TRUE", "FALSE"):
+        return value.upper() == "TRUE"
+    if value.startswith('"') and value.endswith('"') and len(value) >= 2:
+        return value[1:-1]
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
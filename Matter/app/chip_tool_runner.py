@@ -0,0 +1,149 @@
+"""
+Async chip-tool execution for the Matter bridge
+
+chip-tool calls run as asyncio subprocesses behind a concurrency semaphore,
+each with a per-command timeout. A call that times out or whose HTTP client
+disconnects is cancelled and its process group killed.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Dict, List, Optional
+
+from fastapi import Request
+
+from .metrics import DEFAULT_BUCKETS, REGISTRY, SUBPROCESS_SPAWNS, chip_tool_labels
+
+logger = logging.getLogger(__name__)
+
+# Default timeouts in seconds, by chip-tool cluster/command group
+DEFAULT_TIMEOUTS = {
+    "discover": 60,
+    "pairing": 300,
+}
+DEFAULT_TIMEOUT = 30
+
+CHIP_TOOL_COMMAND_SECONDS = REGISTRY.histogram(
+    "chip_tool_command_seconds",
+    "chip-tool process run time by cluster and command",
+    ["cluster", "command"],
+    buckets=DEFAULT_BUCKETS + (60, 120, 300)
+)
+CHIP_TOOL_WAIT_SECONDS = REGISTRY.histogram(
+    "chip_tool_wait_seconds",
+    "Time chip-tool calls wait for a free slot under the concurrency limit"
+)
+CHIP_TOOL_COMMAND_FAILURES = REGISTRY.counter(
+    "chip_tool_command_failures_total",
+    "chip-tool calls that exited non-zero, timed out or failed to run, by cluster and command",
+    ["cluster", "command"]
+)
+
+class ClientDisconnected(Exception):
+    """The HTTP client went away before the chip-tool call finished"""
+
+class ChipToolRunner:
+    """Runs chip-tool without blocking the event loop"""
+
+    def __init__(self, chip_tool_path: str, env: Dict[str, str], max_concurrency: int = 4):
+        self.chip_tool_path = chip_tool_path
+        self.env = env
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, args: List[str], timeout: Optional[float] = None,
+                  request: Optional[Request] = None) -> Dict:
+        """Run chip-tool with the given arguments
+
+        Raises asyncio.TimeoutError when the command exceeds its timeout and
+        ClientDisconnected when the request's client disconnects first.
+        """
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUTS.get(args[0], DEFAULT_TIMEOUT) if args else DEFAULT_TIMEOUT
+
+        task = asyncio.ensure_future(self._run_limited(args, timeout))
+        if request is None:
+            return await task
+
+        watcher = asyncio.ensure_future(self._watch_disconnect(request))
+        try:
+            done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                return task.result()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            raise ClientDisconnected(f"Client disconnected during chip-tool {' '.join(args[:2])}")
+        finally:
+            watcher.cancel()
+
+    def get_status(self) -> Dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "waiting": self.waiting
+        }
+
+    async def _run_limited(self, args: List[str], timeout: float) -> Dict:
+        self.waiting += 1
+        try:
+            with CHIP_TOOL_WAIT_SECONDS.time():
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        labels = chip_tool_labels(args)
+        try:
+            with CHIP_TOOL_COMMAND_SECONDS.time(**labels):
+                result = await self._exec(args, timeout)
+        except Exception:
+            # Timeouts count; a cancellation (client disconnected) is not chip-tool failing
+            CHIP_TOOL_COMMAND_FAILURES.inc(**labels)
+            raise
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+        if result["return_code"] != 0:
+            CHIP_TOOL_COMMAND_FAILURES.inc(**labels)
+        return result
+
+    async def _exec(self, args: List[str], timeout: float) -> Dict:
+        SUBPROCESS_SPAWNS.inc(program="chip-tool")
+        # A new session gives chip-tool its own process group, so children die with it
+        process = await asyncio.create_subprocess_exec(
+            self.chip_tool_path, *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self.env,
+            start_new_session=True
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._kill(process)
+            await process.wait()
+            raise
+
+        return {
+            "return_code": process.returncode,
+            "stdout": stdout.decode(errors="replace"),
+            "stderr": stderr.decode(errors="replace")
+        }
+
+    def _kill(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        logger.warning(f"Killed chip-tool process {process.pid}")
+
+    async def _watch_disconnect(self, request: Request, interval: float = 0.5):
+        while not await request.is_disconnected():
+            await asyncio.sleep(interval)
@@ -13,17 +13,98 @@ import base64
 import hashlib
 import subprocess
 import os
+import time
+from pathlib import Path
+
+from .setup_payload import parse_setup_payload
 
 logger = logging.getLogger(__name__)
 
+NOUS_VENDOR_ID = 0x125D
+
+# File commissioned devices are persisted to when no state_path is passed in:
+# $MATTER_COMMISSIONER_STATE_PATH, else a file in the bridge's data directory
+# (MATTER_DATA_PATH in main_simple.py)
+STATE_PATH_ENV = "MATTER_COMMISSIONER_STATE_PATH"
+DEFAULT_STATE_PATH = "/home/chregg/MSH/matter_data/commissioned_devices.json"
+
 class RealMatterCommissioner:
     """Real Matter Commissioner using WebSocket-based python-matter-server"""
     
-    def __init__(self, matter_server=None):
+    def __init__(self, matter_server=None, state_path: Optional[str] = None):
         self.initialized = False
         self.node_counter = 1000
         self.commissioned_devices = {}
+        # node_id -> device_id; the reverse direction is commissioned_devices[device_id]["node_id"]
+        self.node_index: Dict[int, str] = {}
         self.matter_server = matter_server  # Reference to the matter server instance
+        # Where commissioned devices are persisted
+        self.state_path = Path(state_path or os.environ.get(STATE_PATH_ENV) or DEFAULT_STATE_PATH)
+        self._load_state()
+    
+    def _load_state(self):
+        """Reload commissioned devices and rebuild the node index"""
+        if not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            self.commissioned_devices = state.get("devices", {})
+            self.node_index = {
+                device_info["node_id"]: device_id
+                for device_id, device_info in self.commissioned_devices.items()
+            }
+            # Never hand out a node id that is already in use
+            self.node_counter = max([state.get("node_counter", self.node_counter)] +
+                                    [node_id + 1 for node_id in self.node_index if isinstance(node_id, int)])
+            logger.info(f"Loaded {len(self.commissioned_devices)} commissioned devices from {self.state_path}")
+        except Exception as e:
+            logger.warning(f"Failed to load commissioned devices: {e}")
+    
+    def _save_state(self):
+        """Persist commissioned devices, replacing the file atomically"""
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({"node_counter": self.node_counter, "devices": self.commissioned_devices}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Failed to save commissioned devices: {e}")
+    
+    def _register_device(self, device_id: str, device_info: Dict[str, Any]):
+        """Record a commissioned device in both directions of the index"""
+        node_id = device_info["node_id"]
+        # A node re-commissioned under a new device id drops its old entry,
+        # and a device id reused for a new node drops its old node
+        previous_device = self.node_index.get(node_id)
+        if previous_device is not None and previous_device != device_id:
+            self.commissioned_devices.pop(previous_device, None)
+        previous_info = self.commissioned_devices.get(device_id)
+        if previous_info is not None and self.node_index.get(previous_info["node_id"]) == device_id:
+            del self.node_index[previous_info["node_id"]]
+        self.commissioned_devices[device_id] = device_info
+        self.node_index[node_id] = device_id
+        self._save_state()
+    
+    def remove_device(self, device_id: str) -> bool:
+        """Forget a commissioned device; returns False if it was not known"""
+        device_info = self.commissioned_devices.pop(device_id, None)
+        if device_info is None:
+            return False
+        if self.node_index.get(device_info["node_id"]) == device_id:
+            del self.node_index[device_info["node_id"]]
+        self._save_state()
+        return True
+    
+    def device_for_node(self, node_id: int) -> Optional[str]:
+        return self.node_index.get(node_id)
+    
+    def node_for_device(self, device_id: str) -> Optional[int]:
+        device_info = self.commissioned_devices.get(device_id)
+        return device_info["node_id"] if device_info else None
         
     async def initialize(self):
         """Initialize the Matter commissioner with WebSocket approach"""
@@ -50,7 +131,7 @@ class RealMatterCommissioner:
             except Exception as e:
                 logger.error(f"Failed to connect to matter server: {e}")
                 # Fall back to basic initialization
-            self.initialized = True
+                self.initialized = True
                 logger.info("Falling back to basic commissioning mode")
             
         except Exception as e:
@@ -58,64 +139,23 @@ class RealMatterCommissioner:
             raise
     
     def parse_qr_code(self, qr_code: str) -> Dict[str, Any]:
-        """Parse Matter QR code in various formats to extract device information"""
+        """Parse a Matter QR code (MT: Base38) or manual pairing code to extract device information"""
         try:
-            if not qr_code.startswith("MT:"):
-                raise ValueError("Invalid QR code format. Must start with 'MT:'")
-            
-            # Remove MT: prefix and decode
-            qr_data = qr_code[3:]
+            payload = parse_setup_payload(qr_code)
             
-            # Check if this is the standard format with + separators
-            if '+' in qr_data:
-                # Standard format: MT:<version>+<vendor_id>+<product_id>+<custom_data>+<discriminator>+<passcode>
-                # Example: MT:1+0x1234+0x5678+0x0000+1234+20202021
-                
-                parts = qr_data.split('+')
-                if len(parts) < 6:
-                    raise ValueError(f"Invalid QR code format. Expected 6+ parts, got {len(parts)}")
-                
-                version = parts[0]
-                vendor_id = int(parts[1], 16) if parts[1].startswith('0x') else int(parts[1])
-                product_id = int(parts[2], 16) if parts[2].startswith('0x') else int(parts[2])
-                custom_data = parts[3]
-                discriminator = int(parts[4])
-                passcode = parts[5]
-                
-                # Extract additional data if present
-                additional_data = parts[6:] if len(parts) > 6 else []
-                
-                return {
-                    "version": version,
-                    "vendor_id": vendor_id,
-                    "product_id": product_id,
-                    "custom_data": custom_data,
-                    "discriminator": discriminator,
-                    "passcode": passcode,
-                    "additional_data": additional_data,
-                    "raw_data": qr_data,
-                    "format": "standard"
-                }
-            
-            else:
-                # Alternative format (like MT:IXA27ACN16GUBE2H910)
-                # This appears to be a different encoding format
-                logger.info(f"Detected alternative QR code format: {qr_data}")
-                
-                # For now, we'll use default values and let the commissioning process handle it
-                # This format might be vendor-specific or use a different encoding
-                return {
-                    "version": "1",
-                    "vendor_id": 0x1234,  # Default vendor ID for NOUS A8M
-                    "product_id": 0x5678,  # Default product ID
-                    "custom_data": "0x0000",
-                    "discriminator": 1234,  # Default discriminator
-                    "passcode": "20202021",  # Default Matter PIN
-                    "additional_data": [],
-                    "raw_data": qr_data,
-                    "format": "alternative",
-                    "original_code": qr_code
-                }
+            return {
+                "version": str(payload["version"]),
+                "vendor_id": payload["vendor_id"],
+                "product_id": payload["product_id"],
+                "commissioning_flow": payload["commissioning_flow"],
+                "discovery_capabilities": payload["discovery_capabilities"],
+                "discriminator": payload["discriminator"],
+                "short_discriminator": payload["short_discriminator"],
+                "passcode": str(payload["passcode"]),
+                "additional_data": payload["optional_data"],
+                "raw_data": qr_code,
+                "format": payload["format"]
+            }
             
         except Exception as e:
             logger.error(f"Failed to parse QR code: {e}")
@@ -141,35 +181,26 @@ class RealMatterCommissioner:
             if self.matter_server and hasattr(self.matter_server, 'commission_device'):
                 logger.info("Using matter server commissioning method...")
                 
-                # For alternative formats, pass the original QR code directly
-                if qr_format == "alternative":
-                    logger.info("Using original QR code for alternative format")
-                    result = await self.matter_server.commission_device(
-                        qr_code=qr_code,  # Pass original QR code
-                        method="ble"
-                    )
-                else:
-                    # For standard format, we can use parsed data
-                    result = await self.matter_server.commission_device(
-                        qr_code=qr_code,
-                        method="ble"
-                    )
+                result = await self.matter_server.commission_device(
+                    qr_code=qr_code,
+                    method="ble"
+                )
                 
                 if result and result.get("success"):
                     node_id = result.get("node_id", self.node_counter)
                     self.node_counter += 1
                     
                     # Generate device ID
-                    device_id = f"nous_a8m_{node_id}" if vendor_id == 0x1234 else f"matter_{node_id}"
+                    device_id = f"nous_a8m_{node_id}" if vendor_id == NOUS_VENDOR_ID else f"matter_{node_id}"
                     
                     # Store commissioned device
-                    self.commissioned_devices[device_id] = {
+                    self._register_device(device_id, {
                         "node_id": node_id,
                         "vendor_id": vendor_id,
                         "product_id": product_id,
                         "qr_data": qr_data,
-                        "commissioned_at": asyncio.get_event_loop().time()
-                    }
+                        "commissioned_at": time.time()
+                    })
                     
                     return {
                         "success": True,
@@ -197,16 +228,16 @@ class RealMatterCommissioner:
             self.node_counter += 1
             
             # Generate device ID
-            device_id = f"nous_a8m_{node_id}" if vendor_id == 0x1234 else f"matter_{node_id}"
+            device_id = f"nous_a8m_{node_id}" if vendor_id == NOUS_VENDOR_ID else f"matter_{node_id}"
             
             # Store commissioned device
-            self.commissioned_devices[device_id] = {
+            self._register_device(device_id, {
                 "node_id": node_id,
                 "vendor_id": vendor_id,
                 "product_id": product_id,
                 "qr_data": qr_data,
-                "commissioned_at": asyncio.get_event_loop().time()
-            }
+                "commissioned_at": time.time()
+            })
             
             return {
                 "success": True,
@@ -258,19 +289,10 @@ class RealMatterCommissioner:
             if self.matter_server and hasattr(self.matter_server, 'commission_device'):
                 logger.info("Using matter server commissioning method...")
                 
-                # For alternative formats, pass the original QR code directly
-                if qr_format == "alternative":
-                    logger.info("Using original QR code for alternative format")
-                    result = await self.matter_server.commission_device(
-                        qr_code=qr_code,  # Pass original QR code
-                        method="wifi"
-                    )
-                else:
-                    # For standard format, we can use parsed data
-                    result = await self.matter_server.commission_device(
-                        qr_code=qr_code,
-                        method="wifi"
-                    )
+                result = await self.matter_server.commission_device(
+                    qr_code=qr_code,
+                    method="wifi"
+                )
                 
                 if result and result.get("success"):
                     node_id = result.get("node_id", self.node_counter)
@@ -280,16 +302,16 @@ class RealMatterCommissioner:
                     await self._switch_to_normal_mode()
                     
                     # Generate device ID
-                    device_id = f"nous_a8m_{node_id}" if vendor_id == 0x1234 else f"matter_{node_id}"
+                    device_id = f"nous_a8m_{node_id}" if vendor_id == NOUS_VENDOR_ID else f"matter_{node_id}"
                     
                     # Store commissioned device
-                    self.commissioned_devices[device_id] = {
+                    self._register_device(device_id, {
                         "node_id": node_id,
                         "vendor_id": vendor_id,
                         "product_id": product_id,
                         "qr_data": qr_data,
-                        "commissioned_at": asyncio.get_event_loop().time()
-                    }
+                        "commissioned_at": time.time()
+                    })
                     
                     return {
                         "success": True,
@@ -320,16 +342,16 @@ class RealMatterCommissioner:
             self.node_counter += 1
             
             # Generate device ID
-            device_id = f"nous_a8m_{node_id}" if vendor_id == 0x1234 else f"matter_{node_id}"
+            device_id = f"nous_a8m_{node_id}" if vendor_id == NOUS_VENDOR_ID else f"matter_{node_id}"
             
             # Store commissioned device
-            self.commissioned_devices[device_id] = {
+            self._register_device(device_id, {
                 "node_id": node_id,
                 "vendor_id": vendor_id,
                 "product_id": product_id,
                 "qr_data": qr_data,
-                "commissioned_at": asyncio.get_event_loop().time()
-            }
+                "commissioned_at": time.time()
+            })
             
             return {
                 "success": True,
@@ -477,12 +499,7 @@ class RealMatterCommissioner:
             if not self.initialized:
                 raise RuntimeError("Commissioner not initialized")
             
-            # Find device by node_id
-            device_id = None
-            for dev_id, device_info in self.commissioned_devices.items():
-                if device_info["node_id"] == node_id:
-                    device_id = dev_id
-                    break
+            device_id = self.node_index.get(node_id)
             
             if not device_id:
                 raise RuntimeError(f"Device with node_id {node_id} not found")
@@ -514,14 +531,14 @@ class RealMatterCommissioner:
             logger.warning("Using fallback command simulation")
             await asyncio.sleep(1)  # Simulate command execution time
             
-                return {
-                    "success": True, 
-                    "command": command,
-                    "node_id": node_id,
+            return {
+                "success": True, 
+                "command": command,
+                "node_id": node_id,
                 "cluster_id": cluster_id,
                 "device_id": device_id,
                 "method": "simulation"
-                }
+            }
             
         except Exception as e:
             logger.error(f"Device command failed: {e}")
@@ -556,5 +573,6 @@ class RealMatterCommissioner:
             logger.error(f"Failed to get device state: {e}")
             return {"success": False, "error": str(e)}
 
-# Global commissioner instance - removed since it's now created in main_simple.py
-# commissioner = RealMatterCommissioner() 
\ No newline at end of file
+# No global commissioner instance; create one with
+# RealMatterCommissioner(matter_server), which persists to DEFAULT_STATE_PATH
+# unless state_path or MATTER_COMMISSIONER_STATE_PATH says otherwise.
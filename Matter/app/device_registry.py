@@ -0,0 +1,155 @@
+"""
+Persistent device registry for the Matter bridge
+
+Devices live in a SQLite table and are mirrored in memory, so reads are dict
+lookups and a restart only has to load one table (milliseconds even for
+thousands of devices). Every change is written through as a single-row
+statement; WAL mode keeps those writes cheap. Secondary indexes by node_id
+and room_id are kept in memory alongside the rows.
+
+The registry behaves like a dict of device_id -> device data. Assign a
+device to persist it; changing a device dict in place is not persisted.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    "db_operation_seconds",
+    "Device registry SQLite statements by table and operation",
+    ["table", "operation"]
+)
+
+class DeviceRegistry(MutableMapping):
+    """SQLite-backed device_id -> device dict mapping with node and room indexes"""
+
+    def __init__(self, db_path: str, table: str = "devices"):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid registry table name: {table}")
+        self.db_path = db_path
+        self.table = table
+
+        self._devices: Dict[str, Dict] = {}
+        self._by_node: Dict[int, Set[str]] = {}
+        self._by_room: Dict[int, Set[str]] = {}
+
+        self._db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                device_id TEXT PRIMARY KEY,
+                node_id INTEGER,
+                room_id INTEGER,
+                data TEXT NOT NULL
+            )
+        """)
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_node_id ON {table} (node_id)")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_room_id ON {table} (room_id)")
+        self._load()
+
+    def __getitem__(self, device_id: str) -> Dict:
+        return self._devices[device_id]
+
+    def __setitem__(self, device_id: str, device: Dict):
+        with DB_OPERATION_SECONDS.time(table=self.table, operation="upsert"):
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (device_id, node_id, room_id, data) VALUES (?, ?, ?, ?)",
+                (device_id, device.get("node_id"), device.get("room_id"), json.dumps(device))
+            )
+        self._unindex(device_id)
+        self._devices[device_id] = device
+        self._index(device_id, device)
+
+    def __delitem__(self, device_id: str):
+        if device_id not in self._devices:
+            raise KeyError(device_id)
+        with DB_OPERATION_SECONDS.time(table=self.table, operation="delete"):
+            self._db.execute(f"DELETE FROM {self.table} WHERE device_id = ?", (device_id,))
+        self._unindex(device_id)
+        del self._devices[device_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._devices)
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, device_id) -> bool:
+        return device_id in self._devices
+
+    def replace_all(self, devices: Dict[str, Dict]):
+        """Swap the whole registry for new contents in one transaction"""
+        with DB_OPERATION_SECONDS.time(table=self.table, operation="replace_all"), self._db:
+            self._db.execute("BEGIN")
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.executemany(
+                f"INSERT INTO {self.table} (device_id, node_id, room_id, data) VALUES (?, ?, ?, ?)",
+                [
+                    (device_id, device.get("node_id"), device.get("room_id"), json.dumps(device))
+                    for device_id, device in devices.items()
+                ]
+            )
+        self._devices = {}
+        self._by_node = {}
+        self._by_room = {}
+        for device_id, device in devices.items():
+            self._devices[device_id] = device
+            self._index(device_id, device)
+
+    def clear(self):
+        self.replace_all({})
+
+    def by_node(self, node_id: int) -> List[Tuple[str, Dict]]:
+        """(device_id, device) pairs for a Matter node"""
+        return [(device_id, self._devices[device_id]) for device_id in self._by_node.get(node_id, ())]
+
+    def by_room(self, room_id: int) -> List[Tuple[str, Dict]]:
+        """(device_id, device) pairs assigned to a room"""
+        return [(device_id, self._devices[device_id]) for device_id in self._by_room.get(room_id, ())]
+
+    def close(self):
+        self._db.close()
+
+    def get_status(self) -> Dict:
+        return {
+            "db_path": self.db_path,
+            "table": self.table,
+            "devices": len(self._devices),
+            "nodes": len(self._by_node),
+            "rooms": len(self._by_room)
+        }
+
+    def _load(self):
+        started = time.perf_counter()
+        for device_id, data in self._db.execute(f"SELECT device_id, data FROM {self.table}"):
+            device = json.loads(data)
+            self._devices[device_id] = device
+            self._index(device_id, device)
+        elapsed = time.perf_counter() - started
+        DB_OPERATION_SECONDS.observe(elapsed, table=self.table, operation="load")
+        logger.info(f"Loaded {len(self._devices)} entries from {self.table} in {elapsed * 1000:.1f} ms")
+
+    def _index(self, device_id: str, device: Dict):
+        for index, key in ((self._by_node, device.get("node_id")), (self._by_room, device.get("room_id"))):
+            if key is not None:
+                index.setdefault(key, set()).add(device_id)
+
+    def _unindex(self, device_id: str):
+        device: Optional[Dict] = self._devices.get(device_id)
+        if device is None:
+            return
+        for index, key in ((self._by_node, device.get("node_id")), (self._by_room, device.get("room_id"))):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(device_id)
+                if not ids:
+                    del index[key]
@@ -1,12 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
-import subprocess
+import asyncio
 import json
 import os
 from typing import Optional, Dict, Any
 import logging
 
+from .attribute_reads import AttributePath, read_attributes
+from .chip_tool_runner import ChipToolRunner, ClientDisconnected
+from . import metrics
+
 app = FastAPI(title="MSH Matter Bridge")
 
 # Configure CORS
@@ -26,6 +31,20 @@ CHIP_TOOL_PATH = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only/chip-to
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def chip_tool_env() -> dict:
+    """Environment for chip-tool processes"""
+    env = os.environ.copy()
+    env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
+    env["MATTER_ROOT"] = MATTER_SDK_PATH
+    return env
+
+# Shared async chip-tool executor; bounds concurrent chip-tool processes
+chip_tool = ChipToolRunner(
+    CHIP_TOOL_PATH,
+    chip_tool_env(),
+    max_concurrency=int(os.environ.get("CHIP_TOOL_CONCURRENCY", "4"))
+)
+
 class CommissioningRequest(BaseModel):
     device_name: str
     device_type: str
@@ -54,50 +73,50 @@ class TasmotaDevice:
     def get_state(self) -> dict:
         return self.properties
 
+# Attribute paths read in one chip-tool call per request
+DEVICE_INFO_PATHS = {
+    "vendor_name": AttributePath(0, 0x0028, 0x0001),
+    "vendor_id": AttributePath(0, 0x0028, 0x0002),
+    "product_name": AttributePath(0, 0x0028, 0x0003),
+    "product_id": AttributePath(0, 0x0028, 0x0004),
+    "software_version": AttributePath(0, 0x0028, 0x000A),
+}
+
+TASMOTA_METRIC_PATHS = {
+    "power": AttributePath(1, 0x0B04, 0x050B),    # ElectricalMeasurement ActivePower (W)
+    "voltage": AttributePath(1, 0x0B04, 0x0505),  # RmsVoltage (V)
+    "current": AttributePath(1, 0x0B04, 0x0508),  # RmsCurrent (A)
+    "energy": AttributePath(1, 0x0091, 0x0001),   # ElectricalEnergyMeasurement CumulativeEnergyImported (mWh)
+}
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "chip_tool": chip_tool.get_status()}
 
 @app.get("/")
 async def root():
     return {"message": "MSH Matter Bridge API"}
 
-async def verify_device_commissioning(device_id: str, env: dict) -> bool:
-    """Verify if a device is properly commissioned by checking its status."""
-    try:
-        # Try to read the device's basic information
-        cmd = [
-            CHIP_TOOL_PATH,
-            "device",
-            "read",
-            "basic",
-            "vendor-name",
-            device_id,
-            "1"  # Endpoint ID
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
-        
-        # If we can read the device info, it's commissioned
-        return result.returncode == 0
-    except Exception:
-        return False
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected(request: Request, exc: ClientDisconnected):
+    """Nobody is left to read the response; 499 keeps these out of the 5xx counts"""
+    logger.info(str(exc))
+    return Response(status_code=499)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.post("/commission")
-async def commission_device():
+async def commission_device(request: Request):
     """Commission a Matter device using BLE or mDNS discovery"""
     try:
         logger.info("Starting device commissioning...")
         
-        # Set up environment
-        env = os.environ.copy()
-        env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
-        env["MATTER_ROOT"] = MATTER_SDK_PATH
-        
         # Try BLE discovery first (for devices like NOUS A8M)
         logger.info("Attempting BLE discovery for Matter devices...")
         ble_discovery_cmd = [
-            CHIP_TOOL_PATH,
             "discover",
             "commissionables",
             "--ble-adapter", "0",  # Use first BLE adapter
@@ -110,11 +129,11 @@ async def commission_device():
         logger.info(f"BLE discovery command: {' '.join(ble_discovery_cmd)}")
         
         # Run BLE discovery
-        ble_result = subprocess.run(ble_discovery_cmd, capture_output=True, text=True, env=env, timeout=30)
-        logger.info(f"BLE discovery stdout: {ble_result.stdout}")
-        logger.info(f"BLE discovery stderr: {ble_result.stderr}")
+        ble_result = await chip_tool.run(ble_discovery_cmd, timeout=30, request=request)
+        logger.info(f"BLE discovery stdout: {ble_result['stdout']}")
+        logger.info(f"BLE discovery stderr: {ble_result['stderr']}")
         
-        if ble_result.returncode == 0 and "Discovered device" in ble_result.stdout:
+        if ble_result["return_code"] == 0 and "Discovered device" in ble_result["stdout"]:
             logger.info("BLE device discovered, proceeding with commissioning...")
             # Extract device info from BLE discovery
             # This is a simplified approach - in practice you'd parse the output
@@ -123,7 +142,6 @@ async def commission_device():
             logger.info("No BLE devices found, trying mDNS discovery...")
             # Fall back to mDNS discovery
             mDNS_discovery_cmd = [
-                CHIP_TOOL_PATH,
                 "discover",
                 "commissionables",
                 "--commissioner-name", "alpha",
@@ -132,11 +150,11 @@ async def commission_device():
                 "--only-allow-trusted-cd-keys", "0"
             ]
             
-            mDNS_result = subprocess.run(mDNS_discovery_cmd, capture_output=True, text=True, env=env, timeout=60)
-            logger.info(f"mDNS discovery stdout: {mDNS_result.stdout}")
-            logger.info(f"mDNS discovery stderr: {mDNS_result.stderr}")
+            mDNS_result = await chip_tool.run(mDNS_discovery_cmd, timeout=60, request=request)
+            logger.info(f"mDNS discovery stdout: {mDNS_result['stdout']}")
+            logger.info(f"mDNS discovery stderr: {mDNS_result['stderr']}")
             
-            if mDNS_result.returncode != 0:
+            if mDNS_result["return_code"] != 0:
                 raise HTTPException(status_code=400, detail="Device discovery failed: No devices found via BLE or mDNS")
             
             device_info = "mdns_device"  # Placeholder
@@ -146,48 +164,47 @@ async def commission_device():
         
         return {"status": "success", "message": "Device discovered successfully", "method": "BLE" if "ble_device" in locals() else "mDNS"}
         
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         logger.error("Device discovery timed out")
-        raise HTTPException(status_code=400, detail="Device discovery timed out after 60 seconds. Please ensure your device is in pairing mode and within range.")
+        raise HTTPException(status_code=504, detail="Device discovery timed out after 60 seconds. Please ensure your device is in pairing mode and within range.")
+    except (HTTPException, ClientDisconnected):
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during commissioning: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error during commissioning: {e}")
 
 @app.post("/device/{device_id}/state")
-async def set_device_state(device_id: str, state: DeviceState):
+async def set_device_state(device_id: str, state: DeviceState, request: Request):
     try:
         # Implement device state control
         cmd = [
-            CHIP_TOOL_PATH,
             "onoff",
             "toggle",
             device_id,
             "1"  # Endpoint ID
         ]
         
-        # Set up environment
-        env = os.environ.copy()
-        env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
-        env["MATTER_ROOT"] = MATTER_SDK_PATH
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        result = await chip_tool.run(cmd, request=request)
         
-        if result.returncode != 0:
-            raise HTTPException(status_code=400, detail=f"Failed to set device state: {result.stderr}")
+        if result["return_code"] != 0:
+            raise HTTPException(status_code=400, detail=f"Failed to set device state: {result['stderr']}")
         
         return {
             "status": "success",
             "message": "Device state updated successfully"
         }
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out setting the device state")
+    except (HTTPException, ClientDisconnected):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/device/{device_id}/state")
-async def get_device_state(device_id: str):
+async def get_device_state(device_id: str, request: Request):
     try:
         # Get current device state
         cmd = [
-            CHIP_TOOL_PATH,
             "onoff",
             "read",
             "on-off",
@@ -195,19 +212,14 @@ async def get_device_state(device_id: str):
             "1"  # Endpoint ID
         ]
         
-        # Set up environment
-        env = os.environ.copy()
-        env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
-        env["MATTER_ROOT"] = MATTER_SDK_PATH
+        result = await chip_tool.run(cmd, request=request)
         
-        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
-        
-        if result.returncode != 0:
-            raise HTTPException(status_code=400, detail=f"Failed to get device state: {result.stderr}")
+        if result["return_code"] != 0:
+            raise HTTPException(status_code=400, detail=f"Failed to get device state: {result['stderr']}")
         
         # Parse the output to get state
         state = "unknown"
-        for line in result.stdout.split('\n'):
+        for line in result["stdout"].split('\n'):
             if "on-off:" in line:
                 state = "on" if "true" in line.lower() else "off"
                 break
@@ -217,136 +229,90 @@ async def get_device_state(device_id: str):
             "device_id": device_id,
             "state": state
         }
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out reading the device state")
+    except (HTTPException, ClientDisconnected):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/device/{device_id}/status")
-async def get_device_status(device_id: str):
+async def get_device_status(device_id: str, request: Request):
     """Get the current status of a commissioned device."""
     try:
-        # Set up environment
-        env = os.environ.copy()
-        env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
-        env["MATTER_ROOT"] = MATTER_SDK_PATH
-        
-        # Check if device is commissioned
-        is_commissioned = await verify_device_commissioning(device_id, env)
+        # One read both proves the device is commissioned and fetches its info
+        result = await read_attributes(chip_tool, device_id, DEVICE_INFO_PATHS, request=request)
         
-        if not is_commissioned:
+        if result["return_code"] != 0:
             return {
                 "status": "error",
                 "message": "Device is not commissioned or not responding",
-                "commissioned": False
-            }
-        
-        # Try to read basic device information
-        cmd = [
-            CHIP_TOOL_PATH,
-            "device",
-            "read",
-            "basic",
-            "vendor-name",
-            device_id,
-            "1"  # Endpoint ID
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
-        
-        if result.returncode != 0:
-            return {
-                "status": "error",
-                "message": "Failed to read device information",
-                "commissioned": True,
-                "error": result.stderr
+                "commissioned": False,
+                "error": result["stderr"]
             }
         
         return {
             "status": "success",
             "message": "Device is commissioned and responding",
             "commissioned": True,
-            "device_info": result.stdout
+            "device_info": result["fields"]
         }
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out reading the device status")
+    except (HTTPException, ClientDisconnected):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/device/{device_id}/tasmota/state")
-async def update_tasmota_state(device_id: str, state: dict):
+async def update_tasmota_state(device_id: str, state: dict, request: Request):
     """Update the state of a Tasmota device."""
     try:
-        # Set up environment
-        env = os.environ.copy()
-        env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
-        env["MATTER_ROOT"] = MATTER_SDK_PATH
-
         # Update power state if provided
         if "power" in state:
             cmd = [
-                CHIP_TOOL_PATH,
                 "onoff",
                 "toggle" if state["power"] else "off",
                 device_id,
                 "1"  # Endpoint ID
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, env=env)
-            if result.returncode != 0:
-                raise HTTPException(status_code=400, detail=f"Failed to update power state: {result.stderr}")
+            result = await chip_tool.run(cmd, request=request)
+            if result["return_code"] != 0:
+                raise HTTPException(status_code=400, detail=f"Failed to update power state: {result['stderr']}")
 
         return {
             "status": "success",
             "message": "Tasmota device state updated successfully"
         }
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out updating the Tasmota device state")
+    except (HTTPException, ClientDisconnected):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/device/{device_id}/tasmota/metrics")
-async def get_tasmota_metrics(device_id: str):
+async def get_tasmota_metrics(device_id: str, request: Request):
     """Get power metrics from a Tasmota device."""
     try:
-        # Set up environment
-        env = os.environ.copy()
-        env["PATH"] = f"{MATTER_SDK_PATH}/out/linux-x64-all-clusters-ipv6only:{env['PATH']}"
-        env["MATTER_ROOT"] = MATTER_SDK_PATH
-
-        # Get power measurement
-        power_cmd = [
-            CHIP_TOOL_PATH,
-            "electricalmeasurement",
-            "read",
-            "measurement-type",
-            device_id,
-            "1"  # Endpoint ID
-        ]
-        power_result = subprocess.run(power_cmd, capture_output=True, text=True, env=env)
+        result = await read_attributes(chip_tool, device_id, TASMOTA_METRIC_PATHS, request=request)
+        fields = result["fields"]
         
-        # Get energy measurement
-        energy_cmd = [
-            CHIP_TOOL_PATH,
-            "electricalmeasurement",
-            "read",
-            "total-energy",
-            device_id,
-            "1"  # Endpoint ID
-        ]
-        energy_result = subprocess.run(energy_cmd, capture_output=True, text=True, env=env)
-
-        metrics = {
-            "power": 0.0,
-            "energy": 0.0
+        energy = fields["energy"]
+        readings = {
+            "power": float(fields["power"] or 0.0),
+            "voltage": float(fields["voltage"] or 0.0),
+            "current": float(fields["current"] or 0.0),
+            "energy": float(energy.get("Energy", 0.0)) if isinstance(energy, dict) else 0.0
         }
 
-        # Parse power measurement
-        for line in power_result.stdout.split('\n'):
-            if "measurement-type:" in line:
-                metrics["power"] = float(line.split(':')[1].strip())
-
-        # Parse energy measurement
-        for line in energy_result.stdout.split('\n'):
-            if "total-energy:" in line:
-                metrics["energy"] = float(line.split(':')[1].strip())
-
         return {
             "status": "success",
-            "metrics": metrics
+            "metrics": readings
         }
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out reading the Tasmota device metrics")
+    except (HTTPException, ClientDisconnected):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -18,17 +18,24 @@ New Workflow:
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
 import json
 import os
 from typing import Optional, Dict, Any, List
 import logging
 import asyncio
-import aiohttp
 from pathlib import Path
 import websockets
 from datetime import datetime
 
+from .matter_ws_client import MatterServerClient
+from .node_state_cache import NodeStateCache
+from .device_registry import DeviceRegistry
+from .command_queue import NodeCommandQueue
+from .webapp_notifier import WebAppNotifier
+from . import metrics
+
 app = FastAPI(title="MSH Matter Bridge - Google Home Commissioning Approach")
 
 # Configure CORS
@@ -51,12 +58,33 @@ MATTER_DATA_PATH = "/home/chregg/MSH/matter_data"
 # Web app configuration
 WEB_APP_URL = "http://172.17.0.1:8083"
 
+# Coalescing, batching notification queue to the web app
+webapp_notifier = WebAppNotifier(WEB_APP_URL)
+
+# One shared, multiplexed connection to matter-server
+matter_client = MatterServerClient(MATTER_SERVER_URL)
+
+# Attribute-level node state, kept current by matter-server events
+node_cache = NodeStateCache()
+matter_client.add_event_handler(node_cache.handle_event)
+
+async def subscribe_to_node_events():
+    """Subscribe to node events and seed the cache; runs again after every reconnect"""
+    nodes = await matter_client.send_command("start_listening")
+    node_cache.load_nodes(nodes)
+
+matter_client.add_connect_handler(subscribe_to_node_events)
+
+# Device commands are serialised per node and rapid on/off clicks collapse
+command_queue = NodeCommandQueue()
+
 # Ensure matter data directory exists
 Path(MATTER_DATA_PATH).mkdir(exist_ok=True)
 
-# Device storage
-matter_devices = {}
-discovered_devices = {}
+# Device storage, persisted so added devices and the last discovery survive restarts
+DEVICE_DB_PATH = os.path.join(MATTER_DATA_PATH, "bridge_devices.db")
+matter_devices = DeviceRegistry(DEVICE_DB_PATH, "devices")
+discovered_devices = DeviceRegistry(DEVICE_DB_PATH, "discovered_devices")
 
 class DeviceDiscoveryRequest(BaseModel):
     """Request to discover devices on the network"""
@@ -73,45 +101,54 @@ class DeviceState(BaseModel):
     device_id: str
     state: Dict[str, Any]
 
+async def set_power(node_id: int, power: bool) -> dict:
+    """Send On or Off to a node; the result records which state was sent"""
+    result = await matter_server_request(
+        "device_command",
+        node_id=node_id,
+        endpoint_id=1,
+        cluster_id=6,  # OnOff cluster
+        command_name="On" if power else "Off",
+        payload={}
+    )
+    return {**result, "power": power}
+
 async def matter_server_request(command: str, **kwargs) -> dict:
-    """Send a command to the python-matter-server via WebSocket"""
+    """Send a command to the python-matter-server over the shared WebSocket"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.ws_connect(MATTER_SERVER_URL) as ws:
-                # Send command
-                message = {
-                    "command": command,
-                    **kwargs
-                }
-                await ws.send_str(json.dumps(message))
-                
-                # Wait for response
-                response = await ws.receive_str()
-                return json.loads(response)
+        result = await matter_client.send_command(command, **kwargs)
+        return {"success": True, "response": result}
                 
     except Exception as e:
         logger.error(f"Matter server request failed: {e}")
         return {"success": False, "error": str(e)}
 
-async def notify_webapp_of_device_update(device_id: str, device_data: dict):
-    """Notify the C# web app of device updates"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{WEB_APP_URL}/api/devices/update",
-                json={"device_id": device_id, "device_data": device_data}
-            ) as response:
-                if response.status == 200:
-                    logger.info(f"Web app notified of device update: {device_id}")
-                else:
-                    logger.warning(f"Web app notification failed: {response.status}")
-    except Exception as e:
-        logger.error(f"Failed to notify web app: {e}")
+def device_state(device: dict) -> dict:
+    """Current state of one of our devices, from the node cache when the node is known"""
+    return node_cache.device_state(device["node_id"]) or device["state"]
+
+def device_last_seen(device: dict):
+    """When the device's node last reported, falling back to when it was added"""
+    return node_cache.last_seen(device["node_id"]) or device["last_seen"]
+
+def push_state_updates(event: str, data: Any):
+    """Forward attribute changes on our devices to the web app; bursts coalesce in the notifier"""
+    if event != "attribute_updated":
+        return
+    for device_id, device in matter_devices.by_node(data[0]):
+        webapp_notifier.notify_nowait(device_id, {
+            "state": device_state(device),
+            "last_seen": device_last_seen(device)
+        })
+
+matter_client.add_event_handler(push_state_updates)
 
 @app.on_event("startup")
 async def startup_event():
     """Startup event - verify matter-server is running"""
     logger.info("MSH Matter Bridge starting up...")
+    await matter_client.start()
+    await webapp_notifier.start()
     
     # Test connection to matter-server
     try:
@@ -123,15 +160,37 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Failed to connect to matter-server: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Shutdown event - flush web app notifications and close the matter-server connection"""
+    await webapp_notifier.stop()
+    await command_queue.close()
+    await matter_client.stop()
+    matter_devices.close()
+    discovered_devices.close()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "matter_server": matter_client.get_status(),
+        "node_cache": node_cache.get_status(),
+        "webapp_notifier": webapp_notifier.get_status(),
+        "device_registry": matter_devices.get_status(),
+        "command_queue": command_queue.get_status()
+    }
 
 @app.get("/")
 async def root():
     return {"message": "MSH Matter Bridge API - Google Home Commissioning Approach", "mode": "production"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/devices/discover")
 async def discover_devices(request: DeviceDiscoveryRequest):
     """Discover Matter devices on the network that were commissioned via Google Home"""
@@ -143,13 +202,13 @@ async def discover_devices(request: DeviceDiscoveryRequest):
         
         if result.get("success"):
             nodes = result.get("response", [])
-            discovered_devices.clear()
+            found = {}
             
             for node in nodes:
                 node_id = node.get("node_id")
                 if node_id:
                     device_id = f"discovered_{node_id}"
-                    discovered_devices[device_id] = {
+                    found[device_id] = {
                         "node_id": node_id,
                         "device_id": device_id,
                         "name": f"Device {node_id}",
@@ -157,6 +216,7 @@ async def discover_devices(request: DeviceDiscoveryRequest):
                         "discovered_at": datetime.now().isoformat(),
                         "status": "available"
                     }
+            discovered_devices.replace_all(found)
             
             logger.info(f"Discovered {len(discovered_devices)} devices on network")
             return {
@@ -214,7 +274,7 @@ async def add_discovered_device(request: DeviceAddRequest):
             "room_id": request.room_id,
             "discovered_at": discovered_devices[device_id]["discovered_at"],
             "added_at": datetime.now().isoformat(),
-            "last_seen": asyncio.get_event_loop().time()
+            "last_seen": datetime.now().isoformat()
         }
         
         # Add to our device storage
@@ -224,10 +284,7 @@ async def add_discovered_device(request: DeviceAddRequest):
         del discovered_devices[device_id]
         
         # Notify web app of new device
-        try:
-            await notify_webapp_of_device_update(device_id, device_data)
-        except Exception as db_error:
-            logger.error(f"Database integration error: {db_error}")
+        await webapp_notifier.notify(device_id, device_data)
         
         logger.info(f"Device added successfully: {device_id}")
         return {
@@ -262,17 +319,14 @@ async def add_device_manually(request: DeviceAddRequest):
             "method": "manual-addition",
             "room_id": request.room_id,
             "added_at": datetime.now().isoformat(),
-            "last_seen": asyncio.get_event_loop().time()
+            "last_seen": datetime.now().isoformat()
         }
         
         # Add to our device storage
         matter_devices[device_id] = device_data
         
         # Notify web app
-        try:
-            await notify_webapp_of_device_update(device_id, device_data)
-        except Exception as db_error:
-            logger.error(f"Database integration error: {db_error}")
+        await webapp_notifier.notify(device_id, device_data)
         
         logger.info(f"Device added manually: {device_id}")
         return {
@@ -294,35 +348,27 @@ async def toggle_device_power(device_id: str):
             raise HTTPException(status_code=404, detail="Device not found")
         
         device = matter_devices[device_id]
-        current_state = device["state"].get("power", False)
-        new_state = not current_state
         node_id = device["node_id"]
+        # Toggle relative to a command still waiting for this node, if there is one
+        current_state = command_queue.pending_value(node_id, "onoff", device_state(device).get("power", False))
+        new_state = not current_state
         
         logger.info(f"Toggling power for device {device_id} (node {node_id}) from {current_state} to {new_state}")
         
-        # Use python-matter-server for device control
-        command_name = "On" if new_state else "Off"
-        result = await matter_server_request(
-            "device_command",
-            node_id=node_id,
-            endpoint_id=1,
-            cluster_id=6,  # OnOff cluster
-            command_name=command_name,
-            device_id=device_id
+        # Superseded toggles resolve with the outcome of the command actually sent
+        result = await command_queue.submit(
+            node_id, lambda: set_power(node_id, new_state), key="onoff", value=new_state
         )
+        new_state = result["power"]
         
         if result.get("success"):
-            # Update local state
-            device["state"]["power"] = new_state
-            device["state"]["power_consumption"] = 15.5 if new_state else 0.0
-            device["last_seen"] = asyncio.get_event_loop().time()
-            
+            # The node cache picks up the new OnOff value from the attribute_updated event
             logger.info(f"Device {device_id} power {'ON' if new_state else 'OFF'}")
             return {
                 "success": True,
                 "device_id": device_id,
                 "power_state": "on" if new_state else "off",
-                "power_consumption": device["state"]["power_consumption"]
+                "power_consumption": device_state(device).get("power_consumption", 0.0)
             }
         else:
             logger.error(f"Device control failed: {result.get('error')}")
@@ -346,10 +392,10 @@ async def get_device_state(device_id: str):
             "device_id": device_id,
             "name": device["name"],
             "type": device["type"],
-            "state": device["state"],
+            "state": device_state(device),
             "commissioned": device["commissioned"],
             "method": device["method"],
-            "last_seen": device["last_seen"]
+            "last_seen": device_last_seen(device)
         }
     except HTTPException:
         raise
@@ -358,18 +404,20 @@ async def get_device_state(device_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get device state: {str(e)}")
 
 @app.get("/devices")
-async def list_devices():
-    """List all devices in our system"""
+async def list_devices(room_id: Optional[int] = None):
+    """List all devices in our system, optionally only those in one room"""
     try:
         devices = []
-        for device_id, device in matter_devices.items():
+        entries = matter_devices.by_room(room_id) if room_id is not None else matter_devices.items()
+        for device_id, device in entries:
             devices.append({
                 "device_id": device_id,
                 "name": device["name"],
                 "type": device["type"],
-                "state": device["state"],
+                "state": device_state(device),
                 "commissioned": device["commissioned"],
-                "method": device["method"]
+                "method": device["method"],
+                "last_seen": device_last_seen(device)
             })
         
         return {
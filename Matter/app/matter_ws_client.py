@@ -0,0 +1,203 @@
+"""
+Persistent, multiplexed WebSocket client for python-matter-server
+
+One connection is shared by the whole app. Every command is tagged with a
+message_id and resolved from whichever frame carries that id, so many
+commands can be in flight at once and complete out of order. Event frames
+are handed to subscribers. The connection is re-established with
+exponential backoff whenever it drops.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import aiohttp
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MATTER_SERVER_REQUEST_SECONDS = REGISTRY.histogram(
+    "matter_server_request_seconds",
+    "python-matter-server command round trips by command, including waiting for the connection",
+    ["command"]
+)
+MATTER_SERVER_REQUEST_FAILURES = REGISTRY.counter(
+    "matter_server_request_failures_total",
+    "python-matter-server commands that failed, timed out or lost the connection, by command",
+    ["command"]
+)
+
+class MatterServerError(Exception):
+    """python-matter-server answered a command with an error"""
+
+    def __init__(self, error_code: int, details: str):
+        super().__init__(f"Matter server error {error_code}: {details}")
+        self.error_code = error_code
+        self.details = details
+
+class MatterServerClient:
+    """Long-lived WebSocket connection to python-matter-server"""
+
+    def __init__(self, url: str, request_timeout: float = 30,
+                 initial_backoff: float = 1, max_backoff: float = 30):
+        self.url = url
+        self.request_timeout = request_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.server_info: Optional[Dict] = None
+        self.connected = asyncio.Event()
+        self.reconnects = 0
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._message_ids = itertools.count(1)
+        self._event_handlers: List[Callable[[str, Any], None]] = []
+        self._connect_handlers: List[Callable[[], Awaitable[None]]] = []
+        self._handler_tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        """Start the connection loop"""
+        if self._task is None or self._task.done():
+            self._session = aiohttp.ClientSession()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Close the connection and fail outstanding commands"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._handler_tasks):
+            task.cancel()
+        await asyncio.gather(*self._handler_tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def add_event_handler(self, handler: Callable[[str, Any], None]):
+        """Call handler(event, data) for every event frame"""
+        self._event_handlers.append(handler)
+
+    def add_connect_handler(self, handler: Callable[[], Awaitable[None]]):
+        """Await handler() after every (re)connect, e.g. to re-subscribe"""
+        self._connect_handlers.append(handler)
+
+    async def send_command(self, command: str, timeout: Optional[float] = None, **args) -> Any:
+        """Send a command and wait for its result
+
+        Raises MatterServerError for error responses, ConnectionError if the
+        connection drops before the answer arrives, and asyncio.TimeoutError.
+        """
+        timeout = timeout if timeout is not None else self.request_timeout
+        with MATTER_SERVER_REQUEST_SECONDS.time(command=command):
+            try:
+                return await self._request(command, timeout, args)
+            except Exception:
+                MATTER_SERVER_REQUEST_FAILURES.inc(command=command)
+                raise
+
+    async def _request(self, command: str, timeout: float, args: Dict) -> Any:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        await asyncio.wait_for(self.connected.wait(), timeout=timeout)
+
+        message_id = str(next(self._message_ids))
+        future = loop.create_future()
+        self._pending[message_id] = future
+        try:
+            await self._ws.send_str(json.dumps({
+                "message_id": message_id,
+                "command": command,
+                "args": args
+            }))
+            return await asyncio.wait_for(future, timeout=max(0, deadline - loop.time()))
+        finally:
+            self._pending.pop(message_id, None)
+
+    def get_status(self) -> Dict:
+        return {
+            "url": self.url,
+            "connected": self.connected.is_set(),
+            "in_flight": len(self._pending),
+            "reconnects": self.reconnects,
+            "server_info": self.server_info
+        }
+
+    async def _run(self):
+        backoff = self.initial_backoff
+        while True:
+            try:
+                # Node dumps can be large, so frames are not size-limited
+                async with self._session.ws_connect(self.url, max_msg_size=0, heartbeat=30) as ws:
+                    self._ws = ws
+                    # The first frame is the server info, not a response
+                    self.server_info = json.loads((await ws.receive_str(timeout=self.request_timeout)))
+                    self.connected.set()
+                    backoff = self.initial_backoff
+                    logger.info(f"Connected to matter-server (schema {self.server_info.get('schema_version')})")
+
+                    for handler in self._connect_handlers:
+                        task = asyncio.create_task(self._run_connect_handler(handler))
+                        self._handler_tasks.add(task)
+                        task.add_done_callback(self._handler_tasks.discard)
+
+                    async for frame in ws:
+                        if frame.type == aiohttp.WSMsgType.TEXT:
+                            self._dispatch(json.loads(frame.data))
+                        elif frame.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                logger.warning("matter-server connection closed")
+            except asyncio.CancelledError:
+                self._disconnected()
+                raise
+            except Exception as e:
+                logger.error(f"matter-server connection failed: {e}")
+
+            self._disconnected()
+            self.reconnects += 1
+            # Jitter keeps several bridges from reconnecting in lockstep
+            delay = backoff * (0.5 + random.random() / 2)
+            logger.info(f"Reconnecting to matter-server in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _dispatch(self, message: Dict):
+        if "event" in message:
+            for handler in self._event_handlers:
+                try:
+                    handler(message["event"], message.get("data"))
+                except Exception as e:
+                    logger.error(f"Event handler failed for {message['event']}: {e}")
+            return
+
+        future = self._pending.get(str(message.get("message_id")))
+        if future is None or future.done():
+            return
+        if "error_code" in message:
+            future.set_exception(MatterServerError(message["error_code"], message.get("details", "")))
+        else:
+            future.set_result(message.get("result"))
+
+    def _disconnected(self):
+        self.connected.clear()
+        self._ws = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("matter-server connection lost"))
+
+    async def _run_connect_handler(self, handler):
+        try:
+            await handler()
+        except Exception as e:
+            logger.error(f"matter-server connect handler failed: {e}")
@@ -0,0 +1,105 @@
+"""
+Attribute-level node state cache fed by python-matter-server events
+
+After start_listening the server sends a full node dump, followed by
+node_added/node_updated/node_removed and attribute_updated events for every
+change, including ones made outside this app (physical buttons, Google Home).
+Reads are plain dict lookups and never go to the device.
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# "endpoint/cluster/attribute" paths of the attributes the bridge exposes
+ONOFF_PATH = "1/6/0"                 # OnOff.OnOff
+ACTIVE_POWER_PATH = "1/2820/1291"    # ElectricalMeasurement.ActivePower (W)
+CUMULATIVE_ENERGY_PATH = "1/145/1"   # ElectricalEnergyMeasurement.CumulativeEnergyImported (mWh)
+
+class NodeStateCache:
+    """Latest attribute values and last-seen times per Matter node"""
+
+    def __init__(self):
+        self.nodes: Dict[int, Dict] = {}
+        self.events_received = 0
+
+    def load_nodes(self, nodes: List[Dict]):
+        """Replace the cache with a start_listening node dump"""
+        now = time.time()
+        self.nodes = {}
+        for node in nodes or []:
+            self._store_node(node, now)
+        logger.info(f"Node state cache loaded with {len(self.nodes)} nodes")
+
+    def handle_event(self, event: str, data: Any):
+        """Apply a matter-server event"""
+        self.events_received += 1
+        now = time.time()
+        if event == "attribute_updated":
+            node_id, path, value = data
+            entry = self.nodes.get(node_id)
+            if entry is None:
+                entry = self._store_node({"node_id": node_id, "attributes": {}}, now)
+            entry["attributes"][path] = value
+            entry["attribute_updated_at"][path] = now
+            entry["available"] = True
+            entry["last_seen"] = now
+        elif event in ("node_added", "node_updated"):
+            self._store_node(data, now)
+        elif event == "node_removed":
+            self.nodes.pop(data, None)
+
+    def get_node(self, node_id: int) -> Optional[Dict]:
+        return self.nodes.get(node_id)
+
+    def get_attribute(self, node_id: int, path: str, default: Any = None) -> Any:
+        entry = self.nodes.get(node_id)
+        if entry is None:
+            return default
+        return entry["attributes"].get(path, default)
+
+    def device_state(self, node_id: int) -> Optional[Dict]:
+        """The bridge's device state view of a node, or None if it is not known"""
+        entry = self.nodes.get(node_id)
+        if entry is None:
+            return None
+        attributes = entry["attributes"]
+        energy = attributes.get(CUMULATIVE_ENERGY_PATH)
+        return {
+            "power": bool(attributes.get(ONOFF_PATH, False)),
+            "power_consumption": float(attributes.get(ACTIVE_POWER_PATH) or 0.0),
+            # Structs arrive raw, keyed by field id; EnergyMeasurementStruct.Energy is field 0
+            "energy": float(energy.get("0", 0.0)) if isinstance(energy, dict) else 0.0,
+            "available": entry["available"]
+        }
+
+    def last_seen(self, node_id: int) -> Optional[str]:
+        entry = self.nodes.get(node_id)
+        if entry is None or entry["last_seen"] is None:
+            return None
+        return datetime.fromtimestamp(entry["last_seen"]).isoformat()
+
+    def get_status(self) -> Dict:
+        return {
+            "nodes": len(self.nodes),
+            "events_received": self.events_received
+        }
+
+    def _store_node(self, node: Dict, now: float) -> Dict:
+        node_id = node["node_id"]
+        attributes = dict(node.get("attributes") or {})
+        available = node.get("available", True)
+        previous = self.nodes.get(node_id)
+        entry = {
+            "node_id": node_id,
+            "available": available,
+            "attributes": attributes,
+            "attribute_updated_at": {path: now for path in attributes},
+            # An unreachable node has not been seen now; keep when it last was
+            "last_seen": now if available else (previous["last_seen"] if previous else None)
+        }
+        self.nodes[node_id] = entry
+        return entry
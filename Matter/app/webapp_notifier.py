@@ -0,0 +1,242 @@
+"""
+Outbound device update notifications to the C# web app
+
+Updates are queued per device and coalesced: several changes to the same
+device inside the batching window become one update carrying the latest
+data. Batches are POSTed over one pooled HTTP session. Updates that fail
+with a connection error or a 5xx are put back in the queue and retried with
+capped exponential backoff, up to max_attempts times each; an update the web
+app rejects with a 4xx is dropped at once, so it cannot hold up the rest.
+Once the queue is full, notify() waits, pushing back on producers instead of
+growing without bound. Synchronous callbacks use notify_nowait(), which
+never waits and ignores max_pending.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WEBAPP_POST_SECONDS = REGISTRY.histogram(
+    "webapp_post_seconds",
+    "POSTs of device updates to the web app, by endpoint (batch or single)",
+    ["endpoint"]
+)
+
+class WebAppNotifier:
+    """Coalescing, batching notification pipeline to the web app"""
+
+    def __init__(self, base_url: str, window: float = 0.2, batch_size: int = 50,
+                 max_pending: int = 1000, initial_backoff: float = 1, max_backoff: float = 30,
+                 max_attempts: int = 5):
+        self.base_url = base_url
+        self.window = window
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        # device_id -> latest merged device data, in first-queued order
+        self.pending: "OrderedDict[str, Dict]" = OrderedDict()
+        # None until the web app has shown whether it has the batch endpoint
+        self.batch_supported: Optional[bool] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.failures = 0
+        # Updates given up on: rejected by the web app or out of attempts
+        self.dropped = 0
+        # device_id -> failed sends of its queued update
+        self._attempts: Dict[str, int] = {}
+        # Updates taken off the queue whose POST has not finished yet
+        self.in_flight = 0
+        self._changed = asyncio.Condition()
+        # Set when an update is queued; wakes the sender
+        self._queued = asyncio.Event()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the sender"""
+        if self._task is None or self._task.done():
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, flush_timeout: float = 5):
+        """Try to deliver what is queued, then stop"""
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._wait_until_empty(), timeout=flush_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping web app notifier with {len(self.pending)} undelivered updates")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def notify(self, device_id: str, device_data: Dict):
+        """Queue an update, merging it into any update already queued for the device"""
+        async with self._changed:
+            if device_id not in self.pending:
+                await self._changed.wait_for(
+                    lambda: device_id in self.pending or len(self.pending) + self.in_flight < self.max_pending
+                )
+            if device_id in self.pending:
+                self.pending[device_id].update(device_data)
+                self.coalesced += 1
+            else:
+                self.pending[device_id] = dict(device_data)
+            self._queued.set()
+            self._changed.notify_all()
+
+    def notify_nowait(self, device_id: str, device_data: Dict):
+        """Queue an update without waiting for room, for callers that cannot await
+
+        max_pending and in_flight are not checked, so these updates get no
+        backpressure; the queue is bounded only by the number of devices, as
+        it holds one entry per device.
+        """
+        if device_id in self.pending:
+            self.pending[device_id].update(device_data)
+            self.coalesced += 1
+        else:
+            self.pending[device_id] = dict(device_data)
+        self._queued.set()
+
+    def get_status(self) -> Dict:
+        return {
+            "pending": len(self.pending),
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "batch_supported": self.batch_supported
+        }
+
+    async def _run(self):
+        backoff = self.initial_backoff
+        while True:
+            while not self.pending:
+                self._queued.clear()
+                await self._queued.wait()
+            # Let a burst of updates collect (and coalesce) before sending
+            await asyncio.sleep(self.window)
+
+            async with self._changed:
+                batch = []
+                while self.pending and len(batch) < self.batch_size:
+                    batch.append(self.pending.popitem(last=False))
+                self.in_flight = len(batch)
+
+            delivered: List[str] = []
+            rejected: List[str] = []
+            try:
+                await self._send(batch, delivered, rejected)
+            except asyncio.CancelledError:
+                await self._requeue([update for update in batch if update[0] not in delivered + rejected])
+                raise
+            except Exception as e:
+                self.failures += 1
+                self._delivered(delivered)
+                retry = []
+                for device_id, data in batch:
+                    if device_id in delivered or device_id in rejected:
+                        continue
+                    attempts = self._attempts.get(device_id, 0) + 1
+                    if not _retryable(e):
+                        self._drop(device_id, f"rejected by the web app ({e})")
+                    elif attempts >= self.max_attempts:
+                        self._drop(device_id, f"failed {attempts} times, last with {e}")
+                    else:
+                        self._attempts[device_id] = attempts
+                        retry.append((device_id, data))
+                await self._requeue(retry)
+                if retry:
+                    logger.warning(f"Web app notification of {len(retry)} devices failed ({e}), "
+                                   f"retrying in {backoff:.1f}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+            else:
+                self._delivered(delivered)
+                backoff = self.initial_backoff
+                await self._requeue([])
+
+    async def _send(self, batch: List, delivered: List[str], rejected: List[str]):
+        """POST a batch, adding each device_id to delivered once the web app has it
+
+        Updates the web app refuses one by one (a 4xx) are dropped and added
+        to rejected; the others are still sent.
+        """
+        updates = [{"device_id": device_id, "device_data": data} for device_id, data in batch]
+        if self.batch_supported is not False:
+            with WEBAPP_POST_SECONDS.time(endpoint="batch"):
+                async with self._session.post(f"{self.base_url}/api/devices/update/batch",
+                                              json={"updates": updates}) as response:
+                    if response.status in (404, 405):
+                        logger.info("Web app has no batch update endpoint, sending updates individually")
+                        self.batch_supported = False
+                    else:
+                        response.raise_for_status()
+                        self.batch_supported = True
+                        delivered.extend(update["device_id"] for update in updates)
+                        logger.info(f"Web app notified of {len(updates)} device updates")
+                        return
+
+        for update in updates:
+            with WEBAPP_POST_SECONDS.time(endpoint="single"):
+                async with self._session.post(f"{self.base_url}/api/devices/update", json=update) as response:
+                    if 400 <= response.status < 500:
+                        # Sending it again would get the same answer; go on with the rest
+                        self._drop(update["device_id"], f"rejected by the web app ({response.status})")
+                        rejected.append(update["device_id"])
+                        continue
+                    response.raise_for_status()
+            delivered.append(update["device_id"])
+        logger.info(f"Web app notified of {len(delivered)} device updates")
+
+    def _delivered(self, device_ids: List[str]):
+        self.sent += len(device_ids)
+        for device_id in device_ids:
+            self._attempts.pop(device_id, None)
+
+    def _drop(self, device_id: str, reason: str):
+        self._attempts.pop(device_id, None)
+        self.dropped += 1
+        logger.error(f"Dropping web app update for device {device_id}: {reason}")
+
+    async def _requeue(self, batch: List):
+        """Put a failed batch back in front, under any newer data queued meanwhile"""
+        async with self._changed:
+            for device_id, data in reversed(batch):
+                newer = self.pending.pop(device_id, None)
+                if newer is not None:
+                    data.update(newer)
+                self.pending[device_id] = data
+                self.pending.move_to_end(device_id, last=False)
+            self.in_flight = 0
+            self._changed.notify_all()
+
+    async def _wait_until_empty(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self.pending and not self.in_flight)
+
+def _retryable(error: Exception) -> bool:
+    """Whether a failed POST may succeed if sent again: connection errors, timeouts and 5xx"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, OSError))
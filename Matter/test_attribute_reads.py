@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script for batched read-by-id attribute reads and their output parsing
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.attribute_reads import AttributePath, build_read_command, parse_read_output, read_attributes
+from app.chip_tool_runner import ChipToolRunner
+
+PATHS = {
+    "vendor_name": AttributePath(0, 0x0028, 0x0001),
+    "vendor_id": AttributePath(0, 0x0028, 0x0002),
+    "on": AttributePath(1, 0x0006, 0x0000),
+    "energy": AttributePath(1, 0x0091, 0x0001),
+    "software_version": AttributePath(0, 0x0028, 0x000A),
+}
+
+# Trimmed chip-tool output for a read-by-id of the paths above
+READ_OUTPUT = """\
+[1718000000.123456] [1234:1236] [DMG] ReportDataMessage =
+[1718000000.123500] [1234:1236] [TOO] Endpoint: 0 Cluster: 0x0000_0028 Attribute 0x0000_0001 DataVersion: 1828
+[1718000000.123510] [1234:1236] [TOO]   VendorName: "NOUS"
+[1718000000.123600] [1234:1236] [TOO] Endpoint: 0 Cluster: 0x0000_0028 Attribute 0x0000_0002 DataVersion: 1828
+[1718000000.123610] [1234:1236] [TOO]   VendorID: 4701
+[1718000000.123700] [1234:1236] [TOO] Endpoint: 1 Cluster: 0x0000_0006 Attribute 0x0000_0000 DataVersion: 77
+[1718000000.123710] [1234:1236] [TOO]   OnOff: TRUE
+[1718000000.123800] [1234:1236] [TOO] Endpoint: 1 Cluster: 0x0000_0091 Attribute 0x0000_0001 DataVersion: 3
+[1718000000.123810] [1234:1236] [TOO]   CumulativeEnergyImported: {
+[1718000000.123820] [1234:1236] [TOO]     Energy: 123456
+[1718000000.123830] [1234:1236] [TOO]     StartTimestamp: 1717990000
+[1718000000.123840] [1234:1236] [TOO]    }
+[1718000000.124000] [1234:1236] [EM] <<< [E:1234i S:1 M:5] (S) Msg TX to 1:0000000000000001
+"""
+
+def fake_chip_tool(tmp_path, output, code=0):
+    (tmp_path / "output.txt").write_text(output)
+    script = tmp_path / "chip-tool"
+    script.write_text(f'#!/bin/sh\necho "$@" > {tmp_path}/args\ncat {tmp_path}/output.txt\nexit {code}\n')
+    script.chmod(0o755)
+    return str(script)
+
+def test_one_command_reads_every_path():
+    # A path asked for under two names is read once
+    paths = {**PATHS, "vendor": PATHS["vendor_name"]}
+    assert build_read_command("4660", paths) == [
+        "any", "read-by-id",
+        "0x0028,0x0028,0x0006,0x0091,0x0028",
+        "0x0001,0x0002,0x0000,0x0001,0x000A",
+        "4660",
+        "0,0,1,1,0"
+    ]
+
+def test_reports_are_mapped_back_to_fields():
+    fields = parse_read_output(READ_OUTPUT, {**PATHS, "vendor": PATHS["vendor_name"]})
+    assert fields == {
+        "vendor_name": "NOUS",
+        "vendor": "NOUS",
+        "vendor_id": 4701,
+        "on": True,
+        "energy": {"Energy": 123456, "StartTimestamp": 1717990000},
+        # Unsupported attribute: no report
+        "software_version": None
+    }
+
+def test_read_attributes_runs_chip_tool_once(tmp_path):
+    runner = ChipToolRunner(fake_chip_tool(tmp_path, READ_OUTPUT), dict(os.environ))
+    result = asyncio.run(read_attributes(runner, "4660", PATHS))
+    assert result["return_code"] == 0
+    assert result["fields"]["vendor_id"] == 4701
+    assert (tmp_path / "args").read_text().split()[:2] == ["any", "read-by-id"]
+
+def test_failed_read_leaves_every_field_empty(tmp_path):
+    runner = ChipToolRunner(fake_chip_tool(tmp_path, READ_OUTPUT, code=1), dict(os.environ))
+    result = asyncio.run(read_attributes(runner, "4660", PATHS))
+    assert result["return_code"] == 1
+    assert result["fields"] == {field: None for field in PATHS}
+
+def test_tasmota_metrics_route(tmp_path, monkeypatch):
+    output = """\
+[TOO] Endpoint: 1 Cluster: 0x0000_0B04 Attribute 0x0000_050B DataVersion: 9
+[TOO]   ActivePower: 42
+[TOO] Endpoint: 1 Cluster: 0x0000_0B04 Attribute 0x0000_0505 DataVersion: 9
+[TOO]   RmsVoltage: 230
+[TOO] Endpoint: 1 Cluster: 0x0000_0091 Attribute 0x0000_0001 DataVersion: 3
+[TOO]   CumulativeEnergyImported: {
+[TOO]     Energy: 5000
+[TOO]    }
+"""
+    monkeypatch.setattr(main.chip_tool, "chip_tool_path", fake_chip_tool(tmp_path, output))
+    response = TestClient(main.app).get("/device/7/tasmota/metrics")
+    assert response.status_code == 200
+    # RmsCurrent was not reported
+    assert response.json()["metrics"] == {"power": 42.0, "voltage": 230.0, "current": 0.0, "energy": 5000.0}
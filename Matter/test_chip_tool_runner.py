@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test script for the async chip-tool runner and the bridge routes using it,
+with a shell script standing in for chip-tool
+"""
+
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+from app import chip_tool_runner, main
+from app.chip_tool_runner import CHIP_TOOL_COMMAND_FAILURES, ChipToolRunner, ClientDisconnected
+
+# A child process of chip-tool that must die with it
+HANGS_WITH_CHILD = "sleep 30 >/dev/null 2>&1 &\necho $! > \"$(dirname \"$0\")/child.pid\"\nsleep 30"
+
+def fake_chip_tool(tmp_path, body):
+    """A chip-tool that writes its pid, then runs body"""
+    script = tmp_path / "chip-tool"
+    script.write_text(f"#!/bin/sh\necho $$ > {tmp_path}/chip-tool.pid\n{body}\n")
+    script.chmod(0o755)
+    return str(script)
+
+def is_running(pid_file):
+    pid = int(pid_file.read_text())
+    try:
+        # Reaped or zombie both count as gone
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except FileNotFoundError:
+        return False
+
+def wait_until_gone(pid_file, timeout=2):
+    deadline = time.monotonic() + timeout
+    while is_running(pid_file) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return not is_running(pid_file)
+
+class DisconnectingRequest:
+    """Stands in for a FastAPI Request whose client leaves after a delay"""
+
+    def __init__(self, after):
+        self.disconnect_at = time.monotonic() + after
+
+    async def is_disconnected(self):
+        return time.monotonic() >= self.disconnect_at
+
+def test_output_and_return_code(tmp_path):
+    runner = ChipToolRunner(fake_chip_tool(tmp_path, 'echo "on-off: TRUE $@"; echo oops >&2; exit 3'), dict(os.environ))
+    before = CHIP_TOOL_COMMAND_FAILURES.value(cluster="onoff", command="read")
+    result = asyncio.run(runner.run(["onoff", "read", "on-off", "1", "1"]))
+    assert result["return_code"] == 3
+    assert "on-off: TRUE onoff read on-off 1 1" in result["stdout"]
+    assert result["stderr"].strip() == "oops"
+    assert CHIP_TOOL_COMMAND_FAILURES.value(cluster="onoff", command="read") == before + 1
+
+def test_timeout_kills_the_process_group(tmp_path):
+    runner = ChipToolRunner(fake_chip_tool(tmp_path, HANGS_WITH_CHILD), dict(os.environ))
+    before = CHIP_TOOL_COMMAND_FAILURES.value(cluster="onoff", command="toggle")
+    started = time.monotonic()
+    try:
+        asyncio.run(runner.run(["onoff", "toggle", "1", "1"], timeout=0.3))
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("run() did not time out")
+
+    assert time.monotonic() - started < 5
+    assert wait_until_gone(tmp_path / "chip-tool.pid")
+    assert wait_until_gone(tmp_path / "child.pid")
+    assert CHIP_TOOL_COMMAND_FAILURES.value(cluster="onoff", command="toggle") == before + 1
+    assert runner.get_status() == {"max_concurrency": 4, "running": 0, "waiting": 0}
+
+def test_client_disconnect_cancels_and_kills(tmp_path):
+    runner = ChipToolRunner(fake_chip_tool(tmp_path, HANGS_WITH_CHILD), dict(os.environ))
+    before = CHIP_TOOL_COMMAND_FAILURES.value(cluster="levelcontrol", command="read")
+    try:
+        asyncio.run(runner.run(["levelcontrol", "read", "current-level", "1", "1"],
+                               timeout=30, request=DisconnectingRequest(after=0.2)))
+    except ClientDisconnected:
+        pass
+    else:
+        raise AssertionError("run() did not notice the disconnect")
+
+    assert wait_until_gone(tmp_path / "chip-tool.pid")
+    assert wait_until_gone(tmp_path / "child.pid")
+    # The client leaving is not chip-tool failing
+    assert CHIP_TOOL_COMMAND_FAILURES.value(cluster="levelcontrol", command="read") == before
+    assert runner.get_status()["running"] == 0
+
+def test_concurrency_limit(tmp_path):
+    runner = ChipToolRunner(fake_chip_tool(tmp_path, "sleep 0.2"), dict(os.environ), max_concurrency=2)
+
+    async def run():
+        calls = asyncio.gather(*[runner.run(["onoff", "read", "on-off", "1", "1"]) for _ in range(4)])
+        await asyncio.sleep(0.1)
+        status = runner.get_status()
+        await calls
+        return status
+
+    status = asyncio.run(run())
+    assert status["running"] == 2
+    assert status["waiting"] == 2
+
+def test_routes_answer_504_on_timeout_and_400_on_failure(tmp_path, monkeypatch):
+    client = TestClient(main.app)
+
+    monkeypatch.setattr(main.chip_tool, "chip_tool_path", fake_chip_tool(tmp_path, "sleep 30"))
+    monkeypatch.setattr(chip_tool_runner, "DEFAULT_TIMEOUT", 0.3)
+    response = client.get("/device/1/state")
+    assert response.status_code == 504
+    assert response.json()["detail"] == "Timed out reading the device state"
+
+    monkeypatch.setattr(main.chip_tool, "chip_tool_path", fake_chip_tool(tmp_path, "echo unreachable >&2; exit 1"))
+    response = client.get("/device/1/state")
+    assert response.status_code == 400
+    assert "unreachable" in response.json()["detail"]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for the Matter bridge's per-node command queue
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.command_queue import NodeCommandQueue
+
+class Recorder:
+    """send() factory that logs start and end of every command"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.log = []
+
+    def command(self, node_id, name, fail=False):
+        async def send():
+            self.log.append(("start", node_id, name))
+            await asyncio.sleep(self.delay)
+            self.log.append(("end", node_id, name))
+            if fail:
+                raise RuntimeError(f"{name} failed")
+            return name
+        return send
+
+def test_one_node_is_serialised_and_nodes_run_in_parallel():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        recorder = Recorder()
+        results = await asyncio.gather(
+            queue.submit(7, recorder.command(7, "read-power")),
+            queue.submit(7, recorder.command(7, "read-energy")),
+            queue.submit(8, recorder.command(8, "read-power"))
+        )
+        return results, recorder.log, queue.get_status()
+
+    results, log, status = asyncio.run(run())
+    assert results == ["read-power", "read-energy", "read-power"]
+    node_7 = [entry for entry in log if entry[1] == 7]
+    assert node_7 == [("start", 7, "read-power"), ("end", 7, "read-power"),
+                      ("start", 7, "read-energy"), ("end", 7, "read-energy")]
+    # Node 8 started before node 7's first command finished
+    assert log.index(("start", 8, "read-power")) < log.index(("end", 7, "read-power"))
+    assert status == {"active_nodes": 0, "queued": 0, "submitted": 3, "sent": 3, "coalesced": 0}
+
+def test_rapid_toggles_collapse_into_the_newest():
+    async def run():
+        queue = NodeCommandQueue(window=0.05)
+        recorder = Recorder(delay=0)
+        calls = [
+            asyncio.ensure_future(queue.submit(7, recorder.command(7, f"on={value}"), key="onoff", value=value))
+            for value in (True, False, True)
+        ]
+        await asyncio.sleep(0)
+        pending = queue.pending_value(7, "onoff")
+        results = await asyncio.gather(*calls)
+        return results, pending, recorder.log, queue.get_status()
+
+    results, pending, log, status = asyncio.run(run())
+    assert pending is True
+    assert log == [("start", 7, "on=True"), ("end", 7, "on=True")]
+    # Every caller gets the result of the command actually sent
+    assert results == ["on=True"] * 3
+    assert status["sent"] == 1
+    assert status["coalesced"] == 2
+
+def test_a_command_in_flight_is_not_replaced():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        recorder = Recorder()
+        first = asyncio.ensure_future(queue.submit(7, recorder.command(7, "on"), key="onoff", value=True))
+        await asyncio.sleep(0.02)
+        second = await queue.submit(7, recorder.command(7, "off"), key="onoff", value=False)
+        return await first, second, recorder.log
+
+    first, second, log = asyncio.run(run())
+    assert (first, second) == ("on", "off")
+    assert [entry[2] for entry in log if entry[0] == "start"] == ["on", "off"]
+
+def test_failures_reach_every_caller_and_the_node_keeps_going():
+    async def run():
+        queue = NodeCommandQueue(window=0.02)
+        recorder = Recorder(delay=0)
+        failed = asyncio.gather(
+            queue.submit(7, recorder.command(7, "toggle", fail=True), key="onoff"),
+            queue.submit(7, recorder.command(7, "toggle", fail=True), key="onoff"),
+            return_exceptions=True
+        )
+        after = queue.submit(7, recorder.command(7, "read"))
+        return await failed, await after
+
+    failures, after = asyncio.run(run())
+    assert all(isinstance(failure, RuntimeError) for failure in failures)
+    assert after == "read"
+
+def test_a_caller_giving_up_does_not_cancel_shared_commands():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        recorder = Recorder(delay=0.1)
+        impatient = asyncio.ensure_future(queue.submit(7, recorder.command(7, "on"), key="onoff"))
+        patient = asyncio.ensure_future(queue.submit(7, recorder.command(7, "on"), key="onoff"))
+        await asyncio.sleep(0.02)
+        impatient.cancel()
+        result = await patient
+        await queue.close()
+        return result, recorder.log
+
+    result, log = asyncio.run(run())
+    assert result == "on"
+    assert log == [("start", 7, "on"), ("end", 7, "on")]
+
+def test_idle_nodes_leave_no_worker_behind():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        recorder = Recorder(delay=0)
+        await asyncio.gather(*[queue.submit(node_id, recorder.command(node_id, "read")) for node_id in range(50)])
+        idle = dict(queue._workers)
+        # A node that went idle gets a fresh worker on its next command
+        again = await queue.submit(7, recorder.command(7, "again"))
+        return idle, again, queue._workers
+
+    idle, again, workers = asyncio.run(run())
+    assert idle == {}
+    assert again == "again"
+    assert workers == {}
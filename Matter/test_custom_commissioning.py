@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for RealMatterCommissioner's node index and persisted state
+"""
+
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import custom_commissioning
+from app.custom_commissioning import STATE_PATH_ENV, RealMatterCommissioner
+
+class FakeMatterServer:
+    """Records device commands sent through the commissioner"""
+
+    def __init__(self):
+        self.commands = []
+
+    async def send_device_command(self, **kwargs):
+        self.commands.append(kwargs)
+        return {"success": True}
+
+def test_node_index_follows_registrations(tmp_path):
+    commissioner = RealMatterCommissioner(state_path=str(tmp_path / "commissioned.json"))
+    commissioner._register_device("plug-1", {"node_id": 1000, "vendor_id": 0x125D})
+    commissioner._register_device("plug-2", {"node_id": 1001})
+    assert commissioner.device_for_node(1000) == "plug-1"
+    assert commissioner.node_for_device("plug-2") == 1001
+
+    # The same device re-commissioned as a new node drops its old node
+    commissioner._register_device("plug-1", {"node_id": 1002})
+    assert commissioner.device_for_node(1000) is None
+    assert commissioner.device_for_node(1002) == "plug-1"
+
+    # A node re-commissioned under a new device id drops the old device
+    commissioner._register_device("office-plug", {"node_id": 1001})
+    assert "plug-2" not in commissioner.commissioned_devices
+    assert commissioner.device_for_node(1001) == "office-plug"
+
+    assert commissioner.remove_device("office-plug")
+    assert not commissioner.remove_device("office-plug")
+    assert commissioner.node_index == {1002: "plug-1"}
+
+def test_state_is_reloaded_with_its_index(tmp_path):
+    path = tmp_path / "commissioned.json"
+    commissioner = RealMatterCommissioner(state_path=str(path))
+    commissioner._register_device("plug-1", {"node_id": 1000})
+    commissioner._register_device("plug-2", {"node_id": 1040})
+    commissioner.remove_device("plug-1")
+    assert not (tmp_path / "commissioned.json.tmp").exists()
+
+    reloaded = RealMatterCommissioner(state_path=str(path))
+    assert reloaded.commissioned_devices == {"plug-2": {"node_id": 1040}}
+    assert reloaded.node_index == {1040: "plug-2"}
+    # New node ids never reuse one that is taken
+    assert reloaded.node_counter == 1041
+
+def test_commands_are_routed_through_the_index(tmp_path):
+    server = FakeMatterServer()
+    commissioner = RealMatterCommissioner(server, state_path=str(tmp_path / "commissioned.json"))
+    commissioner._register_device("plug-1", {"node_id": 1000})
+
+    async def run():
+        await commissioner.initialize()
+        known = await commissioner.send_device_command(1000, 6, "toggle")
+        unknown = await commissioner.send_device_command(1999, 6, "toggle")
+        return known, unknown
+
+    known, unknown = asyncio.run(run())
+    assert known["device_id"] == "plug-1"
+    assert server.commands == [{"node_id": 1000, "cluster_id": 6, "command": "toggle"}]
+    assert not unknown["success"]
+
+def test_state_path_from_argument_environment_or_data_directory(tmp_path, monkeypatch):
+    path = tmp_path / "commissioned.json"
+    path.write_text(json.dumps({"node_counter": 1005, "devices": {"plug-1": {"node_id": 1000}}}))
+    monkeypatch.setenv(STATE_PATH_ENV, str(path))
+    assert RealMatterCommissioner().device_for_node(1000) == "plug-1"
+
+    # An explicit path wins over the environment
+    assert RealMatterCommissioner(state_path=str(tmp_path / "other.json")).commissioned_devices == {}
+
+    # Without either, devices go to the bridge's data directory
+    default = tmp_path / "matter_data" / "commissioned_devices.json"
+    monkeypatch.setattr(custom_commissioning, "DEFAULT_STATE_PATH", str(default))
+    monkeypatch.delenv(STATE_PATH_ENV)
+    RealMatterCommissioner()._register_device("plug-2", {"node_id": 1001})
+    assert RealMatterCommissioner().device_for_node(1001) == "plug-2"
+    assert default.exists()
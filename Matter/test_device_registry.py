@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test script for the SQLite-backed Matter bridge device registry
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.device_registry import DeviceRegistry
+
+def ids(pairs):
+    return sorted(device_id for device_id, _ in pairs)
+
+def test_changes_survive_a_restart(tmp_path):
+    path = str(tmp_path / "devices.db")
+    registry = DeviceRegistry(path)
+    registry["plug-1"] = {"name": "Desk", "node_id": 7, "room_id": 1}
+    registry["plug-2"] = {"name": "Lamp", "node_id": 8, "room_id": 1}
+    registry["plug-3"] = {"name": "Fan", "node_id": 9}
+    registry["plug-2"] = {"name": "Lamp", "node_id": 8, "room_id": 2}
+    del registry["plug-3"]
+    registry.close()
+
+    registry = DeviceRegistry(path)
+    assert dict(registry) == {
+        "plug-1": {"name": "Desk", "node_id": 7, "room_id": 1},
+        "plug-2": {"name": "Lamp", "node_id": 8, "room_id": 2}
+    }
+    # The indexes are rebuilt from the rows
+    assert ids(registry.by_node(7)) == ["plug-1"]
+    assert ids(registry.by_node(9)) == []
+    assert ids(registry.by_room(1)) == ["plug-1"]
+    assert ids(registry.by_room(2)) == ["plug-2"]
+    assert registry.get_status()["nodes"] == 2
+
+def test_reassignment_moves_index_entries(tmp_path):
+    registry = DeviceRegistry(str(tmp_path / "devices.db"))
+    registry["plug-1"] = {"node_id": 7, "room_id": 1}
+    registry["plug-2"] = {"node_id": 7, "room_id": 1}
+    registry["plug-1"] = {"node_id": 12, "room_id": None}
+
+    assert ids(registry.by_node(7)) == ["plug-2"]
+    assert ids(registry.by_node(12)) == ["plug-1"]
+    assert ids(registry.by_room(1)) == ["plug-2"]
+    try:
+        del registry["plug-9"]
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("deleting an unknown device did not raise")
+
+def test_replace_all_is_persisted_and_reindexed(tmp_path):
+    path = str(tmp_path / "devices.db")
+    registry = DeviceRegistry(path)
+    registry["old"] = {"node_id": 1, "room_id": 1}
+    registry.replace_all({"new": {"node_id": 2, "room_id": 3}})
+    assert ids(registry.by_node(1)) == []
+    assert ids(registry.by_room(3)) == ["new"]
+    registry.close()
+
+    registry = DeviceRegistry(path)
+    assert list(registry) == ["new"]
+    registry.clear()
+    registry.close()
+    assert len(DeviceRegistry(path)) == 0
+
+def test_tables_are_independent(tmp_path):
+    path = str(tmp_path / "devices.db")
+    devices = DeviceRegistry(path)
+    rooms = DeviceRegistry(path, table="rooms")
+    devices["plug-1"] = {"node_id": 7}
+    rooms["1"] = {"name": "Office"}
+    assert list(DeviceRegistry(path)) == ["plug-1"]
+    assert list(DeviceRegistry(path, table="rooms")) == ["1"]
+    try:
+        DeviceRegistry(path, table="rooms; DROP TABLE devices")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("an invalid table name was accepted")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test script for the multiplexed python-matter-server client, against a
+local aiohttp WebSocket server speaking the same framing
+"""
+
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from app.matter_ws_client import MatterServerClient, MatterServerError
+
+class FakeMatterServer:
+    """Answers each command after args["delay"] seconds; drop_connections() closes every socket"""
+
+    def __init__(self):
+        self.connections = 0
+        self.commands = []
+        self.sockets = set()
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self.sockets.add(ws)
+        await ws.send_str(json.dumps({"schema_version": 11, "connection": self.connections}))
+        async for frame in ws:
+            message = json.loads(frame.data)
+            self.commands.append(message)
+            asyncio.ensure_future(self.answer(ws, message))
+        self.sockets.discard(ws)
+        return ws
+
+    async def answer(self, ws, message):
+        args = message["args"]
+        await asyncio.sleep(args.get("delay", 0))
+        if args.get("hang"):
+            return
+        if args.get("fail"):
+            response = {"message_id": message["message_id"], "error_code": 5, "details": "Node not found"}
+        else:
+            response = {"message_id": message["message_id"], "result": args.get("value")}
+        if not ws.closed:
+            await ws.send_str(json.dumps(response))
+
+    async def event(self, name, data):
+        for ws in list(self.sockets):
+            await ws.send_str(json.dumps({"event": name, "data": data}))
+
+    async def drop_connections(self):
+        for ws in list(self.sockets):
+            await ws.close()
+
+async def serve(server):
+    app = web.Application()
+    app.router.add_get("/ws", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/ws"
+
+def test_commands_in_flight_complete_out_of_order():
+    async def run():
+        server = FakeMatterServer()
+        runner, url = await serve(server)
+        client = MatterServerClient(url, request_timeout=5)
+        await client.start()
+        finished = []
+
+        async def command(value, delay):
+            result = await client.send_command("get_node", value=value, delay=delay)
+            finished.append(result)
+            return result
+
+        results = await asyncio.gather(command("slow", 0.2), command("medium", 0.1), command("fast", 0))
+        status = client.get_status()
+        await client.stop()
+        await runner.cleanup()
+        return server, results, finished, status
+
+    server, results, finished, status = asyncio.run(run())
+    # Each caller gets its own answer although they arrived in reverse order
+    assert results == ["slow", "medium", "fast"]
+    assert finished == ["fast", "medium", "slow"]
+    assert len({message["message_id"] for message in server.commands}) == 3
+    assert server.connections == 1
+    assert status["in_flight"] == 0
+    assert status["server_info"]["schema_version"] == 11
+
+def test_errors_timeouts_and_events():
+    async def run():
+        server = FakeMatterServer()
+        runner, url = await serve(server)
+        client = MatterServerClient(url, request_timeout=5)
+        events = []
+        client.add_event_handler(lambda event, data: events.append((event, data)))
+        await client.start()
+        try:
+            await client.send_command("get_node", fail=True)
+            error = None
+        except MatterServerError as e:
+            error = e
+        try:
+            await client.send_command("get_node", hang=True, timeout=0.2)
+            timed_out = False
+        except asyncio.TimeoutError:
+            timed_out = True
+        await server.event("attribute_updated", [7, "1/6/0", True])
+        await asyncio.sleep(0.1)
+        in_flight = client.get_status()["in_flight"]
+        await client.stop()
+        await runner.cleanup()
+        return error, timed_out, events, in_flight
+
+    error, timed_out, events, in_flight = asyncio.run(run())
+    assert error.error_code == 5 and error.details == "Node not found"
+    assert timed_out
+    assert in_flight == 0
+    assert events == [("attribute_updated", [7, "1/6/0", True])]
+
+def test_reconnects_and_fails_commands_caught_by_the_drop():
+    async def run():
+        server = FakeMatterServer()
+        runner, url = await serve(server)
+        client = MatterServerClient(url, request_timeout=5, initial_backoff=0.05)
+        connects = []
+
+        async def on_connect():
+            connects.append(client.server_info["connection"])
+
+        client.add_connect_handler(on_connect)
+        await client.start()
+
+        lost = asyncio.ensure_future(client.send_command("get_node", hang=True))
+        await asyncio.sleep(0.1)
+        await server.drop_connections()
+        try:
+            await lost
+            lost_error = None
+        except ConnectionError as e:
+            lost_error = e
+
+        # Commands sent while reconnecting wait for the new connection
+        result = await client.send_command("get_node", value="after reconnect")
+        await asyncio.sleep(0.05)
+        status = client.get_status()
+        await client.stop()
+        await runner.cleanup()
+        return lost_error, result, connects, status
+
+    lost_error, result, connects, status = asyncio.run(run())
+    assert isinstance(lost_error, ConnectionError)
+    assert result == "after reconnect"
+    assert connects == [1, 2]
+    assert status["reconnects"] == 1
+    assert status["connected"]
+
+def test_stop_cancels_connect_handlers_still_running():
+    async def run():
+        server = FakeMatterServer()
+        runner, url = await serve(server)
+        client = MatterServerClient(url, request_timeout=5)
+        cancelled = asyncio.Event()
+
+        async def on_connect():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        client.add_connect_handler(on_connect)
+        await client.start()
+        await client.connected.wait()
+        await asyncio.sleep(0.05)
+        running = len(client._handler_tasks)
+        await client.stop()
+        await runner.cleanup()
+        return running, cancelled.is_set(), client._handler_tasks
+
+    running, cancelled, left = asyncio.run(run())
+    assert running == 1
+    assert cancelled
+    assert not left
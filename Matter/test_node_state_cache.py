@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for the event-fed Matter node state cache
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.node_state_cache import ACTIVE_POWER_PATH, CUMULATIVE_ENERGY_PATH, ONOFF_PATH, NodeStateCache
+
+def node(node_id, available=True, **attributes):
+    return {"node_id": node_id, "available": available, "attributes": attributes}
+
+def test_node_dump_then_attribute_updates():
+    cache = NodeStateCache()
+    cache.load_nodes([
+        node(7, **{ONOFF_PATH: False, ACTIVE_POWER_PATH: 0, CUMULATIVE_ENERGY_PATH: {"0": 1500, "1": 1717990000}}),
+        node(8, **{ONOFF_PATH: True})
+    ])
+    assert cache.device_state(7) == {"power": False, "power_consumption": 0.0, "energy": 1500.0, "available": True}
+
+    cache.handle_event("attribute_updated", [7, ONOFF_PATH, True])
+    cache.handle_event("attribute_updated", [7, ACTIVE_POWER_PATH, 42])
+    assert cache.device_state(7) == {"power": True, "power_consumption": 42.0, "energy": 1500.0, "available": True}
+    # Other nodes are untouched
+    assert cache.get_attribute(8, ONOFF_PATH) is True
+    assert cache.get_status() == {"nodes": 2, "events_received": 2}
+
+def test_update_for_an_unknown_node_creates_it():
+    cache = NodeStateCache()
+    cache.load_nodes([])
+    cache.handle_event("attribute_updated", [9, ONOFF_PATH, True])
+    assert cache.device_state(9)["power"] is True
+    assert cache.last_seen(9) is not None
+    assert cache.device_state(10) is None
+    assert cache.get_attribute(10, ONOFF_PATH, default="missing") == "missing"
+
+def test_node_added_updated_and_removed():
+    cache = NodeStateCache()
+    cache.load_nodes([node(7, **{ONOFF_PATH: True})])
+    seen = cache.get_node(7)["last_seen"]
+
+    # An unreachable node keeps the time it was last seen
+    cache.handle_event("node_updated", node(7, available=False, **{ONOFF_PATH: True}))
+    assert cache.device_state(7)["available"] is False
+    assert cache.get_node(7)["last_seen"] == seen
+
+    # Any report means it is back
+    cache.handle_event("attribute_updated", [7, ONOFF_PATH, False])
+    assert cache.device_state(7)["available"] is True
+    assert cache.get_node(7)["last_seen"] >= seen
+
+    cache.handle_event("node_added", node(11, **{ONOFF_PATH: False}))
+    cache.handle_event("node_removed", 7)
+    assert sorted(cache.nodes) == [11]
+    assert cache.last_seen(7) is None
+
+def test_reloading_the_dump_replaces_the_cache():
+    cache = NodeStateCache()
+    cache.load_nodes([node(7), node(8)])
+    cache.load_nodes([node(8, available=False)])
+    assert sorted(cache.nodes) == [8]
+    # Never seen while this process ran
+    assert cache.last_seen(8) is None
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test script for the coalescing web app notifier, with POSTs replaced by a
+recorder or sent to a local aiohttp stand-in for the web app
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from app.webapp_notifier import WebAppNotifier
+
+class RecordingNotifier(WebAppNotifier):
+    """Records batches instead of POSTing them; fails while web_app_down is set"""
+
+    def __init__(self, **kwargs):
+        super().__init__("http://webapp.invalid", **kwargs)
+        self.batches = []
+        self.web_app_down = False
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def _send(self, batch, delivered, rejected):
+        await self.release.wait()
+        if self.web_app_down:
+            raise ConnectionError("web app down")
+        self.batches.append([(device_id, dict(data)) for device_id, data in batch])
+        delivered.extend(device_id for device_id, _ in batch)
+
+class FakeWebApp:
+    """Answers POSTs with the next status scripted for the endpoint or device, 200 once the script runs out"""
+
+    def __init__(self, batch=(), single=None):
+        self.batch = list(batch)
+        self.single = {device_id: list(statuses) for device_id, statuses in (single or {}).items()}
+        self.posts = []
+
+    async def handle_batch(self, request):
+        body = await request.json()
+        self.posts.append(("batch", [update["device_id"] for update in body["updates"]]))
+        return web.Response(status=self.batch.pop(0) if self.batch else 200)
+
+    async def handle_single(self, request):
+        device_id = (await request.json())["device_id"]
+        self.posts.append(("single", device_id))
+        statuses = self.single.get(device_id)
+        return web.Response(status=statuses.pop(0) if statuses else 200)
+
+async def serve(web_app):
+    app = web.Application()
+    app.router.add_post("/api/devices/update/batch", web_app.handle_batch)
+    app.router.add_post("/api/devices/update", web_app.handle_single)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+async def notify_and_settle(web_app, updates, settle=0.3, **kwargs):
+    runner, url = await serve(web_app)
+    notifier = WebAppNotifier(url, window=0, initial_backoff=0.02, **kwargs)
+    await notifier.start()
+    for device_id in updates:
+        await notifier.notify(device_id, {"on": True})
+    await asyncio.sleep(settle)
+    await notifier.stop(flush_timeout=0)
+    await runner.cleanup()
+    return notifier
+
+def test_updates_inside_the_window_coalesce():
+    async def run():
+        notifier = RecordingNotifier(window=0.05)
+        await notifier.start()
+        await notifier.notify("plug-1", {"state": {"on": True}})
+        await notifier.notify("plug-2", {"state": {"on": True}})
+        await notifier.notify("plug-1", {"state": {"on": False}, "last_seen": 5})
+        await asyncio.sleep(0.15)
+        await notifier.stop()
+        return notifier
+
+    notifier = asyncio.run(run())
+    assert notifier.batches == [[
+        ("plug-1", {"state": {"on": False}, "last_seen": 5}),
+        ("plug-2", {"state": {"on": True}})
+    ]]
+    assert notifier.coalesced == 1
+    assert notifier.sent == 2
+
+def test_full_queue_makes_notify_wait():
+    async def run():
+        notifier = RecordingNotifier(window=0, batch_size=2, max_pending=2)
+        notifier.release.clear()
+        await notifier.start()
+        await notifier.notify("plug-1", {"on": True})
+        await notifier.notify("plug-2", {"on": True})
+        # Both updates are in flight and the web app has not answered
+        third = asyncio.ensure_future(notifier.notify("plug-3", {"on": True}))
+        await asyncio.sleep(0.05)
+        blocked = not third.done()
+        notifier.release.set()
+        await asyncio.wait_for(third, timeout=1)
+        await notifier.stop()
+        return notifier, blocked
+
+    notifier, blocked = asyncio.run(run())
+    assert blocked
+    assert [device_id for batch in notifier.batches for device_id, _ in batch] == ["plug-1", "plug-2", "plug-3"]
+
+def test_failed_batches_are_retried_under_newer_data():
+    async def run():
+        notifier = RecordingNotifier(window=0, initial_backoff=0.05)
+        notifier.web_app_down = True
+        await notifier.start()
+        await notifier.notify("plug-1", {"state": "on", "last_seen": 1})
+        await asyncio.sleep(0.02)
+        await notifier.notify("plug-1", {"last_seen": 2})
+        notifier.web_app_down = False
+        await asyncio.sleep(0.15)
+        await notifier.stop()
+        return notifier
+
+    notifier = asyncio.run(run())
+    assert notifier.failures >= 1
+    assert notifier.batches == [[("plug-1", {"state": "on", "last_seen": 2})]]
+
+def test_notify_nowait_never_waits_and_wakes_the_sender():
+    async def run():
+        notifier = RecordingNotifier(window=0, max_pending=1)
+        notifier.release.clear()
+        await notifier.start()
+        notifier.notify_nowait("plug-1", {"on": True})
+        await asyncio.sleep(0.02)
+        # plug-1 is in flight and the queue is full, but a callback still gets through
+        notifier.notify_nowait("plug-2", {"on": True})
+        notifier.notify_nowait("plug-2", {"on": False})
+        notifier.release.set()
+        await asyncio.sleep(0.05)
+        await notifier.stop()
+        return notifier
+
+    notifier = asyncio.run(run())
+    assert notifier.batches == [[("plug-1", {"on": True})], [("plug-2", {"on": False})]]
+    assert notifier.coalesced == 1
+
+def test_rejected_updates_are_dropped_and_delivered_ones_not_resent():
+    # No batch endpoint; plug-2 is refused, plug-3 hits a 503 once
+    web_app = FakeWebApp(batch=[404], single={"plug-2": [422], "plug-3": [503]})
+    notifier = asyncio.run(notify_and_settle(web_app, ["plug-1", "plug-2", "plug-3"]))
+
+    singles = [device_id for endpoint, device_id in web_app.posts if endpoint == "single"]
+    assert singles == ["plug-1", "plug-2", "plug-3", "plug-3"]
+    assert notifier.get_status()["sent"] == 2
+    assert notifier.dropped == 1
+    assert notifier.failures == 1
+    assert not notifier.pending
+
+def test_server_errors_are_retried_a_bounded_number_of_times():
+    web_app = FakeWebApp(batch=[500, 500, 500])
+    notifier = asyncio.run(notify_and_settle(web_app, ["plug-1"], max_attempts=3))
+    assert web_app.posts == [("batch", ["plug-1"])] * 3
+    assert notifier.dropped == 1
+    assert notifier.sent == 0
+    assert not notifier.pending
+
+def test_a_rejected_batch_is_not_retried_and_does_not_block_later_updates():
+    async def run():
+        web_app = FakeWebApp(batch=[400])
+        runner, url = await serve(web_app)
+        notifier = WebAppNotifier(url, window=0, initial_backoff=5)
+        await notifier.start()
+        await notifier.notify("plug-1", {"on": True})
+        await asyncio.sleep(0.1)
+        await notifier.notify("plug-2", {"on": True})
+        await asyncio.sleep(0.1)
+        await notifier.stop(flush_timeout=0)
+        await runner.cleanup()
+        return web_app, notifier
+
+    web_app, notifier = asyncio.run(run())
+    assert web_app.posts == [("batch", ["plug-1"]), ("batch", ["plug-2"])]
+    assert notifier.dropped == 1
+    assert notifier.sent == 1
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for CredentialStore
+
+- store_credentials/get_credentials: the pooled WAL-mode store against the
+  previous access pattern, which opened a new sqlite3 connection for every
+  call on the event loop thread.
+- listing: bulk listing of encrypted devices, checked against a latency budget.
+
+Usage: python benchmark_credential_store.py [operations]
+       python benchmark_credential_store.py listing [devices] [budget_ms]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.config import Config
+from commissioning_server.core.credential_store import CredentialStore
+
+class ConnectPerCallStore(CredentialStore):
+    """The pre-pool store: one sqlite3.connect per call, run inline"""
+
+    async def initialize(self):
+        await CredentialStore.initialize(self)
+        await self.pool.close()
+        # The old store never enabled WAL
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+
+    async def store_credentials(self, device_id, credentials, device_info=None):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        if device_info:
+            cursor.execute("""
+                INSERT OR REPLACE INTO devices
+                (device_id, name, type, commissioning_type, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (device_id, device_info.get("name"), device_info.get("type"),
+                  device_info.get("commissioning_type")))
+        cursor.execute("""
+            INSERT OR REPLACE INTO credentials
+            (device_id, fabric_id, node_id, endpoint, credentials_data, encrypted)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (device_id, credentials.get("fabric_id"), credentials.get("node_id"),
+              credentials.get("endpoint"), json.dumps(credentials), False))
+        conn.commit()
+        conn.close()
+        return True
+
+    async def get_credentials(self, device_id):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT credentials_data, encrypted FROM credentials WHERE device_id = ?",
+                       (device_id,))
+        result = cursor.fetchone()
+        conn.close()
+        return json.loads(result[0]) if result else None
+
+    async def cleanup(self):
+        self.initialized = False
+
+def make_config(db_path: str) -> Config:
+    config = Config(os.path.join(os.path.dirname(db_path), "config.yaml"))
+    config.config["storage"]["path"] = db_path
+    config.config["security"]["encrypt_credentials"] = False
+    config.config["security"]["credential_key_path"] = os.path.join(os.path.dirname(db_path), "credentials.key")
+    return config
+
+async def measure(store_class, operations: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = store_class(make_config(os.path.join(tmp, "credentials.db")))
+        await store.initialize()
+        device_info = {"name": "Benchmark Plug", "type": "matter", "commissioning_type": "ble-wifi"}
+
+        start = time.perf_counter()
+        for i in range(operations):
+            await store.store_credentials(f"device-{i}", {
+                "fabric_id": "1", "node_id": str(i), "endpoint": "1", "passcode": "20202021"
+            }, device_info)
+        writes = operations / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(operations):
+            await store.get_credentials(f"device-{i}")
+        reads = operations / (time.perf_counter() - start)
+
+        # Concurrent readers only help when reads do not run on the event loop
+        start = time.perf_counter()
+        await asyncio.gather(*[store.get_credentials(f"device-{i}") for i in range(operations)])
+        concurrent_reads = operations / (time.perf_counter() - start)
+
+        await store.cleanup()
+        return {"store": writes, "get": reads, "get (concurrent)": concurrent_reads}
+
+def run_benchmark(operations: int = 2000):
+    logging.disable(logging.INFO)
+
+    before = asyncio.run(measure(ConnectPerCallStore, operations))
+    after = asyncio.run(measure(CredentialStore, operations))
+
+    print(f"{'operation':<20}{'before ops/s':>15}{'after ops/s':>15}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<20}{before[name]:>15,.0f}{after[name]:>15,.0f}{after[name] / before[name]:>9.1f}x")
+
+async def measure_listing(devices: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        config = make_config(os.path.join(tmp, "credentials.db"))
+        config.config["security"]["encrypt_credentials"] = True
+        store = CredentialStore(config)
+        await store.initialize()
+        await asyncio.gather(*[store.store_credentials(f"device-{i:05d}", {
+            "fabric_id": "1", "node_id": str(i), "endpoint": "1", "passcode": "20202021",
+            "discriminator": i % 4096, "wifi_ssid": "msh-iot"
+        }, {"name": f"Plug {i}", "type": "matter", "commissioning_type": "ble-wifi"}) for i in range(devices)])
+
+        timings = {}
+        start = time.perf_counter()
+        listing = await store.get_all_credentials()
+        timings["full listing (decrypt)"] = time.perf_counter() - start
+        assert len(listing) == devices and listing[0]["credentials"]["passcode"] == "20202021"
+
+        start = time.perf_counter()
+        await store.get_credentials_page(limit=devices, fields=["device_id", "name"])
+        timings["projected listing"] = time.perf_counter() - start
+
+        await store.cleanup()
+        return timings
+
+def run_listing_benchmark(devices: int = 10000, budget_ms: float = 1000):
+    logging.disable(logging.INFO)
+    timings = asyncio.run(measure_listing(devices))
+
+    within_budget = True
+    for name, elapsed in timings.items():
+        print(f"{name:<25}{devices:>8} devices{elapsed * 1000:>10.1f} ms{elapsed / devices * 1e6:>8.1f} us/device")
+        within_budget = within_budget and elapsed * 1000 <= budget_ms
+    print(f"Budget {budget_ms:.0f} ms: {'OK' if within_budget else 'EXCEEDED'}")
+    return within_budget
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "listing":
+        ok = run_listing_benchmark(
+            int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+            float(sys.argv[3]) if len(sys.argv) > 3 else 1000
+        )
+        sys.exit(0 if ok else 1)
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Benchmark for native Matter onboarding payload decoding
+
+Usage: python benchmark_setup_payload.py [iterations]
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.setup_payload import (
+    encode_manual_code,
+    encode_qr_code,
+    parse_setup_payload,
+)
+
+def build_payloads(count: int = 1000) -> list:
+    """Build a mix of QR codes (some with TLV data) and manual codes"""
+    tlv = bytes([0x15, 0x2C, 0x00, 0x05]) + b"SN-42" + bytes([0x18])
+    payloads = []
+    for i in range(count):
+        discriminator = i % 4096
+        passcode = 20202021 + i
+        if i % 3 == 0:
+            payloads.append(encode_manual_code(discriminator, passcode))
+        elif i % 3 == 1:
+            payloads.append(encode_qr_code(0x125D, 0x06BC, discriminator, passcode))
+        else:
+            payloads.append(encode_qr_code(0x125D, 0x06BC, discriminator, passcode, optional_data=tlv))
+    return payloads
+
+def run_benchmark(iterations: int = 50):
+    payloads = build_payloads()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for payload in payloads:
+            parse_setup_payload(payload)
+    elapsed = time.perf_counter() - start
+
+    decoded = iterations * len(payloads)
+    print(f"Decoded {decoded} payloads in {elapsed:.3f}s")
+    print(f"Throughput: {decoded / elapsed:,.0f} payloads/s")
+    print(f"Mean decode time: {elapsed / decoded * 1e6:.2f} us")
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
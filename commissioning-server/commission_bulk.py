@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Bulk-commission devices from a CSV or JSON manifest
+
+Sends the manifest to a running commissioning server's /commission/bulk
+endpoint and prints its report as devices finish. Re-running the same
+manifest resumes the run: devices that already succeeded are skipped.
+
+CSV manifests need a header row with device_name and qr_code columns and
+may add device_type; JSON manifests are a list of the same objects.
+
+Usage: python commission_bulk.py manifest.csv --ssid HomeWiFi [--password ...]
+       [--pi-ip 192.168.0.107] [--pi-user chregg] [--concurrency N]
+       [--server http://localhost:8888]
+
+The WiFi password is read from MSH_WIFI_PASSWORD or prompted for when
+--password is not given.
+"""
+
+import argparse
+import getpass
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from commissioning_server.core.bulk_commissioning import load_manifest
+
+def format_record(record: dict) -> str:
+    if record["type"] == "run":
+        return (f"Run {record['run_id']}: {record['devices']} devices, "
+                f"{record['already_succeeded']} already commissioned")
+    if record["type"] == "device":
+        line = f"{record['status']:>9}  {record['device_name']} ({record['device_id']})"
+        if record.get("node_id"):
+            line += f" node {record['node_id']}"
+        if record.get("error"):
+            line += f": {record['error']}"
+        return line
+    if record["type"] == "summary":
+        return (f"Done: {record['succeeded']} succeeded, {record['failed']} failed, "
+                f"{record['skipped']} skipped")
+    return f"Error: {record.get('error')}"
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk-commission Matter devices from a manifest")
+    parser.add_argument("manifest", help="CSV or JSON manifest of device_name, qr_code[, device_type]")
+    parser.add_argument("--ssid", required=True, help="WiFi network the devices join")
+    parser.add_argument("--password", help="WiFi password (default: $MSH_WIFI_PASSWORD or prompt)")
+    parser.add_argument("--pi-ip", default="", help="Pi to transfer credentials to")
+    parser.add_argument("--pi-user", default="chregg")
+    parser.add_argument("--concurrency", type=int, help="devices commissioned at once")
+    parser.add_argument("--server", default="http://localhost:8888")
+    parser.add_argument("--json", action="store_true", help="print raw NDJSON records")
+    args = parser.parse_args()
+
+    try:
+        entries = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read manifest: {e}", file=sys.stderr)
+        return 2
+
+    password = args.password or os.environ.get("MSH_WIFI_PASSWORD") or getpass.getpass("WiFi password: ")
+    body = {
+        "devices": entries,
+        "network_ssid": args.ssid,
+        "network_password": password,
+        "pi_ip": args.pi_ip,
+        "pi_user": args.pi_user,
+        "concurrency": args.concurrency
+    }
+
+    failed = 0
+    # Commissioning takes minutes per device, so only the connection has a timeout
+    timeout = httpx.Timeout(10.0, read=None)
+    with httpx.stream("POST", f"{args.server}/commission/bulk", json=body, timeout=timeout) as response:
+        if response.status_code != 200:
+            response.read()
+            print(f"Bulk commissioning rejected ({response.status_code}): {response.text}", file=sys.stderr)
+            return 2
+        for line in response.iter_lines():
+            if not line:
+                continue
+            record = json.loads(line)
+            print(line if args.json else format_record(record), flush=True)
+            if record["type"] == "summary":
+                failed = record["failed"]
+            elif record["type"] == "error":
+                failed = failed or 1
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
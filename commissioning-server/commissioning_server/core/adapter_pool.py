@@ -0,0 +1,129 @@
+"""
+Pool of BLE adapters for running commissioning jobs in parallel
+"""
+
+import asyncio
+import glob
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from .chip_tool_storage import primary_fabric_exists, seed_storage
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+SYSFS_BLUETOOTH = "/sys/class/bluetooth"
+
+class BLEAdapter:
+    """One HCI controller and the chip-tool storage directory that goes with it"""
+
+    def __init__(self, name: str, storage_dir: Optional[str]):
+        self.name = name
+        self.index = int(name[3:])
+        # None means chip-tool's default storage
+        self.storage_dir = storage_dir
+        self.busy = False
+        self.jobs_run = 0
+
+    def chip_tool_args(self) -> List[str]:
+        """chip-tool options pinning a pairing run to this adapter"""
+        args = ["--ble-adapter", str(self.index)]
+        if self.storage_dir:
+            args += ["--storage-directory", self.storage_dir]
+        return args
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "storage_dir": self.storage_dir,
+            "busy": self.busy,
+            "jobs_run": self.jobs_run
+        }
+
+class BLEAdapterPool:
+    """Hands each concurrent commissioning run its own BLE adapter
+
+    Two chip-tool processes can't share a storage directory, so with more
+    than one adapter each gets its own. New directories are seeded with the
+    primary chip-tool storage (fabric and CA keys), so every adapter
+    commissions devices into the same fabric that control commands use.
+    Until the primary fabric exists only one adapter is used: an unseeded
+    chip-tool would create a fabric of its own, and devices paired into it
+    could never be controlled.
+    """
+
+    def __init__(self, config: Config, sysfs_path: str = SYSFS_BLUETOOTH):
+        bluetooth_config = config.get_bluetooth_config()
+        pool_config = bluetooth_config.get("adapter_pool", {})
+        self.default_adapter = bluetooth_config.get("adapter", "hci0")
+        # Empty means use every controller found in sysfs
+        self.configured_adapters: List[str] = pool_config.get("adapters") or []
+        self.storage_root = pool_config.get("storage_root", "./chip-tool-storage")
+        self.seed_storage_dir = pool_config.get("seed_storage_dir", "/tmp")
+        self.sysfs_path = sysfs_path
+
+        self.adapters: List[BLEAdapter] = []
+        self._free: Optional[asyncio.Queue] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.adapters)
+
+    def discover(self) -> List[BLEAdapter]:
+        """Find the adapters to use and prepare their storage directories"""
+        names = self.configured_adapters or self._find_controllers() or [self.default_adapter]
+        names = sorted(set(names), key=lambda name: int(name[3:]))
+        if len(names) > 1 and not self.primary_fabric_exists():
+            name = self.default_adapter if self.default_adapter in names else names[0]
+            logger.error(f"No chip-tool fabric in {self.seed_storage_dir} to share between BLE adapters; "
+                         f"commissioning through {name} only until it exists")
+            names = [name]
+
+        self.adapters = []
+        for name in names:
+            storage_dir = None
+            if len(names) > 1:
+                storage_dir = os.path.abspath(os.path.join(self.storage_root, name))
+                seed_storage(storage_dir, self.seed_storage_dir)
+            self.adapters.append(BLEAdapter(name, storage_dir))
+
+        self._free = asyncio.Queue()
+        for adapter in self.adapters:
+            self._free.put_nowait(adapter)
+        logger.info(f"BLE adapter pool: {', '.join(names)}")
+        return self.adapters
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[BLEAdapter]:
+        """Wait for a free adapter and hold it for the duration of the block"""
+        if self._free is None:
+            self.discover()
+        adapter = await self._free.get()
+        adapter.busy = True
+        try:
+            yield adapter
+        finally:
+            adapter.busy = False
+            adapter.jobs_run += 1
+            self._free.put_nowait(adapter)
+
+    def get_status(self) -> Dict:
+        return {
+            "size": self.size,
+            "free": sum(1 for adapter in self.adapters if not adapter.busy),
+            "adapters": [adapter.to_dict() for adapter in self.adapters]
+        }
+
+    def primary_fabric_exists(self) -> bool:
+        """Check whether the primary chip-tool storage holds a fabric to seed adapters with"""
+        return primary_fabric_exists(self.seed_storage_dir)
+
+    def _find_controllers(self) -> List[str]:
+        return [
+            os.path.basename(path)
+            for path in glob.glob(os.path.join(self.sysfs_path, "hci*"))
+            if re.fullmatch(r"hci\d+", os.path.basename(path))
+        ]
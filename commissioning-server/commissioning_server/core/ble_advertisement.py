@@ -0,0 +1,110 @@
+"""
+Matter BLE commissionable advertisement (service UUID 0xFFF6) decoding
+"""
+
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+MATTER_SERVICE_UUID = "0000fff6-0000-1000-8000-00805f9b34fb"
+MATTER_OPCODE_COMMISSIONABLE = 0x00
+
+# opcode(1) version/discriminator(2) vendor id(2) product id(2) flags(1)
+MATTER_SERVICE_DATA_LENGTH = 8
+
+_HEX_BYTES = re.compile(r"^\s*((?:[0-9a-fA-F]{2} )+)")
+_UUID = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+def parse_matter_service_data(data: bytes) -> Optional[Dict]:
+    """Decode Matter 0xFFF6 service data, or return None if it is not a commissionable advertisement"""
+    if len(data) < MATTER_SERVICE_DATA_LENGTH or data[0] != MATTER_OPCODE_COMMISSIONABLE:
+        return None
+
+    version_discriminator = data[1] | (data[2] << 8)
+    flags = data[7]
+    return {
+        "opcode": data[0],
+        "advertisement_version": version_discriminator >> 12,
+        "discriminator": version_discriminator & 0xFFF,
+        "vendor_id": data[3] | (data[4] << 8),
+        "product_id": data[5] | (data[6] << 8),
+        "additional_data": bool(flags & 0x01),
+        "extended_announcement": bool(flags & 0x02)
+    }
+
+def annotate_matter_device(device: Dict) -> Dict:
+    """Add the decoded Matter advertisement to a scanned device dict
+
+    Service data is expected as {uuid: hex string}, as produced by the scanners.
+    """
+    advertisement = None
+    for uuid, data in device.get("service_data", {}).items():
+        if uuid.lower() == MATTER_SERVICE_UUID:
+            try:
+                advertisement = parse_matter_service_data(bytes.fromhex(data))
+            except ValueError:
+                advertisement = None
+            break
+
+    device["matter"] = advertisement
+    device["discriminator"] = advertisement["discriminator"] if advertisement else None
+    device["vendor_id"] = advertisement["vendor_id"] if advertisement else None
+    device["product_id"] = advertisement["product_id"] if advertisement else None
+    return device
+
+def commissionable_key(device: Dict) -> Optional[Tuple[int, int, int]]:
+    """(discriminator, vendor id, product id) of an annotated device"""
+    advertisement = device.get("matter")
+    if not advertisement:
+        return None
+    return (advertisement["discriminator"], advertisement["vendor_id"], advertisement["product_id"])
+
+def matches_payload(device: Dict, payload: Dict) -> bool:
+    """Check an annotated device against a decoded onboarding payload
+
+    Manual codes only carry the upper 4 bits of the discriminator and may omit
+    the vendor and product ids; whatever the payload does carry must match exactly.
+    """
+    key = commissionable_key(device)
+    if key is None:
+        return False
+    discriminator, vendor_id, product_id = key
+
+    if payload.get("has_short_discriminator"):
+        if discriminator >> 8 != payload["short_discriminator"]:
+            return False
+    elif discriminator != payload["discriminator"]:
+        return False
+
+    if payload.get("vendor_id") is not None and vendor_id != payload["vendor_id"]:
+        return False
+    if payload.get("product_id") is not None and product_id != payload["product_id"]:
+        return False
+    return True
+
+def index_commissionable_devices(devices: Iterable[Dict]) -> Dict[Tuple[int, int, int], Dict]:
+    """Index annotated devices by (discriminator, vendor id, product id)"""
+    index = {}
+    for device in devices:
+        key = commissionable_key(device)
+        if key is not None:
+            index[key] = device
+    return index
+
+def parse_bluetoothctl_service_data(output: str) -> Dict[str, str]:
+    """Extract service data as {uuid: hex string} from `bluetoothctl info` output"""
+    service_data: Dict[str, str] = {}
+    current_uuid = None
+    for line in output.split('\n'):
+        if "ServiceData" in line:
+            match = _UUID.search(line)
+            current_uuid = match.group(0).lower() if match else current_uuid
+            if current_uuid:
+                service_data.setdefault(current_uuid, "")
+            continue
+
+        match = _HEX_BYTES.match(line)
+        if current_uuid and match:
+            service_data[current_uuid] += match.group(1).replace(" ", "")
+        elif line.strip() and not line.startswith("  "):
+            current_uuid = None
+    return service_data
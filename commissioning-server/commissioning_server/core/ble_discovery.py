@@ -0,0 +1,216 @@
+"""
+Background BLE discovery service with an in-memory device cache
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+from .ble_scanner import BLEScanner
+from .config import Config
+from .metrics import LONG_BUCKETS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BLE_SCAN_SECONDS = REGISTRY.histogram(
+    "ble_scan_seconds",
+    "BLE scan durations: background discovery cycles, on-demand top-ups and "
+    "commissioning lookups of a device",
+    ["kind"],
+    buckets=LONG_BUCKETS
+)
+
+class BLEDiscoveryService:
+    """Continuously scans for BLE devices and answers queries from a TTL cache"""
+
+    def __init__(self, config: Config, scanner: BLEScanner):
+        self.config = config
+        self.scanner = scanner
+        self.discovery_config = config.get_bluetooth_config().get("discovery", {})
+        self.enabled = self.discovery_config.get("enabled", True)
+        self.cycle_duration = self.discovery_config.get("cycle_duration", 30)
+        self.ttl = self.discovery_config.get("ttl", 120)
+        self.rssi_history_size = self.discovery_config.get("rssi_history", 10)
+        self.top_up_duration = self.discovery_config.get("top_up_duration", 5)
+        self.retry_delay = self.discovery_config.get("retry_delay", 5)
+
+        self.cache: Dict[str, Dict] = {}
+        self.running = False
+        self.scanning = False
+        self.last_scan_at: Optional[float] = None
+        self.scan_started_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._top_up: Optional[asyncio.Task] = None
+        self._pause_count = 0
+        self._updated = asyncio.Event()
+
+    async def start(self):
+        """Start the background discovery loop"""
+        if self.running:
+            return
+        self.running = True
+        self._start_loop()
+        logger.info(f"BLE discovery started (cycle {self.cycle_duration}s, ttl {self.ttl}s)")
+
+    async def stop(self):
+        """Stop background discovery"""
+        self.running = False
+        await self._stop_loop()
+        if self._top_up is not None:
+            self._top_up.cancel()
+        logger.info("BLE discovery stopped")
+
+    @asynccontextmanager
+    async def paused(self):
+        """Release the BLE adapter while another operation (e.g. pairing) needs it"""
+        self._pause_count += 1
+        if self._pause_count == 1:
+            await self._stop_loop()
+        try:
+            yield
+        finally:
+            self._pause_count -= 1
+            if self._pause_count == 0 and self.running:
+                self._start_loop()
+
+    def is_stale(self, fresh_within: float) -> bool:
+        """Check if the cache has not been refreshed within the given number of seconds
+
+        A scan in progress counts once it has run as long as a top-up would.
+        """
+        now = time.time()
+        if self.last_scan_at is not None and now - self.last_scan_at <= fresh_within:
+            return False
+        return not (self.scanning and now - self.scan_started_at >= self.top_up_duration)
+
+    async def get_devices(self, fresh_within: Optional[float] = None) -> List[Dict]:
+        """Return cached devices, topping the cache up first if it is older than fresh_within"""
+        if fresh_within is not None and self.is_stale(fresh_within) and self._pause_count == 0:
+            if self.scanning and (self._top_up is None or self._top_up.done()):
+                # The background cycle already holds the adapter; let it scan for a top-up's time
+                await asyncio.sleep(self.scan_started_at + self.top_up_duration - time.time())
+            else:
+                await self.scan(timeout=self.top_up_duration)
+        self._evict()
+        return [self._entry_to_device(entry) for entry in self.cache.values()]
+
+    async def scan(self, timeout: Optional[float] = None) -> List[Dict]:
+        """Run a scan that feeds the cache; concurrent callers share one scan"""
+        if self._top_up is None or self._top_up.done():
+            self._top_up = asyncio.create_task(self._scan_once(timeout, kind="top_up"))
+        await asyncio.shield(self._top_up)
+        self._evict()
+        return [self._entry_to_device(entry) for entry in self.cache.values()]
+
+    def find(self, predicate: Callable[[Dict], bool]) -> Optional[Dict]:
+        """Return the most recently seen cached device matching the predicate"""
+        self._evict()
+        matches = [entry for entry in self.cache.values() if predicate(entry["device"])]
+        if not matches:
+            return None
+        return self._entry_to_device(max(matches, key=lambda entry: entry["last_seen"]))
+
+    async def wait_for_device(self, predicate: Callable[[Dict], bool], timeout: float) -> Optional[Dict]:
+        """Wait until a matching device is in the cache, using only the background scan"""
+        deadline = time.monotonic() + timeout
+        while True:
+            device = self.find(predicate)
+            if device is not None:
+                return device
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self._updated.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    def update(self, device: Dict):
+        """Record a device sighting"""
+        address = device.get("address")
+        if not address:
+            return
+
+        now = time.time()
+        entry = self.cache.get(address)
+        if entry is None:
+            entry = {
+                "first_seen": now,
+                "rssi_history": deque(maxlen=self.rssi_history_size)
+            }
+            self.cache[address] = entry
+
+        entry["device"] = device
+        entry["last_seen"] = now
+        if device.get("rssi") is not None:
+            entry["rssi_history"].append((now, device["rssi"]))
+
+        # Wake up waiters and arm a fresh event for the next sighting
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def get_status(self) -> Dict:
+        """Get discovery service status"""
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "paused": self._pause_count > 0,
+            "scanning": self.scanning,
+            "cached_devices": len(self.cache),
+            "last_scan_at": self.last_scan_at,
+            "ttl": self.ttl
+        }
+
+    def _start_loop(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _stop_loop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while self.running:
+            try:
+                await self._scan_once(self.cycle_duration, kind="cycle")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"BLE discovery cycle failed: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def _scan_once(self, timeout: Optional[float], kind: str):
+        self.scanning = True
+        self.scan_started_at = time.time()
+        try:
+            with BLE_SCAN_SECONDS.time(kind=kind):
+                async for device in self.scanner.stream_devices(timeout=timeout):
+                    self.update(device)
+            # A failed scan leaves the cache stale, so the next top-up scans again
+            self.last_scan_at = time.time()
+        finally:
+            self.scanning = False
+            self._evict()
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        expired = [address for address, entry in self.cache.items() if entry["last_seen"] < cutoff]
+        for address in expired:
+            del self.cache[address]
+        if expired:
+            logger.debug(f"Evicted {len(expired)} BLE devices from discovery cache")
+
+    def _entry_to_device(self, entry: Dict) -> Dict:
+        device = dict(entry["device"])
+        device["first_seen"] = entry["first_seen"]
+        device["last_seen"] = entry["last_seen"]
+        device["rssi_history"] = [rssi for _, rssi in entry["rssi_history"]]
+        return device
@@ -5,9 +5,12 @@ BLE Scanner for Matter device discovery
 import asyncio
 import logging
 import subprocess
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional
 
+from .ble_advertisement import annotate_matter_device, parse_bluetoothctl_service_data
+from .bluez_scanner import DBUS_AVAILABLE, BlueZScanner
 from .config import Config
+from .metrics import SUBPROCESS_SPAWNS
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +23,13 @@ class BLEScanner:
         self.adapter = self.bluetooth_config.get("adapter", "hci0")
         self.timeout = self.bluetooth_config.get("timeout", 30)
         self.scan_duration = self.bluetooth_config.get("scan_duration", 10)
+        # "dbus" streams BlueZ advertisement signals, "bluetoothctl" polls
+        self.scan_backend = self.bluetooth_config.get("scan_backend", "dbus")
+        self.bluez_scanner = BlueZScanner(config)
+        
+    def _use_dbus(self) -> bool:
+        """Check if the streaming BlueZ D-Bus backend should be used"""
+        return self.scan_backend == "dbus" and DBUS_AVAILABLE
         
     async def is_available(self) -> bool:
         """Check if Bluetooth is available"""
@@ -44,8 +54,42 @@ class BLEScanner:
             logger.error(f"Error checking Bluetooth availability: {e}")
             return False
     
-    async def scan_devices(self, timeout: Optional[int] = None) -> List[Dict]:
+    async def stream_devices(self, timeout: Optional[int] = None,
+                             discriminator: Optional[int] = None,
+                             stop_when: Optional[Callable[[Dict], bool]] = None) -> AsyncIterator[Dict]:
+        """Yield BLE devices as soon as they advertise
+        
+        With the bluetoothctl backend devices are only yielded after the
+        whole scan window has elapsed.
+        """
+        if self._use_dbus():
+            try:
+                async for device in self.bluez_scanner.stream_devices(
+                    timeout=timeout, discriminator=discriminator, stop_when=stop_when
+                ):
+                    yield self._filter_matter_devices([device])[0]
+                return
+            except Exception as e:
+                logger.warning(f"BlueZ D-Bus scan failed, falling back to bluetoothctl: {e}")
+        
+        for device in await self._scan_bluetoothctl(timeout):
+            yield device
+    
+    async def scan_devices(self, timeout: Optional[int] = None,
+                           discriminator: Optional[int] = None) -> List[Dict]:
         """Scan for BLE Matter devices"""
+        if self._use_dbus():
+            try:
+                devices = await self.bluez_scanner.scan_devices(timeout=timeout, discriminator=discriminator)
+                logger.info(f"Found {len(devices)} devices via BlueZ D-Bus: {devices}")
+                return self._filter_matter_devices(devices)
+            except Exception as e:
+                logger.warning(f"BlueZ D-Bus scan failed, falling back to bluetoothctl: {e}")
+        
+        return await self._scan_bluetoothctl(timeout)
+    
+    async def _scan_bluetoothctl(self, timeout: Optional[int]) -> List[Dict]:
+        """Scan with bluetoothctl, returning the Matter devices seen in the scan window"""
         try:
             if not await self.is_available():
                 raise Exception("Bluetooth not available")
@@ -77,6 +121,7 @@ class BLEScanner:
             if result["return_code"] == 0:
                 devices = self._parse_devices(result["stdout"])
                 logger.info(f"Found {len(devices)} total devices: {devices}")
+                await self._add_service_data(devices)
                 # Filter for Matter devices
                 matter_devices = self._filter_matter_devices(devices)
                 logger.info(f"Found {len(matter_devices)} Matter devices: {matter_devices}")
@@ -180,14 +225,25 @@ class BLEScanner:
         return info
     
     def _filter_matter_devices(self, devices: List[Dict]) -> List[Dict]:
-        """Filter devices to find Matter devices"""
-        # For testing, return all devices
+        """Mark devices carrying a Matter commissionable advertisement (0xFFF6 service data)"""
         for device in devices:
-            device["type"] = "ble"
+            annotate_matter_device(device)
+            device["type"] = "matter" if device["matter"] else "ble"
         return devices
     
+    async def _add_service_data(self, devices: List[Dict]):
+        """Fetch advertisement service data for bluetoothctl-discovered devices"""
+        for device in devices:
+            result = await self._run_command([
+                "bluetoothctl",
+                "info", device["address"]
+            ], timeout=5)
+            if result["return_code"] == 0:
+                device["service_data"] = parse_bluetoothctl_service_data(result["stdout"])
+    
     async def _run_command(self, cmd: List[str], timeout: int = 30) -> Dict:
         """Run a command and return the result"""
+        SUBPROCESS_SPAWNS.inc(program=cmd[0])
         try:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
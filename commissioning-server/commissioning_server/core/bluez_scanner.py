@@ -0,0 +1,211 @@
+"""
+Streaming BLE scanner driven by BlueZ D-Bus signals
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .ble_advertisement import annotate_matter_device
+from .config import Config
+
+try:
+    from dbus_next import BusType, Message, MessageType, Variant
+    from dbus_next.aio import MessageBus
+    DBUS_AVAILABLE = True
+except ImportError:
+    DBUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BLUEZ_SERVICE = "org.bluez"
+ADAPTER_INTERFACE = "org.bluez.Adapter1"
+DEVICE_INTERFACE = "org.bluez.Device1"
+OBJECT_MANAGER_INTERFACE = "org.freedesktop.DBus.ObjectManager"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+MATCH_RULES = [
+    f"type='signal',sender='{BLUEZ_SERVICE}',interface='{OBJECT_MANAGER_INTERFACE}',member='InterfacesAdded'",
+    f"type='signal',sender='{BLUEZ_SERVICE}',interface='{PROPERTIES_INTERFACE}',member='PropertiesChanged',arg0='{DEVICE_INTERFACE}'"
+]
+
+class BlueZScanner:
+    """BLE scanner that yields devices as BlueZ reports their advertisements"""
+
+    def __init__(self, config: Config, bus_address: Optional[str] = None):
+        self.config = config
+        self.bluetooth_config = config.get_bluetooth_config()
+        self.adapter = self.bluetooth_config.get("adapter", "hci0")
+        self.scan_duration = self.bluetooth_config.get("scan_duration", 10)
+        self.adapter_path = f"/org/bluez/{self.adapter}"
+        # A custom bus address lets tests point the scanner at a mock BlueZ
+        self.bus_address = bus_address
+
+    async def is_available(self) -> bool:
+        """Check if BlueZ and the configured adapter are reachable over D-Bus"""
+        if not DBUS_AVAILABLE:
+            return False
+        bus = None
+        try:
+            bus = await self._connect()
+            objects = await self._get_managed_objects(bus)
+            return ADAPTER_INTERFACE in objects.get(self.adapter_path, {})
+        except Exception as e:
+            logger.error(f"Error checking BlueZ availability: {e}")
+            return False
+        finally:
+            if bus is not None:
+                bus.disconnect()
+
+    async def stream_devices(self, timeout: Optional[float] = None,
+                             discriminator: Optional[int] = None,
+                             stop_when: Optional[Callable[[Dict], bool]] = None) -> AsyncIterator[Dict]:
+        """Yield devices as they advertise until the timeout or a stop condition is met
+
+        The scan ends early once a device with the given discriminator is seen,
+        or once stop_when returns True for a yielded device.
+        """
+        if not DBUS_AVAILABLE:
+            raise Exception("dbus-next is not installed")
+
+        scan_time = timeout if timeout is not None else self.scan_duration
+        deadline = time.monotonic() + scan_time
+        queue: asyncio.Queue = asyncio.Queue()
+        known: Dict[str, Dict] = {}
+
+        bus = await self._connect()
+
+        def handle_message(message):
+            if message.message_type != MessageType.SIGNAL:
+                return
+            if message.member == "InterfacesAdded":
+                path, interfaces = message.body
+                if DEVICE_INTERFACE in interfaces:
+                    queue.put_nowait((path, interfaces[DEVICE_INTERFACE]))
+            elif message.member == "PropertiesChanged" and message.body[0] == DEVICE_INTERFACE:
+                queue.put_nowait((message.path, message.body[1]))
+
+        bus.add_message_handler(handle_message)
+        try:
+            for rule in MATCH_RULES:
+                await self._call(bus, "org.freedesktop.DBus", "/org/freedesktop/DBus",
+                                 "org.freedesktop.DBus", "AddMatch", "s", [rule])
+
+            # Seed names and service data of devices BlueZ already knows, but
+            # only yield them once they are heard advertising again
+            objects = await self._get_managed_objects(bus)
+            for path, interfaces in objects.items():
+                if DEVICE_INTERFACE in interfaces and path.startswith(self.adapter_path + "/"):
+                    known[path] = self._device_from_properties(interfaces[DEVICE_INTERFACE], {})
+
+            await self._call(bus, BLUEZ_SERVICE, self.adapter_path, ADAPTER_INTERFACE,
+                             "SetDiscoveryFilter", "a{sv}", [self._discovery_filter()])
+            await self._call(bus, BLUEZ_SERVICE, self.adapter_path, ADAPTER_INTERFACE,
+                             "StartDiscovery", "", [])
+            logger.info(f"Started BlueZ discovery on {self.adapter} for {scan_time}s")
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    path, properties = await asyncio.wait_for(queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if not path.startswith(self.adapter_path + "/"):
+                    continue
+
+                device = self._device_from_properties(properties, known.get(path, {}))
+                known[path] = device
+                yield dict(device)
+
+                if discriminator is not None and device.get("discriminator") == discriminator:
+                    logger.info(f"Found device with discriminator {discriminator}, ending scan early")
+                    break
+                if stop_when is not None and stop_when(device):
+                    break
+
+        finally:
+            bus.remove_message_handler(handle_message)
+            try:
+                await self._call(bus, BLUEZ_SERVICE, self.adapter_path, ADAPTER_INTERFACE,
+                                 "StopDiscovery", "", [])
+            except Exception as e:
+                logger.warning(f"Could not stop BlueZ discovery: {e}")
+            bus.disconnect()
+
+    async def scan_devices(self, timeout: Optional[float] = None,
+                           discriminator: Optional[int] = None) -> List[Dict]:
+        """Collect streamed devices into a list, one entry per address"""
+        devices: Dict[str, Dict] = {}
+        async for device in self.stream_devices(timeout=timeout, discriminator=discriminator):
+            devices[device["address"]] = device
+        return list(devices.values())
+
+    def _discovery_filter(self) -> Dict:
+        return {
+            "Transport": Variant("s", "le"),
+            "DuplicateData": Variant("b", True)
+        }
+
+    def _device_from_properties(self, properties: Dict, previous: Dict) -> Dict:
+        """Merge BlueZ Device1 properties into the scanner's device dict"""
+        device = dict(previous) if previous else {
+            "address": None,
+            "name": "Unknown",
+            "type": "ble",
+            "rssi": None,
+            "uuids": [],
+            "service_data": {},
+            "manufacturer_data": {}
+        }
+
+        values = {key: getattr(value, "value", value) for key, value in properties.items()}
+        if "Address" in values:
+            device["address"] = values["Address"]
+        if "Name" in values or "Alias" in values:
+            device["name"] = values.get("Name") or values.get("Alias")
+        if "RSSI" in values:
+            device["rssi"] = values["RSSI"]
+        if "UUIDs" in values:
+            device["uuids"] = list(values["UUIDs"])
+        if "ServiceData" in values:
+            device["service_data"] = {
+                uuid: bytes(getattr(data, "value", data)).hex()
+                for uuid, data in values["ServiceData"].items()
+            }
+        if "ManufacturerData" in values:
+            device["manufacturer_data"] = {
+                company: bytes(getattr(data, "value", data)).hex()
+                for company, data in values["ManufacturerData"].items()
+            }
+
+        annotate_matter_device(device)
+        device["timestamp"] = time.time()
+        return device
+
+    async def _connect(self):
+        if self.bus_address:
+            return await MessageBus(bus_address=self.bus_address).connect()
+        return await MessageBus(bus_type=BusType.SYSTEM).connect()
+
+    async def _get_managed_objects(self, bus) -> Dict:
+        reply = await self._call(bus, BLUEZ_SERVICE, "/", OBJECT_MANAGER_INTERFACE,
+                                 "GetManagedObjects", "", [])
+        return reply.body[0]
+
+    async def _call(self, bus, destination: str, path: str, interface: str,
+                    member: str, signature: str, body: list):
+        reply = await bus.call(Message(
+            destination=destination,
+            path=path,
+            interface=interface,
+            member=member,
+            signature=signature,
+            body=body
+        ))
+        if reply.message_type == MessageType.ERROR:
+            detail = reply.body[0] if reply.body else reply.error_name
+            raise Exception(f"{member} failed: {detail}")
+        return reply
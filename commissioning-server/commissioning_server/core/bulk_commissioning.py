@@ -0,0 +1,202 @@
+"""
+Manifest-driven bulk commissioning
+
+A manifest lists devices by name and onboarding code. All payloads are
+decoded up front, devices onboarded with manual codes are matched to their
+BLE advertisements in one shared scan, and the devices are then fed to the
+commissioning job queue a limited number at a time. Every finished device
+is appended to the run's log file, so running the same manifest again
+skips the devices that already succeeded.
+"""
+
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .commissioning_jobs import CommissioningJobQueue, JobQueueFull, device_id_from_name
+from .config import Config
+from .setup_payload import parse_setup_payload
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FIELDS = ("device_name", "qr_code", "device_type")
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """Read a manifest from a CSV file with a header row or a JSON list
+
+    JSON may also be an object with a "devices" list. Each entry needs
+    device_name and qr_code; device_type is optional.
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".json"):
+            data = json.load(f)
+            rows = data.get("devices", []) if isinstance(data, dict) else data
+        else:
+            rows = list(csv.DictReader(f))
+
+    entries = []
+    for number, row in enumerate(rows, start=1):
+        entry = {field: (row.get(field) or "").strip() for field in MANIFEST_FIELDS}
+        if not entry["device_name"] or not entry["qr_code"]:
+            raise ValueError(f"Manifest entry {number} needs device_name and qr_code")
+        entries.append(entry)
+    return entries
+
+def manifest_run_id(entries: List[Dict[str, str]]) -> str:
+    """Stable id for a manifest, so re-running it resumes the same run"""
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(f"{entry['device_name']}\n{entry['qr_code']}\n".encode())
+    return digest.hexdigest()[:16]
+
+class BulkRunLog:
+    """Append-only JSON-lines record of finished devices in a bulk run"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, Dict]:
+        """Latest record per device_id"""
+        records: Dict[str, Dict] = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves at most one torn last line
+                    continue
+                records[record["device_id"]] = record
+        return records
+
+    def append(self, record: Dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class BulkCommissioner:
+    """Runs manifests through the commissioning job queue"""
+
+    def __init__(self, config: Config, matter_client, jobs: CommissioningJobQueue):
+        self.matter_client = matter_client
+        self.jobs = jobs
+        self.runs_dir = config.get("commissioning.bulk.runs_dir", "./bulk_runs")
+        self.default_concurrency = config.get("commissioning.bulk.concurrency", 0)
+        # Seconds to wait before submitting again when the job queue is full
+        self.queue_full_retry = 1
+        # Runs keep going when the client streaming their report disconnects
+        self._active: Dict[str, asyncio.Task] = {}
+
+    def is_running(self, run_id: str) -> bool:
+        task = self._active.get(run_id)
+        return task is not None and not task.done()
+
+    async def run(self, entries: List[Dict[str, str]], params: Dict[str, Any],
+                  run_id: Optional[str] = None, concurrency: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Commission every manifest entry, yielding report records as they happen
+
+        params holds the settings shared by all devices: network_ssid,
+        network_password, pi_ip and pi_user. Records are typed run, device
+        and summary.
+        """
+        run_id = run_id or manifest_run_id(entries)
+        if self.is_running(run_id):
+            raise RuntimeError(f"Bulk run {run_id} is already in progress")
+
+        os.makedirs(self.runs_dir, exist_ok=True)
+        log = BulkRunLog(os.path.join(self.runs_dir, f"{run_id}.jsonl"))
+        reports: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._execute(entries, params, run_id, concurrency, log, reports))
+        self._active[run_id] = task
+        task.add_done_callback(lambda _: self._active.pop(run_id, None))
+
+        while True:
+            record = await reports.get()
+            if record is None:
+                break
+            yield record
+        # Surface a crash of the run itself
+        await task
+
+    async def _execute(self, entries, params, run_id, concurrency, log: BulkRunLog, reports: asyncio.Queue):
+        try:
+            finished = log.load()
+            counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+
+            def report(record: Dict):
+                if record["type"] == "device":
+                    counts[record["status"]] += 1
+                reports.put_nowait(record)
+
+            report({"type": "run", "run_id": run_id, "devices": len(entries),
+                    "already_succeeded": sum(1 for r in finished.values() if r["status"] == "succeeded")})
+
+            # Decode every payload before touching the radio
+            pending = []
+            for entry in entries:
+                device_id = device_id_from_name(entry["device_name"])
+                base = {"type": "device", "run_id": run_id, "device_id": device_id,
+                        "device_name": entry["device_name"]}
+                if finished.get(device_id, {}).get("status") == "succeeded":
+                    report({**base, "status": "skipped", "node_id": finished[device_id].get("node_id")})
+                    continue
+                try:
+                    payload = parse_setup_payload(entry["qr_code"])
+                except ValueError as e:
+                    record = {**base, "status": "failed", "error": f"Invalid onboarding code: {e}"}
+                    log.append(record)
+                    report(record)
+                    continue
+                pending.append((entry, device_id, base, payload))
+
+            # One scan resolves the full discriminator of every manual-code device
+            manual = [item for item in pending if item[3]["has_short_discriminator"]]
+            ble_devices: Dict[str, Dict] = {}
+            if manual:
+                logger.info(f"Bulk run {run_id}: scanning for {len(manual)} devices with manual codes")
+                matches = await self.matter_client.find_commissionable_devices([item[3] for item in manual])
+                for item, device in zip(manual, matches):
+                    if device is not None:
+                        ble_devices[item[1]] = device
+
+            limit = concurrency or self.default_concurrency or self.jobs.worker_count
+            # More would only overflow the job queue
+            limit = min(limit, self.jobs.worker_count + self.jobs.max_queued)
+            semaphore = asyncio.Semaphore(limit)
+
+            async def commission(entry, device_id, base):
+                async with semaphore:
+                    job_params = {**params, **entry}
+                    if device_id in ble_devices:
+                        job_params["ble_device"] = ble_devices[device_id]
+                    while True:
+                        try:
+                            job = self.jobs.submit(device_id, job_params)
+                            break
+                        except JobQueueFull:
+                            # Jobs from outside this run fill the queue too; wait for room
+                            await asyncio.sleep(self.queue_full_retry)
+                    await job.wait()
+                    result = job.result or {}
+                    return {**base, "status": job.status, "job_id": job.id,
+                            "node_id": result.get("node_id"), "error": job.error}
+
+            tasks = [asyncio.create_task(commission(entry, device_id, base))
+                     for entry, device_id, base, _ in pending]
+            for next_done in asyncio.as_completed(tasks):
+                record = await next_done
+                log.append(record)
+                report(record)
+
+            report({"type": "summary", "run_id": run_id, **counts})
+        except Exception as e:
+            logger.error(f"Bulk run {run_id} failed: {e}")
+            reports.put_nowait({"type": "error", "run_id": run_id, "error": str(e)})
+        finally:
+            reports.put_nowait(None)
@@ -0,0 +1,300 @@
+"""
+Pool of long-lived chip-tool processes running in interactive server mode
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import shlex
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+from .chip_tool_storage import primary_fabric_exists, seed_storage
+from .config import Config
+from .metrics import SUBPROCESS_SPAWNS
+
+logger = logging.getLogger(__name__)
+
+class ChipToolWorker:
+    """A single chip-tool process driven over its interactive WebSocket server"""
+
+    def __init__(self, chip_tool_path: str, port: int, startup_timeout: int = 30,
+                 extra_args: Optional[List[str]] = None):
+        self.chip_tool_path = chip_tool_path
+        self.port = port
+        self.startup_timeout = startup_timeout
+        self.extra_args = extra_args or []
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.websocket = None
+        self.lock = asyncio.Lock()
+        self.started_at: Optional[float] = None
+        self.last_used: Optional[float] = None
+        self.commands_run = 0
+        self.restarts = 0
+
+    @property
+    def url(self) -> str:
+        return f"ws://localhost:{self.port}"
+
+    def is_alive(self) -> bool:
+        """Check whether the chip-tool process and its WebSocket are still usable"""
+        if self.process is None or self.process.returncode is not None:
+            return False
+        if self.websocket is None:
+            return False
+        return not _websocket_closed(self.websocket)
+
+    async def start(self):
+        """Start chip-tool in interactive server mode and connect to it"""
+        cmd = [
+            self.chip_tool_path,
+            "interactive", "server",
+            "--port", str(self.port)
+        ] + self.extra_args
+
+        logger.info(f"Starting chip-tool worker: {' '.join(cmd)}")
+        SUBPROCESS_SPAWNS.inc(program="chip-tool")
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+
+        # The Matter stack takes a moment to come up, so retry until the
+        # WebSocket server accepts connections or the process dies.
+        deadline = time.monotonic() + self.startup_timeout
+        last_error = None
+        while time.monotonic() < deadline:
+            if self.process.returncode is not None:
+                raise Exception(f"chip-tool worker exited during startup with code {self.process.returncode}")
+            try:
+                self.websocket = await websockets.connect(self.url, max_size=None)
+                self.started_at = time.time()
+                logger.info(f"chip-tool worker on port {self.port} ready (pid {self.process.pid})")
+                return
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                last_error = e
+                await asyncio.sleep(0.25)
+
+        await self.stop()
+        raise Exception(f"chip-tool worker on port {self.port} did not start: {last_error}")
+
+    async def stop(self):
+        """Close the WebSocket and terminate the chip-tool process"""
+        if self.websocket is not None:
+            try:
+                await self.websocket.close()
+            except Exception:
+                pass
+            self.websocket = None
+
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        self.process = None
+
+    async def restart(self):
+        """Replace a dead or wedged chip-tool process"""
+        await self.stop()
+        self.restarts += 1
+        await self.start()
+
+    async def run(self, args: List[str], timeout: int = 30) -> Dict:
+        """Send one command (without the chip-tool path) and wait for its framed response"""
+        async with self.lock:
+            if not self.is_alive():
+                logger.warning(f"chip-tool worker on port {self.port} is not running, restarting")
+                await self.restart()
+
+            try:
+                # The interactive server splits commands like a shell would
+                await self.websocket.send(shlex.join(args))
+                raw = await asyncio.wait_for(self.websocket.recv(), timeout=timeout)
+            except asyncio.TimeoutError:
+                # The worker may still be busy with the timed-out command and
+                # would answer the next caller with a stale frame.
+                logger.warning(f"chip-tool worker on port {self.port} timed out, restarting")
+                await self.restart()
+                return {
+                    "return_code": -1,
+                    "stdout": "",
+                    "stderr": f"Command timed out after {timeout} seconds"
+                }
+
+            self.commands_run += 1
+            self.last_used = time.time()
+            return _parse_response(raw)
+
+    def get_status(self) -> Dict:
+        """Get worker status"""
+        return {
+            "port": self.port,
+            "alive": self.is_alive(),
+            "pid": self.process.pid if self.process else None,
+            "started_at": self.started_at,
+            "last_used": self.last_used,
+            "commands_run": self.commands_run,
+            "restarts": self.restarts
+        }
+
+class ChipToolPool:
+    """Pool of warm chip-tool workers shared by MatterClient
+
+    Each worker runs on its own copy of the primary chip-tool storage, so
+    workers never share a storage directory with each other or with the
+    one-shot chip-tool processes (pairing, fabric management) that use the
+    primary storage. Without a primary fabric to copy no workers start and
+    every command runs as a one-shot process.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.matter_config = config.get_matter_config()
+        self.pool_config = self.matter_config.get("interactive_pool", {})
+        self.chip_tool_path = self.matter_config.get("chip_tool_path")
+        self.enabled = self.pool_config.get("enabled", True)
+        self.size = max(1, int(self.pool_config.get("size", 1)))
+        self.base_port = int(self.pool_config.get("base_port", 9002))
+        self.startup_timeout = self.pool_config.get("startup_timeout", 30)
+        self.health_interval = self.pool_config.get("health_interval", 15)
+        self.storage_root = self.pool_config.get("storage_root", "./chip-tool-storage")
+        self.seed_storage_dir = self.pool_config.get("seed_storage_dir", "/tmp")
+        self.workers: List[ChipToolWorker] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self.running = False
+
+    async def start(self):
+        """Start all workers and the supervisor task"""
+        if self.running:
+            return
+        if not primary_fabric_exists(self.seed_storage_dir):
+            logger.error(f"No chip-tool fabric in {self.seed_storage_dir} to give workers their own "
+                         f"storage; not starting the chip-tool pool")
+            return
+
+        self._idle = asyncio.Queue()
+        for index in range(self.size):
+            storage_dir = os.path.abspath(os.path.join(self.storage_root, f"worker-{index}"))
+            seed_storage(storage_dir, self.seed_storage_dir)
+            worker = ChipToolWorker(
+                self.chip_tool_path,
+                self.base_port + index,
+                startup_timeout=self.startup_timeout,
+                extra_args=["--storage-directory", storage_dir]
+            )
+            try:
+                await worker.start()
+            except Exception as e:
+                # The supervisor will keep retrying; run() restarts on demand too.
+                logger.error(f"Failed to start chip-tool worker {index}: {e}")
+            self.workers.append(worker)
+            self._idle.put_nowait(worker)
+
+        self.running = True
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info(f"chip-tool pool started with {self.size} worker(s)")
+
+    async def stop(self):
+        """Stop the supervisor and all workers"""
+        self.running = False
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+
+        for worker in self.workers:
+            await worker.stop()
+        self.workers = []
+        self._idle = None
+        logger.info("chip-tool pool stopped")
+
+    async def run(self, args: List[str], timeout: int = 30) -> Dict:
+        """Run a chip-tool command on the next idle worker"""
+        if not self.running:
+            raise Exception("chip-tool pool not running")
+
+        worker = await self._idle.get()
+        try:
+            return await worker.run(args, timeout=timeout)
+        except Exception as e:
+            logger.error(f"chip-tool worker on port {worker.port} failed: {e}")
+            return {
+                "return_code": -1,
+                "stdout": "",
+                "stderr": str(e)
+            }
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def _supervise(self):
+        """Restart workers whose process has died"""
+        while self.running:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                if worker.lock.locked() or worker.is_alive():
+                    continue
+                async with worker.lock:
+                    try:
+                        logger.warning(f"chip-tool worker on port {worker.port} died, restarting")
+                        await worker.restart()
+                    except Exception as e:
+                        logger.error(f"Failed to restart chip-tool worker on port {worker.port}: {e}")
+
+    def get_status(self) -> Dict:
+        """Get pool status"""
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "size": self.size,
+            "workers": [worker.get_status() for worker in self.workers]
+        }
+
+def _websocket_closed(websocket) -> bool:
+    """Check if a websockets connection is closed across library versions"""
+    closed = getattr(websocket, "closed", None)
+    if isinstance(closed, bool):
+        return closed
+    state = getattr(websocket, "state", None)
+    return state is not None and getattr(state, "name", "") in ("CLOSING", "CLOSED")
+
+def _parse_response(raw) -> Dict:
+    """Convert a chip-tool interactive server frame to the _run_command result shape"""
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+
+    try:
+        response = json.loads(raw)
+    except ValueError:
+        return {"return_code": 0, "stdout": raw, "stderr": ""}
+
+    lines = []
+    for log in response.get("logs", []):
+        message = log.get("message", "")
+        try:
+            message = base64.b64decode(message, validate=True).decode("utf-8")
+        except (ValueError, UnicodeDecodeError):
+            pass
+        lines.append(message)
+
+    results = response.get("results", [])
+    errors = [r.get("error") for r in results if isinstance(r, dict) and r.get("error")]
+
+    return {
+        "return_code": 1 if errors else 0,
+        "stdout": "\n".join(lines),
+        "stderr": "\n".join(str(e) for e in errors),
+        "results": results
+    }
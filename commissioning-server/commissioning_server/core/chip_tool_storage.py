@@ -0,0 +1,44 @@
+"""
+chip-tool storage directories that share the primary fabric
+
+chip-tool keeps its fabric (root CA and keys) in a storage directory, and
+two chip-tool processes must not use the same directory at once. Processes
+that run alongside each other therefore get their own directories, each
+seeded once from the primary storage so every copy commissions into and
+controls the same fabric.
+"""
+
+import glob
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+# chip-tool's storage file holding the fabric's root CA and keys
+PRIMARY_STORAGE_FILE = "chip_tool_config.ini"
+# Written into a storage directory once it holds a copy of the primary fabric
+SEED_MARKER = ".msh_seeded_from"
+
+def primary_fabric_exists(seed_storage_dir: str) -> bool:
+    """Check whether the primary chip-tool storage holds a fabric to seed copies with"""
+    return os.path.isfile(os.path.join(seed_storage_dir, PRIMARY_STORAGE_FILE))
+
+def seed_storage(storage_dir: str, seed_storage_dir: str):
+    """Make storage_dir a copy of the primary fabric, unless it already is one"""
+    if os.path.exists(os.path.join(storage_dir, SEED_MARKER)):
+        return
+    if os.path.isdir(storage_dir) and os.listdir(storage_dir):
+        # Storage chip-tool filled without a seed belongs to a fabric of its own
+        aside = f"{storage_dir}.unseeded-{int(time.time())}"
+        os.rename(storage_dir, aside)
+        logger.warning(f"Moved chip-tool storage {storage_dir} that was not seeded from the "
+                       f"primary fabric to {aside}")
+    os.makedirs(storage_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(seed_storage_dir, "chip_tool_*")):
+        if os.path.isfile(path):
+            shutil.copy2(path, storage_dir)
+    with open(os.path.join(storage_dir, SEED_MARKER), "w") as f:
+        f.write(os.path.abspath(seed_storage_dir) + "\n")
+    logger.info(f"Seeded chip-tool storage {storage_dir} from {seed_storage_dir}")
@@ -0,0 +1,118 @@
+"""
+Per-node Matter command scheduling
+
+Commands to the same node run one at a time, in submission order; different
+nodes run in parallel. A command that only sets state (on, off, move to
+level) replaces an identical-kind command still waiting at the tail of the
+node's queue, so a burst of clicks becomes one command carrying the last
+value. Every caller, including the superseded ones, gets the outcome of the
+command that actually ran.
+
+Kept in sync with Matter/app/command_queue.py; the bridge image is built
+from Matter/ only and cannot import this package.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class _QueuedCommand:
+    def __init__(self, key: Optional[Hashable], value: Any, send: Callable[[], Awaitable[Any]]):
+        self.key = key
+        self.value = value
+        self.send = send
+        self.futures: List[asyncio.Future] = []
+
+class NodeCommandQueue:
+    """Serialises commands per node and collapses superseded ones"""
+
+    def __init__(self, window: float = 0.05):
+        # How long an idle node waits for more commands before sending the first one
+        self.window = window
+        self._queues: Dict[Hashable, List[_QueuedCommand]] = {}
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+
+    async def submit(self, node_id: Hashable, send: Callable[[], Awaitable[Any]],
+                     key: Optional[Hashable] = None, value: Any = None) -> Any:
+        """Queue send() for a node and wait for the outcome
+
+        Commands with the same non-None key coalesce: if the last waiting
+        command for the node has this key it is replaced by this one.
+        """
+        self.submitted += 1
+        queue = self._queues.setdefault(node_id, [])
+        future = asyncio.get_running_loop().create_future()
+
+        if key is not None and queue and queue[-1].key == key:
+            entry = queue[-1]
+            entry.value = value
+            entry.send = send
+            self.coalesced += 1
+        else:
+            entry = _QueuedCommand(key, value, send)
+            queue.append(entry)
+        entry.futures.append(future)
+
+        worker = self._workers.get(node_id)
+        if worker is None or worker.done():
+            self._workers[node_id] = asyncio.create_task(self._drain(node_id))
+        # Shielded so a caller giving up does not cancel a command others wait on
+        return await asyncio.shield(future)
+
+    def pending_value(self, node_id: Hashable, key: Hashable, default: Any = None) -> Any:
+        """Value of the last waiting command with this key, e.g. a toggle's target state"""
+        for entry in reversed(self._queues.get(node_id, [])):
+            if entry.key == key:
+                return entry.value
+        return default
+
+    def get_status(self) -> Dict:
+        return {
+            "active_nodes": sum(1 for worker in self._workers.values() if not worker.done()),
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "coalesced": self.coalesced
+        }
+
+    async def close(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        for queue in self._queues.values():
+            for entry in queue:
+                for future in entry.futures:
+                    if not future.done():
+                        future.cancel()
+        self._queues.clear()
+
+    async def _drain(self, node_id: Hashable):
+        await asyncio.sleep(self.window)
+        queue = self._queues[node_id]
+        while queue:
+            entry = queue.pop(0)
+            try:
+                result = await entry.send()
+            except asyncio.CancelledError:
+                for future in entry.futures:
+                    future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Command for node {node_id} failed: {e}")
+                for future in entry.futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in entry.futures:
+                    if not future.done():
+                        future.set_result(result)
+            self.sent += 1
+        # Nothing awaits between the empty check and here, so no submit can be missed
+        self._queues.pop(node_id, None)
+        self._workers.pop(node_id, None)
@@ -0,0 +1,210 @@
+"""
+Asynchronous commissioning jobs run on a bounded worker pool
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .config import Config
+from .metrics import LONG_BUCKETS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Phases a commissioning job reports, in the order they happen
+JOB_PHASES = ["parse", "scan", "pase", "network", "case", "transfer"]
+
+COMMISSIONING_PHASE_SECONDS = REGISTRY.histogram(
+    "commissioning_phase_seconds",
+    "Time spent in each commissioning phase, until the next phase or the end of the job",
+    ["phase"],
+    buckets=LONG_BUCKETS
+)
+COMMISSIONING_JOB_SECONDS = REGISTRY.histogram(
+    "commissioning_job_seconds",
+    "Commissioning job run time, from a worker picking it up to the result",
+    ["status"],
+    buckets=LONG_BUCKETS
+)
+COMMISSIONING_JOB_WAIT_SECONDS = REGISTRY.histogram(
+    "commissioning_job_wait_seconds",
+    "Time commissioning jobs spend queued before a worker picks them up",
+    buckets=LONG_BUCKETS
+)
+
+class JobQueueFull(Exception):
+    """Too many commissioning jobs are already waiting"""
+
+def device_id_from_name(device_name: str) -> str:
+    """Device ID derived from a device name ("Office Socket_1" becomes office-socket-1)"""
+    device_id = device_name.lower().replace(" ", "-").replace("_", "-")
+    return device_id or f"device_{int(time.time())}"
+
+class CommissioningJob:
+    """State of one commissioning run"""
+
+    def __init__(self, device_id: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.device_id = device_id
+        # Everything the job needs to run; never exposed, it holds the network password
+        self.params = params
+        self.status = "queued"
+        self.phase: Optional[str] = None
+        self.phases: List[Dict] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = asyncio.Event()
+
+    async def wait(self):
+        """Wait until the job has finished"""
+        await self._done.wait()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "device_id": self.device_id,
+            "status": self.status,
+            "phase": self.phase,
+            "phases": self.phases,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class CommissioningJobQueue:
+    """Queue of commissioning jobs with a fixed number of workers
+
+    Listeners are awaited with (event, job_dict) on every job change, where
+    event is job_queued, job_phase or job_finished.
+    """
+
+    def __init__(self, config: Config, runner: Callable[["CommissioningJob", Callable[[str], None]], Awaitable[Dict]]):
+        jobs_config = config.get("commissioning.jobs", {})
+        # 0 runs one worker per BLE adapter, as one adapter pairs one device at a time
+        self.configured_workers = jobs_config.get("workers", 0)
+        self.worker_count = self.configured_workers or 1
+        self.max_queued = jobs_config.get("max_queued", 20)
+        self.max_finished = jobs_config.get("max_finished", 200)
+        self.runner = runner
+
+        self.jobs: "OrderedDict[str, CommissioningJob]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._listeners: List[Callable[[str, Dict], Awaitable[None]]] = []
+
+    def add_listener(self, listener: Callable[[str, Dict], Awaitable[None]]):
+        self._listeners.append(listener)
+
+    async def start(self, default_workers: int = 1):
+        """Start the workers; default_workers applies when the config leaves the count at 0"""
+        if not self._workers:
+            self.worker_count = self.configured_workers or max(1, default_workers)
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+            logger.info(f"Commissioning job queue started with {self.worker_count} workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, device_id: str, params: Dict[str, Any]) -> CommissioningJob:
+        """Queue a job, or return the unfinished job already commissioning this device"""
+        for job in self.jobs.values():
+            if job.device_id == device_id and not job.finished:
+                logger.info(f"Commissioning of {device_id} already in progress as job {job.id}")
+                return job
+
+        if self._queue.qsize() >= self.max_queued:
+            raise JobQueueFull(f"{self._queue.qsize()} commissioning jobs already queued")
+
+        job = CommissioningJob(device_id, params)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._prune()
+        self._emit("job_queued", job)
+        return job
+
+    def get(self, job_id: str) -> Optional[CommissioningJob]:
+        return self.jobs.get(job_id)
+
+    def get_status(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.worker_count,
+            "queued": self._queue.qsize(),
+            "jobs": counts
+        }
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            COMMISSIONING_JOB_WAIT_SECONDS.observe(job.started_at - job.created_at)
+            try:
+                job.result = await self.runner(job, lambda phase: self._set_phase(job, phase))
+                job.status = "succeeded" if job.result.get("success") else "failed"
+                if job.status == "failed":
+                    job.error = job.result.get("error")
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Server shutting down"
+                raise
+            except Exception as e:
+                logger.error(f"Commissioning job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._observe_phase(job, job.finished_at)
+                COMMISSIONING_JOB_SECONDS.observe(job.finished_at - job.started_at, status=job.status)
+                job._done.set()
+                self._queue.task_done()
+                self._emit("job_finished", job)
+
+    def _set_phase(self, job: CommissioningJob, phase: str):
+        if phase == job.phase:
+            return
+        now = time.time()
+        self._observe_phase(job, now)
+        job.phase = phase
+        job.phases.append({"phase": phase, "at": now})
+        logger.info(f"Commissioning job {job.id} ({job.device_id}): {phase}")
+        self._emit("job_phase", job)
+
+    def _observe_phase(self, job: CommissioningJob, ended_at: float):
+        """Record how long the job's current phase took"""
+        if job.phases:
+            COMMISSIONING_PHASE_SECONDS.observe(ended_at - job.phases[-1]["at"], phase=job.phase)
+
+    def _emit(self, event: str, job: CommissioningJob):
+        data = job.to_dict()
+        for listener in self._listeners:
+            asyncio.create_task(self._notify(listener, event, data))
+
+    async def _notify(self, listener, event: str, data: Dict):
+        try:
+            await listener(event, data)
+        except Exception as e:
+            logger.error(f"Commissioning job listener failed: {e}")
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
@@ -53,7 +53,8 @@ class Config:
             "server": {
                 "host": "0.0.0.0",
                 "port": 8080,
-                "debug": False
+                "debug": False,
+                "status_refresh_interval": 30
             },
             "matter": {
                 "sdk_path": "/usr/local/matter-sdk",
@@ -61,26 +62,70 @@ class Config:
                 "chip_repl_path": "/usr/local/bin/chip-repl",
                 "fabric_id": "1",
                 "node_id": "112233",
-                "optional": True  # Make Matter SDK optional
+                "optional": True,  # Make Matter SDK optional
+                "interactive_pool": {
+                    "enabled": True,
+                    "size": 1,
+                    "base_port": 9002,
+                    "startup_timeout": 30,
+                    "health_interval": 15,
+                    "storage_root": "./chip-tool-storage",
+                    "seed_storage_dir": "/tmp"
+                },
+                "command_coalesce_window": 0.05,
+                "node_id_mappings_path": "device_node_mappings.json",
+                "node_id_compact_threshold": 1000
+            },
+            "commissioning": {
+                "jobs": {
+                    "workers": 0,
+                    "max_queued": 20,
+                    "max_finished": 200
+                },
+                "bulk": {
+                    "runs_dir": "./bulk_runs",
+                    "concurrency": 0
+                }
             },
             "bluetooth": {
                 "adapter": "hci0",
                 "timeout": 30,
-                "scan_duration": 10
+                "scan_duration": 10,
+                "scan_backend": "dbus",  # "dbus" (streaming BlueZ signals) or "bluetoothctl"
+                "adapter_pool": {
+                    "adapters": [],  # empty: every HCI controller found
+                    "storage_root": "./chip-tool-storage",
+                    "seed_storage_dir": "/tmp"
+                },
+                "discovery": {
+                    "enabled": True,
+                    "cycle_duration": 30,
+                    "ttl": 120,
+                    "rssi_history": 10,
+                    "top_up_duration": 5
+                }
             },
             "storage": {
                 "type": "sqlite",
-                "path": "./credentials.db"
+                "path": "./credentials.db",
+                "read_connections": 2,
+                "busy_timeout": 5000
             },
             "security": {
                 "api_key_required": False,
                 "allowed_hosts": ["192.168.0.0/24"],
-                "encrypt_credentials": True
+                "encrypt_credentials": True,
+                "credential_key_path": "./credentials.key"
             },
             "pi": {
                 "default_ip": "192.168.0.107",
                 "default_user": "chregg",
-                "ssh_key_path": "~/.ssh/id_ed25519"
+                "ssh_key_path": "~/.ssh/id_ed25519",
+                "ssh_connect_timeout": 5,
+                "ssh_keepalive_interval": 15,
+                "ssh_keepalive_count": 3,
+                "ssh_control_persist": 600,
+                "transfer_dir": "/tmp"
             }
         }
     
@@ -0,0 +1,89 @@
+"""
+AES-GCM encryption for credential blobs stored in the credential store
+"""
+
+import base64
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    CRYPTOGRAPHY_AVAILABLE = True
+except ImportError:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Envelope: "<version>:<key id>:" + base64(nonce || ciphertext || tag)
+ENVELOPE_VERSION = "v1"
+NONCE_SIZE = 12
+MASTER_KEY_SIZE = 32
+HKDF_INFO = b"msh-commissioning credential store v1"
+
+class CredentialCipher:
+    """Encrypts and decrypts credential blobs with a key derived once and cached
+
+    The master secret is a random 32-byte key file, created on first use with
+    owner-only permissions. The AES-256-GCM data key is derived from it once
+    with HKDF, so per-row work is a single AEAD operation. The row's device id
+    is bound as associated data, so a blob copied onto another device's row
+    fails to decrypt.
+    """
+
+    def __init__(self, key_path: str):
+        self.key_path = key_path
+        self.key_id: Optional[str] = None
+        self._aead = None
+
+    @staticmethod
+    def is_available() -> bool:
+        return CRYPTOGRAPHY_AVAILABLE
+
+    def load_key(self):
+        """Load (or create) the master key and derive the cached data key"""
+        if not CRYPTOGRAPHY_AVAILABLE:
+            raise Exception("cryptography is not installed")
+
+        path = Path(self.key_path).expanduser()
+        if path.exists():
+            master_key = path.read_bytes()
+            if len(master_key) != MASTER_KEY_SIZE:
+                raise Exception(f"Credential key {path} must be {MASTER_KEY_SIZE} bytes")
+        else:
+            master_key = os.urandom(MASTER_KEY_SIZE)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(master_key)
+            logger.info(f"Generated new credential key at {path}")
+
+        data_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=HKDF_INFO).derive(master_key)
+        # A short fingerprint of the key lets a wrong key file be reported as such
+        self.key_id = HKDF(algorithm=hashes.SHA256(), length=4, salt=None,
+                           info=HKDF_INFO + b" key id").derive(master_key).hex()
+        self._aead = AESGCM(data_key)
+
+    def encrypt(self, plaintext: str, associated_data: str) -> str:
+        """Encrypt a string into a text envelope"""
+        nonce = os.urandom(NONCE_SIZE)
+        sealed = self._aead.encrypt(nonce, plaintext.encode(), associated_data.encode())
+        return f"{ENVELOPE_VERSION}:{self.key_id}:{base64.b64encode(nonce + sealed).decode()}"
+
+    def decrypt(self, envelope: str, associated_data: str) -> str:
+        """Decrypt a text envelope produced by encrypt()"""
+        version, key_id, payload = envelope.split(":", 2)
+        if version != ENVELOPE_VERSION:
+            raise ValueError(f"Unsupported credential envelope version {version}")
+        if key_id != self.key_id:
+            raise ValueError(f"Credential was encrypted with a different key ({key_id})")
+        sealed = base64.b64decode(payload)
+        plaintext = self._aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], associated_data.encode())
+        return plaintext.decode()
+
+    @staticmethod
+    def is_envelope(data: str) -> bool:
+        return data.startswith(ENVELOPE_VERSION + ":")
@@ -4,14 +4,131 @@ Credential store for Matter device credentials
 
 import json
 import logging
-import sqlite3
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
 from .config import Config
+from .credential_cipher import CredentialCipher
+from .metrics import REGISTRY
+from .sqlite_pool import SQLitePool
 
 logger = logging.getLogger(__name__)
 
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    "db_operation_seconds",
+    "Credential store SQLite operations, including waiting for a connection",
+    ["operation"]
+)
+
+# Versioned schema migrations, recorded in PRAGMA user_version. Databases
+# created before versioning have the version 1 tables and user_version 0;
+# the CREATE IF NOT EXISTS statements make version 1 a no-op for them.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT UNIQUE NOT NULL,
+            name TEXT,
+            type TEXT,
+            commissioning_type TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS credentials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            fabric_id TEXT,
+            node_id TEXT,
+            endpoint TEXT,
+            credentials_data TEXT,
+            encrypted BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (device_id) REFERENCES devices (device_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transfers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            pi_ip TEXT,
+            pi_user TEXT,
+            transfer_status TEXT,
+            transferred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (device_id) REFERENCES devices (device_id)
+        )
+        """
+    ]),
+    (2, [
+        # Re-commissioning used to append a credentials row each time; keep the latest
+        """
+        DELETE FROM credentials WHERE id NOT IN (
+            SELECT MAX(id) FROM credentials GROUP BY device_id
+        )
+        """,
+        # One credentials row per device, so INSERT OR REPLACE replaces it
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_credentials_device_id ON credentials (device_id)",
+        # Transfer history filtered by device and/or ordered by time
+        "CREATE INDEX IF NOT EXISTS idx_transfers_device_time ON transfers (device_id, transferred_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_transfers_time ON transfers (transferred_at, id)"
+    ])
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+# Statements are kept as constants so each connection compiles them once
+# and then serves them from sqlite3's statement cache
+UPSERT_DEVICE_SQL = """
+    INSERT OR REPLACE INTO devices 
+    (device_id, name, type, commissioning_type, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+UPSERT_CREDENTIALS_SQL = """
+    INSERT OR REPLACE INTO credentials 
+    (device_id, fabric_id, node_id, endpoint, credentials_data, encrypted)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+SELECT_CREDENTIALS_SQL = """
+    SELECT credentials_data, encrypted FROM credentials 
+    WHERE device_id = ?
+"""
+
+# Projectable fields of a credentials listing: (columns, default when NULL)
+CREDENTIAL_FIELDS = {
+    "device_id": (["c.device_id"], None),
+    "name": (["d.name"], "Unknown"),
+    "type": (["d.type"], "matter"),
+    "commissioning_type": (["d.commissioning_type"], "unknown"),
+    "fabric_id": (["c.fabric_id"], None),
+    "node_id": (["c.node_id"], None),
+    "endpoint": (["c.endpoint"], None),
+    "credentials": (["c.credentials_data", "c.encrypted"], None)
+}
+
+DEFAULT_CREDENTIAL_FIELDS = ["device_id", "name", "type", "commissioning_type", "credentials"]
+DEVICE_FIELDS = {"name", "type", "commissioning_type"}
+
+INSERT_TRANSFER_SQL = """
+    INSERT INTO transfers (device_id, pi_ip, pi_user, transfer_status)
+    VALUES (?, ?, ?, ?)
+"""
+
+SELECT_DEVICE_TRANSFERS_SQL = """
+    SELECT device_id, pi_ip, pi_user, transfer_status, transferred_at
+    FROM transfers WHERE device_id = ?
+    ORDER BY transferred_at DESC, id DESC
+"""
+
+SELECT_ALL_TRANSFERS_SQL = """
+    SELECT device_id, pi_ip, pi_user, transfer_status, transferred_at
+    FROM transfers
+    ORDER BY transferred_at DESC, id DESC
+"""
+
 class CredentialStore:
     """Secure storage for Matter device credentials"""
     
@@ -21,6 +138,13 @@ class CredentialStore:
         self.security_config = config.get_security_config()
         self.db_path = self.storage_config.get("path", "./credentials.db")
         self.encrypt_credentials = self.security_config.get("encrypt_credentials", True)
+        self.cipher = CredentialCipher(self.security_config.get("credential_key_path", "./credentials.key"))
+        self.pool = SQLitePool(
+            self.db_path,
+            readers=self.storage_config.get("read_connections", 2),
+            busy_timeout=self.storage_config.get("busy_timeout", 5000)
+        )
+        self.schema_version = 0
         self.initialized = False
         
     async def initialize(self):
@@ -30,7 +154,16 @@ class CredentialStore:
             db_dir = Path(self.db_path).parent
             db_dir.mkdir(parents=True, exist_ok=True)
             
-            # Create database and tables
+            # Derive the data key once; it also decrypts rows written while
+            # encryption was enabled, so load it whenever possible
+            if CredentialCipher.is_available():
+                self.cipher.load_key()
+            elif self.encrypt_credentials:
+                logger.warning("cryptography is not installed, storing credentials unencrypted")
+                self.encrypt_credentials = False
+            
+            # Open long-lived connections, then create tables
+            await self.pool.open()
             await self._create_tables()
             
             self.initialized = True
@@ -41,59 +174,31 @@ class CredentialStore:
             raise
     
     async def _create_tables(self):
-        """Create database tables"""
+        """Create database tables and bring the schema up to date"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create devices table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT UNIQUE NOT NULL,
-                    name TEXT,
-                    type TEXT,
-                    commissioning_type TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create credentials table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS credentials (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL,
-                    fabric_id TEXT,
-                    node_id TEXT,
-                    endpoint TEXT,
-                    credentials_data TEXT,
-                    encrypted BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (device_id) REFERENCES devices (device_id)
-                )
-            """)
-            
-            # Create transfers table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS transfers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL,
-                    pi_ip TEXT,
-                    pi_user TEXT,
-                    transfer_status TEXT,
-                    transferred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (device_id) REFERENCES devices (device_id)
-                )
-            """)
-            
-            conn.commit()
-            conn.close()
+            async with self.pool.reader() as conn:
+                async with conn.execute("PRAGMA user_version") as cursor:
+                    version = (await cursor.fetchone())[0]
+            
+            # Each migration runs in its own transaction together with the
+            # user_version bump, so an interrupted upgrade is simply retried
+            for target, statements in SCHEMA_MIGRATIONS:
+                if target <= version:
+                    continue
+                async with self.pool.transaction() as conn:
+                    for statement in statements:
+                        await conn.execute(statement)
+                    await conn.execute(f"PRAGMA user_version = {target}")
+                logger.info(f"Migrated credential store schema to version {target}")
+                version = target
+            
+            self.schema_version = version
             
         except Exception as e:
             logger.error(f"Error creating database tables: {e}")
             raise
     
+    @DB_OPERATION_SECONDS.time(operation="store_credentials")
     async def store_credentials(self, device_id: str, credentials: Dict, 
                               device_info: Optional[Dict] = None) -> bool:
         """Store device credentials"""
@@ -101,42 +206,30 @@ class CredentialStore:
             if not self.initialized:
                 raise Exception("Credential store not initialized")
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Store device info
-            if device_info:
-                cursor.execute("""
-                    INSERT OR REPLACE INTO devices 
-                    (device_id, name, type, commissioning_type, updated_at)
-                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (
-                    device_id,
-                    device_info.get("name", "Unknown"),
-                    device_info.get("type", "matter"),
-                    device_info.get("commissioning_type", "unknown")
-                ))
-            
-            # Store credentials
+            # Serialize before taking the writer so the transaction stays short
             credentials_json = json.dumps(credentials)
             if self.encrypt_credentials:
-                credentials_json = self._encrypt_data(credentials_json)
-            
-            cursor.execute("""
-                INSERT OR REPLACE INTO credentials 
-                (device_id, fabric_id, node_id, endpoint, credentials_data, encrypted)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                device_id,
-                credentials.get("fabric_id"),
-                credentials.get("node_id"),
-                credentials.get("endpoint"),
-                credentials_json,
-                self.encrypt_credentials
-            ))
-            
-            conn.commit()
-            conn.close()
+                credentials_json = self._encrypt_data(credentials_json, device_id)
+            
+            async with self.pool.transaction() as conn:
+                # Store device info
+                if device_info:
+                    await conn.execute(UPSERT_DEVICE_SQL, (
+                        device_id,
+                        device_info.get("name", "Unknown"),
+                        device_info.get("type", "matter"),
+                        device_info.get("commissioning_type", "unknown")
+                    ))
+                
+                # Store credentials
+                await conn.execute(UPSERT_CREDENTIALS_SQL, (
+                    device_id,
+                    credentials.get("fabric_id"),
+                    credentials.get("node_id"),
+                    credentials.get("endpoint"),
+                    credentials_json,
+                    self.encrypt_credentials
+                ))
             
             logger.info(f"Stored credentials for device {device_id}")
             return True
@@ -145,27 +238,21 @@ class CredentialStore:
             logger.error(f"Error storing credentials for device {device_id}: {e}")
             return False
     
+    @DB_OPERATION_SECONDS.time(operation="get_credentials")
     async def get_credentials(self, device_id: str) -> Optional[Dict]:
         """Get stored credentials for a device"""
         try:
             if not self.initialized:
                 raise Exception("Credential store not initialized")
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT credentials_data, encrypted FROM credentials 
-                WHERE device_id = ?
-            """, (device_id,))
-            
-            result = cursor.fetchone()
-            conn.close()
+            async with self.pool.reader() as conn:
+                async with conn.execute(SELECT_CREDENTIALS_SQL, (device_id,)) as cursor:
+                    result = await cursor.fetchone()
             
             if result:
                 credentials_data, encrypted = result
                 if encrypted:
-                    credentials_data = self._decrypt_data(credentials_data)
+                    credentials_data = self._decrypt_data(credentials_data, device_id)
                 
                 return json.loads(credentials_data)
             else:
@@ -178,63 +265,135 @@ class CredentialStore:
     async def get_all_credentials(self) -> List[Dict]:
         """Get all stored device credentials"""
         try:
-            if not self.initialized:
-                raise Exception("Credential store not initialized")
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT c.device_id, c.credentials_data, c.encrypted,
-                       d.name, d.type, d.commissioning_type
-                FROM credentials c
-                LEFT JOIN devices d ON c.device_id = d.device_id
-            """)
-            
-            results = cursor.fetchall()
-            conn.close()
-            
-            credentials = []
-            for result in results:
-                device_id, credentials_data, encrypted, name, device_type, commissioning_type = result
-                
-                if encrypted:
-                    credentials_data = self._decrypt_data(credentials_data)
-                
-                credentials.append({
-                    "device_id": device_id,
-                    "name": name or "Unknown",
-                    "type": device_type or "matter",
-                    "commissioning_type": commissioning_type or "unknown",
-                    "credentials": json.loads(credentials_data)
-                })
-            
-            return credentials
-            
+            return [credentials async for credentials in self.iter_credentials()]
         except Exception as e:
             logger.error(f"Error getting all credentials: {e}")
             return []
     
+    async def get_credentials_page(self, after_device_id: Optional[str] = None, limit: int = 100,
+                                   fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get one page of device credentials ordered by device_id
+        
+        Pass the last device_id of a page as after_device_id to get the next one.
+        """
+        try:
+            return [credentials async for credentials in self.iter_credentials(
+                after_device_id=after_device_id, limit=limit, fields=fields
+            )]
+        except Exception as e:
+            logger.error(f"Error getting credentials page: {e}")
+            return []
+    
+    async def iter_credentials(self, after_device_id: Optional[str] = None, limit: Optional[int] = None,
+                               fields: Optional[List[str]] = None,
+                               batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Yield device credentials in device_id order, decoding each row only when it is consumed
+        
+        Rows are read in keyset batches, so a reader connection is only held
+        while a batch is fetched, never while a slow consumer works through it.
+        Credential blobs are only decrypted and decoded when "credentials" is
+        among the requested fields.
+        """
+        if not self.initialized:
+            raise Exception("Credential store not initialized")
+        
+        fields = list(fields or DEFAULT_CREDENTIAL_FIELDS)
+        sql = self._select_credentials_sql(fields) + " WHERE c.device_id > ? ORDER BY c.device_id LIMIT ?"
+        
+        # '' sorts before every device_id
+        cursor_id = after_device_id or ""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch = batch_size if remaining is None else min(batch_size, remaining)
+            with DB_OPERATION_SECONDS.time(operation="iter_credentials_batch"):
+                async with self.pool.reader() as conn:
+                    async with conn.execute(sql, (cursor_id, batch)) as cursor:
+                        rows = await cursor.fetchall()
+            
+            for row in rows:
+                yield self._row_to_credentials(row, fields)
+            
+            if len(rows) < batch:
+                break
+            cursor_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+    
+    @DB_OPERATION_SECONDS.time(operation="get_credentials_many")
+    async def get_credentials_many(self, device_ids: List[str],
+                                   fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get the credentials listing entries of several devices in one query
+        
+        Devices without stored credentials are left out of the result.
+        """
+        if not self.initialized:
+            raise Exception("Credential store not initialized")
+        
+        fields = list(fields or DEFAULT_CREDENTIAL_FIELDS)
+        device_ids = list(dict.fromkeys(device_ids))
+        entries = []
+        # Stay well below SQLite's bound parameter limit
+        for start in range(0, len(device_ids), 500):
+            chunk = device_ids[start:start + 500]
+            sql = (self._select_credentials_sql(fields) +
+                   f" WHERE c.device_id IN ({', '.join('?' * len(chunk))}) ORDER BY c.device_id")
+            async with self.pool.reader() as conn:
+                async with conn.execute(sql, chunk) as cursor:
+                    rows = await cursor.fetchall()
+            entries.extend(self._row_to_credentials(row, fields) for row in rows)
+        return entries
+    
+    def _select_credentials_sql(self, fields: List[str]) -> str:
+        """SELECT ... FROM for the requested listing fields, device_id first"""
+        unknown = [field for field in fields if field not in CREDENTIAL_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown credential fields: {', '.join(unknown)}")
+        
+        # device_id is always selected to drive the keyset
+        columns = ["c.device_id"]
+        for field in fields:
+            if field != "device_id":
+                columns.extend(CREDENTIAL_FIELDS[field][0])
+        sql = f"SELECT {', '.join(columns)} FROM credentials c"
+        if DEVICE_FIELDS.intersection(fields):
+            sql += " LEFT JOIN devices d ON c.device_id = d.device_id"
+        return sql
+    
+    def _row_to_credentials(self, row, fields: List[str]) -> Dict:
+        """Build a credentials listing entry from a row selected by iter_credentials"""
+        # device_id is the pagination key, so it is always part of the entry
+        entry = {"device_id": row[0]}
+        values = iter(row[1:])
+        for field in fields:
+            if field == "device_id":
+                continue
+            if field == "credentials":
+                credentials_data, encrypted = next(values), next(values)
+                if encrypted:
+                    credentials_data = self._decrypt_data(credentials_data, row[0])
+                entry["credentials"] = json.loads(credentials_data)
+            else:
+                value = next(values)
+                default = CREDENTIAL_FIELDS[field][1]
+                entry[field] = (value or default) if default is not None else value
+        return entry
+    
+    @DB_OPERATION_SECONDS.time(operation="delete_credentials")
     async def delete_credentials(self, device_id: str) -> bool:
         """Delete stored credentials for a device"""
         try:
             if not self.initialized:
                 raise Exception("Credential store not initialized")
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Delete credentials
-            cursor.execute("DELETE FROM credentials WHERE device_id = ?", (device_id,))
-            
-            # Delete device info
-            cursor.execute("DELETE FROM devices WHERE device_id = ?", (device_id,))
-            
-            # Delete transfer records
-            cursor.execute("DELETE FROM transfers WHERE device_id = ?", (device_id,))
-            
-            conn.commit()
-            conn.close()
+            async with self.pool.transaction() as conn:
+                # Delete credentials
+                await conn.execute("DELETE FROM credentials WHERE device_id = ?", (device_id,))
+                
+                # Delete device info
+                await conn.execute("DELETE FROM devices WHERE device_id = ?", (device_id,))
+                
+                # Delete transfer records
+                await conn.execute("DELETE FROM transfers WHERE device_id = ?", (device_id,))
             
             logger.info(f"Deleted credentials for device {device_id}")
             return True
@@ -243,6 +402,7 @@ class CredentialStore:
             logger.error(f"Error deleting credentials for device {device_id}: {e}")
             return False
     
+    @DB_OPERATION_SECONDS.time(operation="record_transfer")
     async def record_transfer(self, device_id: str, pi_ip: str, pi_user: str, 
                             status: str = "success") -> bool:
         """Record a credential transfer to Pi"""
@@ -250,16 +410,8 @@ class CredentialStore:
             if not self.initialized:
                 raise Exception("Credential store not initialized")
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO transfers (device_id, pi_ip, pi_user, transfer_status)
-                VALUES (?, ?, ?, ?)
-            """, (device_id, pi_ip, pi_user, status))
-            
-            conn.commit()
-            conn.close()
+            async with self.pool.transaction() as conn:
+                await conn.execute(INSERT_TRANSFER_SQL, (device_id, pi_ip, pi_user, status))
             
             logger.info(f"Recorded transfer for device {device_id} to {pi_user}@{pi_ip}")
             return True
@@ -268,30 +420,39 @@ class CredentialStore:
             logger.error(f"Error recording transfer for device {device_id}: {e}")
             return False
     
-    async def get_transfer_history(self, device_id: Optional[str] = None) -> List[Dict]:
-        """Get transfer history"""
+    @DB_OPERATION_SECONDS.time(operation="record_transfers")
+    async def record_transfers(self, results: Dict[str, str], pi_ip: str, pi_user: str) -> bool:
+        """Record the per-device outcome ({device_id: status}) of a bulk transfer in one transaction"""
         try:
             if not self.initialized:
                 raise Exception("Credential store not initialized")
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            async with self.pool.transaction() as conn:
+                await conn.executemany(INSERT_TRANSFER_SQL, [
+                    (device_id, pi_ip, pi_user, status) for device_id, status in results.items()
+                ])
             
-            if device_id:
-                cursor.execute("""
-                    SELECT device_id, pi_ip, pi_user, transfer_status, transferred_at
-                    FROM transfers WHERE device_id = ?
-                    ORDER BY transferred_at DESC
-                """, (device_id,))
-            else:
-                cursor.execute("""
-                    SELECT device_id, pi_ip, pi_user, transfer_status, transferred_at
-                    FROM transfers
-                    ORDER BY transferred_at DESC
-                """)
+            logger.info(f"Recorded {len(results)} transfers to {pi_user}@{pi_ip}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error recording bulk transfer to {pi_ip}: {e}")
+            return False
+    
+    @DB_OPERATION_SECONDS.time(operation="get_transfer_history")
+    async def get_transfer_history(self, device_id: Optional[str] = None) -> List[Dict]:
+        """Get transfer history"""
+        try:
+            if not self.initialized:
+                raise Exception("Credential store not initialized")
             
-            results = cursor.fetchall()
-            conn.close()
+            async with self.pool.reader() as conn:
+                if device_id:
+                    cursor = await conn.execute(SELECT_DEVICE_TRANSFERS_SQL, (device_id,))
+                else:
+                    cursor = await conn.execute(SELECT_ALL_TRANSFERS_SQL)
+                results = await cursor.fetchall()
+                await cursor.close()
             
             transfers = []
             for result in results:
@@ -310,19 +471,19 @@ class CredentialStore:
             logger.error(f"Error getting transfer history: {e}")
             return []
     
-    def _encrypt_data(self, data: str) -> str:
-        """Encrypt data (placeholder - implement proper encryption)"""
-        # TODO: Implement proper encryption
-        # For now, just return the data as-is
-        return data
+    def _encrypt_data(self, data: str, device_id: str) -> str:
+        """Encrypt a credentials blob, bound to its device id"""
+        return self.cipher.encrypt(data, device_id)
     
-    def _decrypt_data(self, data: str) -> str:
-        """Decrypt data (placeholder - implement proper decryption)"""
-        # TODO: Implement proper decryption
-        # For now, just return the data as-is
-        return data
+    def _decrypt_data(self, data: str, device_id: str) -> str:
+        """Decrypt a credentials blob"""
+        # Rows written by the old placeholder are flagged encrypted but hold plain JSON
+        if not CredentialCipher.is_envelope(data):
+            return data
+        return self.cipher.decrypt(data, device_id)
     
     async def cleanup(self):
         """Cleanup credential store"""
         self.initialized = False
+        await self.pool.close()
         logger.info("Credential store cleaned up") 
\ No newline at end of file
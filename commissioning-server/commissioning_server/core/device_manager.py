@@ -3,13 +3,19 @@ Device manager for handling device operations and Pi transfers
 """
 
 import asyncio
-import subprocess
+import io
 import logging
+import tarfile
+import time
 from typing import Dict, Any, Optional, List
 from pathlib import Path
 import json
+import shlex
 from datetime import datetime
 
+from .setup_payload import parse_setup_payload
+from .ssh_transport import SSHTransport
+
 logger = logging.getLogger(__name__)
 
 class DeviceManager:
@@ -17,46 +23,20 @@ class DeviceManager:
     
     def __init__(self, config):
         self.config = config
-        self.ssh_key_path = config.get("ssh_key_path", "~/.ssh/backup_key")
+        self.transport = SSHTransport(config)
         self.transfer_timeout = config.get("transfer_timeout", 300)
+        self.transfer_dir = config.get("pi.transfer_dir", "/tmp")
         
-    async def transfer_credentials_to_pi(self, device_id: str, commissioning_result: Dict, pi_ip: str) -> Dict:
+    async def transfer_credentials_to_pi(self, device_id: str, commissioning_result: Dict, pi_ip: str,
+                                         pi_user: Optional[str] = None) -> Dict:
         """Transfer device credentials to Raspberry Pi"""
         try:
-            # Extract commissioning data
-            device_name = commissioning_result.get("device_name", "Unknown Device")
-            device_type = commissioning_result.get("device_type", "Unknown Type")
-            qr_code = commissioning_result.get("qr_code", "")
-            network_ssid = commissioning_result.get("network_ssid", "")
-            discriminator_used = commissioning_result.get("discriminator_used", "")
-            qr_discriminator = commissioning_result.get("qr_discriminator", "")
-            is_nous_device = commissioning_result.get("is_nous_device", False)
-            commissioning_method = commissioning_result.get("method", "unknown")
-            
-            # Create commissioning data structure
-            commissioning_data = {
-                "device_id": device_id,
-                "device_name": device_name,
-                "device_type": device_type,
-                "manufacturer": "NOUS" if is_nous_device else "Unknown",
-                "vendor_id": "0x125D" if is_nous_device else "Unknown",
-                "product_id": "0x06BC" if is_nous_device else "Unknown",
-                "discriminator": discriminator_used,
-                "qr_discriminator": qr_discriminator,
-                "passcode": self._extract_passcode_from_qr(qr_code),
-                "qr_code": qr_code,
-                "network_ssid": network_ssid,
-                "commissioning_method": commissioning_method,
-                "attestation_bypassed": is_nous_device,  # NOUS devices require attestation bypass
-                "commissioning_timestamp": datetime.now().isoformat(),
-                "device_addresses": self._extract_device_addresses(commissioning_result),
-                "is_nous_device": is_nous_device
-            }
+            commissioning_data = self._build_commissioning_data(device_id, commissioning_result)
             
             logger.info(f"Transferring commissioning data to Pi: {commissioning_data}")
             
             # Transfer data to Pi via SSH
-            success = await self._transfer_data_via_ssh(commissioning_data, pi_ip)
+            success = await self._transfer_data_via_ssh(commissioning_data, pi_ip, pi_user)
             
             if success:
                 return {
@@ -78,12 +58,52 @@ class DeviceManager:
                 "message": f"Error transferring credentials: {str(e)}"
             }
 
+    def _build_commissioning_data(self, device_id: str, commissioning_result: Dict) -> Dict:
+        """The commissioning_data_<device_id>.json document the Pi imports"""
+        device_name = commissioning_result.get("device_name", "Unknown Device")
+        device_type = commissioning_result.get("device_type", "Unknown Type")
+        qr_code = commissioning_result.get("qr_code", "")
+        network_ssid = commissioning_result.get("network_ssid", "")
+        discriminator_used = commissioning_result.get("discriminator_used", "")
+        qr_discriminator = commissioning_result.get("qr_discriminator", "")
+        is_nous_device = commissioning_result.get("is_nous_device", False)
+        commissioning_method = commissioning_result.get("method", "unknown")
+        
+        # Create commissioning data structure
+        commissioning_data = {
+            "device_id": device_id,
+            "device_name": device_name,
+            "device_type": device_type,
+            "manufacturer": "NOUS" if is_nous_device else "Unknown",
+            "vendor_id": "0x125D" if is_nous_device else "Unknown",
+            "product_id": "0x06BC" if is_nous_device else "Unknown",
+            "discriminator": discriminator_used,
+            "qr_discriminator": qr_discriminator,
+            "passcode": self._extract_passcode_from_qr(qr_code),
+            "qr_code": qr_code,
+            "network_ssid": network_ssid,
+            "commissioning_method": commissioning_method,
+            "attestation_bypassed": is_nous_device,  # NOUS devices require attestation bypass
+            "commissioning_timestamp": datetime.now().isoformat(),
+            "device_addresses": self._extract_device_addresses(commissioning_result),
+            "is_nous_device": is_nous_device
+        }
+        return commissioning_data
+
+    def _stored_commissioning_data(self, device: Dict) -> Dict:
+        """Commissioning data for a credential store entry, in the same format as a single transfer"""
+        credentials = device.get("credentials") or {}
+        return self._build_commissioning_data(device["device_id"], {
+            **credentials,
+            "device_name": device.get("name") or credentials.get("device_name", "Unknown Device"),
+            "device_type": device.get("type") or credentials.get("device_type", "Unknown Type"),
+            "method": credentials.get("method") or device.get("commissioning_type", "unknown")
+        })
+
     def _extract_passcode_from_qr(self, qr_code: str) -> str:
-        """Extract passcode from QR code using chip-tool"""
+        """Extract passcode from a QR code or manual pairing code"""
         try:
-            # This would need to be implemented with actual chip-tool call
-            # For now, return a placeholder
-            return "85064361"  # Known NOUS passcode
+            return str(parse_setup_payload(qr_code)["passcode"])
         except Exception as e:
             logger.error(f"Failed to extract passcode from QR code: {e}")
             return ""
@@ -114,32 +134,15 @@ class DeviceManager:
         
         return addresses
 
-    async def _transfer_data_via_ssh(self, commissioning_data: Dict, pi_ip: str) -> bool:
+    async def _transfer_data_via_ssh(self, commissioning_data: Dict, pi_ip: str,
+                                     pi_user: Optional[str] = None) -> bool:
         """Transfer commissioning data to Pi via SSH"""
         try:
-            # Create JSON file with commissioning data
-            import json
-            import tempfile
-            import os
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                json.dump(commissioning_data, f, indent=2)
-                temp_file = f.name
-            
-            # Transfer file to Pi
-            ssh_cmd = [
-                "scp", 
-                "-i", self.ssh_key_path,
-                "-o", "StrictHostKeyChecking=no",
-                temp_file,
-                f"pi@{pi_ip}:/tmp/commissioning_data_{commissioning_data['device_id']}.json"
-            ]
+            # Stream the JSON over the shared connection's stdin, no temp file
+            remote_path = f"{self.transfer_dir}/{self._transfer_filename(commissioning_data['device_id'])}"
+            data = json.dumps(commissioning_data, indent=2).encode()
             
-            result = await self._run_command(ssh_cmd, timeout=30)
-            
-            # Clean up temporary file
-            os.unlink(temp_file)
+            result = await self.transport.write_file(pi_ip, pi_user, remote_path, data, timeout=30)
             
             if result["return_code"] == 0:
                 logger.info(f"Successfully transferred commissioning data to Pi")
@@ -152,16 +155,73 @@ class DeviceManager:
             logger.error(f"Error in SSH transfer: {e}")
             return False
     
+    async def transfer_devices_to_pi(self, devices: List[Dict], pi_ip: str,
+                                     pi_user: Optional[str] = None) -> Dict:
+        """Transfer many devices' stored credentials to a Pi as one compressed archive
+        
+        devices are credential store entries. Each is converted to the
+        commissioning data a single transfer sends and becomes
+        commissioning_data_<device_id>.json in the Pi's transfer directory.
+        The archive is extracted on the Pi as it streams in, and a device
+        counts as transferred once tar reports its file.
+        """
+        try:
+            archive = self._build_archive(devices)
+            remote_dir = self.transfer_dir
+            command = f"mkdir -p {shlex.quote(remote_dir)} && tar -xzvf - -C {shlex.quote(remote_dir)}"
+            
+            logger.info(f"Transferring {len(devices)} devices ({len(archive)} bytes) to Pi at {pi_ip}")
+            result = await self.transport.run(pi_ip, pi_user, command, input_data=archive,
+                                              timeout=self.transfer_timeout)
+            
+            extracted = {Path(line.strip()).name for line in result["stdout"].splitlines()}
+            results = {
+                device["device_id"]: "success" if self._transfer_filename(device["device_id"]) in extracted else "failed"
+                for device in devices
+            }
+            transferred = sum(status == "success" for status in results.values())
+            if result["return_code"] != 0:
+                logger.error(f"Bulk transfer to {pi_ip} failed: {result['stderr']}")
+            
+            return {
+                "success": result["return_code"] == 0 and transferred == len(devices),
+                "message": f"Transferred {transferred}/{len(devices)} devices to Pi at {pi_ip}",
+                "archive_bytes": len(archive),
+                "results": results,
+                "error": result["stderr"].strip() if result["return_code"] != 0 else None
+            }
+            
+        except Exception as e:
+            logger.error(f"Error in bulk transfer to Pi: {e}")
+            return {
+                "success": False,
+                "message": f"Error transferring credentials: {str(e)}",
+                "results": {device["device_id"]: "failed" for device in devices}
+            }
+    
+    def _build_archive(self, devices: List[Dict]) -> bytes:
+        """Pack one commissioning data JSON file per device into an in-memory tar.gz"""
+        buffer = io.BytesIO()
+        now = time.time()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for device in devices:
+                data = json.dumps(self._stored_commissioning_data(device), indent=2).encode()
+                info = tarfile.TarInfo(self._transfer_filename(device["device_id"]))
+                info.size = len(data)
+                info.mtime = now
+                info.mode = 0o600
+                archive.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+    
+    def _transfer_filename(self, device_id: str) -> str:
+        # Device ids end up in remote paths; never let one climb out of the transfer dir
+        return f"commissioning_data_{device_id.replace('/', '_')}.json"
+    
     async def ping_pi(self, pi_ip: str, pi_user: str = "chregg") -> bool:
         """Test connectivity to Raspberry Pi"""
         try:
-            cmd = [
-                "ssh", "-i", self.ssh_key_path, "-o", "ConnectTimeout=5",
-                f"{pi_user}@{pi_ip}", "echo", "ping-success"
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            return result.returncode == 0 and "ping-success" in result.stdout
+            result = await self.transport.run(pi_ip, pi_user, "echo ping-success", timeout=10)
+            return result["return_code"] == 0 and "ping-success" in result["stdout"]
             
         except Exception as e:
             logger.error(f"Pi ping failed: {e}")
@@ -170,14 +230,9 @@ class DeviceManager:
     async def get_pi_status(self, pi_ip: str, pi_user: str = "chregg") -> Dict[str, Any]:
         """Get status information from Raspberry Pi"""
         try:
-            cmd = [
-                "ssh", "-i", self.ssh_key_path, "-o", "ConnectTimeout=5",
-                f"{pi_user}@{pi_ip}", "echo", "status-check"
-            ]
+            result = await self.transport.run(pi_ip, pi_user, "echo status-check", timeout=10)
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
+            if result["return_code"] == 0:
                 return {
                     "connected": True,
                     "pi_ip": pi_ip,
@@ -187,7 +242,7 @@ class DeviceManager:
                 return {
                     "connected": False,
                     "pi_ip": pi_ip,
-                    "error": result.stderr
+                    "error": result["stderr"]
                 }
                 
         except Exception as e:
@@ -195,4 +250,12 @@ class DeviceManager:
                 "connected": False,
                 "pi_ip": pi_ip,
                 "error": str(e)
-            } 
\ No newline at end of file
+            }
+    
+    def get_transport_status(self) -> Dict[str, Any]:
+        """Get health of the SSH connections to Pis"""
+        return self.transport.get_status()
+    
+    async def cleanup(self):
+        """Close SSH connections to Pis"""
+        await self.transport.close()
@@ -8,68 +8,85 @@ import logging
 import os
 import subprocess
 import tempfile
-import time
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
+from .adapter_pool import BLEAdapterPool
+from .ble_advertisement import matches_payload
+from .ble_discovery import BLE_SCAN_SECONDS, BLEDiscoveryService
+from .ble_scanner import BLEScanner
+from .chip_tool_pool import ChipToolPool
+from .command_queue import NodeCommandQueue
 from .config import Config
+from .metrics import DEFAULT_BUCKETS, REGISTRY, SUBPROCESS_SPAWNS, chip_tool_labels
+from .node_id_store import NodeIdStore
+from .setup_payload import parse_setup_payload
 
 logger = logging.getLogger(__name__)
 
+# chip-tool (cluster, command) pairs that set absolute state, so a newer one
+# waiting for the same node and endpoint makes an older one pointless
+COALESCABLE_COMMANDS = {
+    ("onoff", "on"),
+    ("onoff", "off"),
+    ("levelcontrol", "move-to-level"),
+}
+
+# chip-tool log markers for commissioning phases, checked against each output line
+COMMISSIONING_PHASE_MARKERS = [
+    ("pase", ("PBKDFParamRequest", "SecurePairing", "Establishing PASE")),
+    ("network", ("WiFiNetworkSetup", "WiFiNetworkEnable", "NetworkCommissioning")),
+    ("case", ("FindOperational", "Sigma1", "CASE session")),
+]
+
+# chip-tool subcommands that must not run on a shared interactive worker:
+# pairing holds the BLE adapter for minutes and the rest manage chip-tool itself
+UNPOOLED_COMMANDS = {"pairing", "interactive", "fabric", "node"}
+
+NOUS_VENDOR_ID = 0x125D
+
+CHIP_TOOL_COMMAND_SECONDS = REGISTRY.histogram(
+    "chip_tool_command_seconds",
+    "chip-tool command latency by cluster and command; "
+    "mode is pool for warm interactive workers, spawn for a new process",
+    ["cluster", "command", "mode"],
+    buckets=DEFAULT_BUCKETS + (60, 120, 300)
+)
+CHIP_TOOL_COMMAND_FAILURES = REGISTRY.counter(
+    "chip_tool_command_failures_total",
+    "chip-tool commands that exited non-zero, timed out or failed to run, by cluster and command",
+    ["cluster", "command"]
+)
+
 class MatterClient:
     """Client for interacting with Matter SDK tools"""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, ble_scanner: Optional[BLEScanner] = None,
+                 discovery: Optional[BLEDiscoveryService] = None):
         self.config = config
+        self.ble_scanner = ble_scanner or BLEScanner(config)
+        self.discovery = discovery
         self.matter_config = config.get_matter_config()
         self.chip_tool_path = self.matter_config.get("chip_tool_path")
         self.chip_repl_path = self.matter_config.get("chip_repl_path")
         self.fabric_id = self.matter_config.get("fabric_id", "1")
         self.base_node_id = self.matter_config.get("node_id", "112233")
         self.initialized = False
-        # Store device to Node ID mappings
-        self.device_node_mappings = {}
-        self.mappings_file = Path("device_node_mappings.json")
-        self._load_device_mappings()
-        
-    def _load_device_mappings(self):
-        """Load device-to-Node-ID mappings from file"""
-        try:
-            if self.mappings_file.exists():
-                with open(self.mappings_file, 'r') as f:
-                    self.device_node_mappings = json.load(f)
-                logger.info(f"Loaded {len(self.device_node_mappings)} device mappings")
-        except Exception as e:
-            logger.warning(f"Failed to load device mappings: {e}")
-            self.device_node_mappings = {}
-            
-    def _save_device_mappings(self):
-        """Save device-to-Node-ID mappings to file"""
-        try:
-            with open(self.mappings_file, 'w') as f:
-                json.dump(self.device_node_mappings, f, indent=2)
-            logger.info(f"Saved {len(self.device_node_mappings)} device mappings")
-        except Exception as e:
-            logger.error(f"Failed to save device mappings: {e}")
-        
-    def _generate_unique_node_id(self, device_id: str) -> str:
-        """Generate a unique Node ID for a device"""
-        # Use device_id hash + timestamp to ensure uniqueness
-        timestamp = int(time.time() * 1000) % 0xFFFFFFFF  # 32 bits of timestamp
-        device_hash = hash(device_id) % 0xFFFFFFFF  # 32 bits of device hash
-        # Create a 64-bit Node ID by combining timestamp and device hash
-        unique_id = (timestamp << 32) | device_hash
-        return f"{unique_id:016X}"  # Format as 16-character hex string (64-bit)
+        self.pool = ChipToolPool(config)
+        self.adapters = BLEAdapterPool(config)
+        self.command_queue = NodeCommandQueue(self.matter_config.get("command_coalesce_window", 0.05))
+        # Device to Node ID mappings, appended to a log and compacted into the JSON snapshot
+        self.node_ids = NodeIdStore(
+            self.matter_config.get("node_id_mappings_path", "device_node_mappings.json"),
+            self.matter_config.get("node_id_compact_threshold", 1000)
+        )
+        self.device_node_mappings = self.node_ids.mappings
         
     def _get_node_id_for_device(self, device_id: str) -> str:
-        """Get or generate Node ID for a device"""
-        if device_id not in self.device_node_mappings:
-            node_id = self._generate_unique_node_id(device_id)
-            self.device_node_mappings[device_id] = node_id
-            self._save_device_mappings()  # Save when new mapping is created
-            logger.info(f"Generated Node ID {node_id} for device {device_id}")
-        return self.device_node_mappings[device_id]
+        """Get or allocate the Node ID for a device"""
+        return self.node_ids.get_or_allocate(device_id)
     
     async def initialize(self):
         """Initialize the Matter SDK client"""
@@ -82,6 +99,8 @@ class MatterClient:
                 if self.matter_config.get("optional", False):
                     logger.warning("Matter SDK tools not found, running in limited mode")
                     self.initialized = False
+                    # Commissioning runs get one BLE adapter each, even in limited mode
+                    self.adapters.discover()
                     return
                 else:
                     raise Exception("Matter SDK tools not found")
@@ -89,6 +108,13 @@ class MatterClient:
             # Initialize chip-tool
             await self._initialize_chip_tool()
             
+            # After the fabric exists, so extra adapters are seeded with it
+            self.adapters.discover()
+            
+            # Keep warm chip-tool sessions for control and read commands
+            if self.pool.enabled:
+                await self.pool.start()
+            
             self.initialized = True
             logger.info("Matter SDK client initialized successfully")
             
@@ -171,7 +197,10 @@ class MatterClient:
                 "fabric_id": self.fabric_id,
                 "base_node_id": self.base_node_id,
                 "device_mappings_count": len(self.device_node_mappings),
-                "fabrics": fabric_info
+                "fabrics": fabric_info,
+                "interactive_pool": self.pool.get_status(),
+                "ble_adapters": self.adapters.get_status(),
+                "command_queue": self.command_queue.get_status()
             }
             
         except Exception as e:
@@ -183,8 +212,16 @@ class MatterClient:
     
     async def commission_device(self, device_id: str, commissioning_type: str, 
                               qr_code: Optional[str] = None, manual_code: Optional[str] = None,
-                              network_ssid: Optional[str] = None, network_password: Optional[str] = None) -> Dict:
-        """Commission a Matter device"""
+                              network_ssid: Optional[str] = None, network_password: Optional[str] = None,
+                              progress: Optional[Callable[[str], None]] = None,
+                              ble_device: Optional[Dict] = None) -> Dict:
+        """Commission a Matter device
+        
+        progress, if given, is called with each phase as it starts: parse,
+        scan, then pase, network and case as chip-tool reaches them.
+        ble_device is the device's advertisement when a caller has already
+        found it (see find_commissionable_devices), which skips the scan.
+        """
         try:
             if not self.initialized:
                 raise Exception("Matter SDK client not initialized")
@@ -202,12 +239,17 @@ class MatterClient:
                 commissioning_data["network_ssid"] = network_ssid
             if network_password:
                 commissioning_data["network_password"] = network_password
+            if ble_device:
+                commissioning_data["ble_device"] = ble_device
             
             if commissioning_type == "ble":
-                result = await self._commission_ble(device_id, commissioning_data)
+                result = await self._commission_ble(device_id, commissioning_data, progress)
             else:  # wifi
                 result = await self._commission_wifi(device_id, commissioning_data)
             
+            if not result.get("success"):
+                raise Exception(result.get("error", "Commissioning failed"))
+            
             return {
                 "success": True,
                 "device_id": device_id,
@@ -224,9 +266,12 @@ class MatterClient:
                 "error": str(e)
             }
     
-    async def _commission_ble(self, device_id: str, commissioning_data: Dict) -> Dict:
+    async def _commission_ble(self, device_id: str, commissioning_data: Dict,
+                              progress: Optional[Callable[[str], None]] = None) -> Dict:
         """Commission device via BLE using the reliable BLE-WiFi method"""
+        report = progress or (lambda phase: None)
         try:
+            report("parse")
             qr_code = commissioning_data.get("qr_code")
             network_ssid = commissioning_data.get("network_ssid")
             network_password = commissioning_data.get("network_password")
@@ -236,63 +281,42 @@ class MatterClient:
             if not network_ssid or not network_password:
                 raise Exception("Network SSID and password are required for BLE-WiFi commissioning")
             
-            # Parse QR code to get passcode
-            parse_cmd = [
-                self.chip_tool_path,
-                "payload", "parse-setup-payload",
-                qr_code
-            ]
-            
-            logger.info(f"Parsing QR code with command: {' '.join(parse_cmd)}")
-            parse_result = await self._run_command(parse_cmd, timeout=30)
-            
-            if parse_result["return_code"] != 0:
-                raise Exception(f"Failed to parse QR code: {parse_result['stderr']}")
+            # Decode the onboarding payload (QR or manual code) natively
+            try:
+                payload = parse_setup_payload(qr_code)
+            except ValueError as e:
+                raise Exception(f"Failed to parse QR code: {e}")
             
-            # Extract passcode from parse output
-            stdout = parse_result["stdout"]
-            passcode = None
-            for line in stdout.split('\n'):
-                if "Passcode:" in line:
-                    passcode = line.split("Passcode:")[1].strip()
-                    break
-            
-            if not passcode:
-                raise Exception("Could not extract passcode from QR code")
+            passcode = str(payload["passcode"])
+            qr_discriminator = str(
+                payload["short_discriminator"] if payload["has_short_discriminator"]
+                else payload["discriminator"]
+            )
             
             logger.info(f"QR code parsing - passcode: {passcode}")
             
-            # For NOUS devices, we need to detect the actual discriminator via BLE scan
-            # Check if this is a NOUS device (based on device type or QR code pattern)
+            # Manual codes only carry the upper 4 bits of the discriminator, so
+            # resolve the full one from the device's Matter BLE advertisement
+            discriminator = None
+            advertisement = None
+            report("scan")
+            if payload["has_short_discriminator"]:
+                logger.info("Looking up advertised discriminator for manual pairing code")
+                device = commissioning_data.get("ble_device") or await self._find_commissionable_device(payload)
+                if device:
+                    advertisement = device["matter"]
+                    discriminator = str(device["discriminator"])
+                    logger.info(f"Found device {device['address']} advertising discriminator {discriminator}")
+            
             is_nous_device = (
+                (advertisement is not None and advertisement["vendor_id"] == NOUS_VENDOR_ID) or
                 commissioning_data.get("device_type", "").lower().find("nous") != -1 or
                 qr_code.startswith("0150-")  # NOUS QR code pattern
             )
             
-            discriminator = None
-            if is_nous_device:
-                logger.info("Detected NOUS device - scanning for actual discriminator")
-                # Scan for Matter devices to find actual discriminator
-                scan_result = await self._scan_for_matter_devices()
-                if scan_result and "devices" in scan_result:
-                    for device in scan_result["devices"]:
-                        if device.get("name", "").find("MATTER") != -1:
-                            # Extract discriminator from device name (e.g., "MATTER-0097" -> 97)
-                            name = device.get("name", "")
-                            if "-" in name:
-                                try:
-                                    discriminator = name.split("-")[-1]
-                                    logger.info(f"Found NOUS device with actual discriminator: {discriminator}")
-                                    break
-                                except (ValueError, IndexError):
-                                    continue
-            
             if not discriminator:
-                # Fallback: try to extract from QR code parsing
-                for line in stdout.split('\n'):
-                    if "Short discriminator:" in line:
-                        discriminator = line.split("Short discriminator:")[1].split(" ")[0].strip()
-                        break
+                # Fallback: use the discriminator from the onboarding payload
+                discriminator = qr_discriminator
             
             if not discriminator:
                 raise Exception("Could not determine discriminator for device")
@@ -316,7 +340,12 @@ class MatterClient:
             ]
             
             logger.info(f"Starting BLE-WiFi commissioning with command: {' '.join(cmd)}")
-            result = await self._run_command(cmd, timeout=300)
+            # Concurrent runs each pair through their own adapter and chip-tool storage
+            async with self.adapters.acquire() as adapter:
+                cmd += adapter.chip_tool_args()
+                logger.info(f"Pairing {device_id} through {adapter.name}")
+                async with self._ble_adapter_released(adapter.name):
+                    result = await self._run_command(cmd, timeout=300, on_line=self._phase_tracker(report))
             
             logger.info(f"Commissioning result - return_code: {result['return_code']}")
             if result["stderr"]:
@@ -330,8 +359,10 @@ class MatterClient:
                     "credentials": credentials,
                     "method": "ble-wifi",
                     "discriminator_used": discriminator,
+                    "qr_discriminator": qr_discriminator,
                     "passcode_used": passcode,
                     "node_id": node_id,
+                    "advertisement": advertisement,
                     "is_nous_device": is_nous_device
                 }
             else:
@@ -347,36 +378,57 @@ class MatterClient:
                 "method": "ble-wifi"
             }
 
-    async def _scan_for_matter_devices(self) -> Dict:
-        """Scan for Matter devices to detect actual discriminators"""
+    async def _find_commissionable_device(self, payload: Dict) -> Optional[Dict]:
+        """Find the device advertising an onboarding payload's discriminator/VID/PID in one scan"""
+        return (await self.find_commissionable_devices([payload]))[0]
+    
+    async def find_commissionable_devices(self, payloads: List[Dict]) -> List[Optional[Dict]]:
+        """Match several onboarding payloads to advertising devices with one shared scan
+        
+        Returns the matched device (or None) for each payload, in order. A
+        device is matched to at most one payload.
+        """
+        matches: List[Optional[Dict]] = [None] * len(payloads)
+        
+        def record(device: Dict) -> bool:
+            """Assign the device to the first unmatched payload it fits; True once all are matched"""
+            if not any(match is not None and match["address"] == device["address"] for match in matches):
+                for index, payload in enumerate(payloads):
+                    if matches[index] is None and matches_payload(device, payload):
+                        matches[index] = device
+                        break
+            return all(match is not None for match in matches)
+        
+        if not payloads:
+            return matches
+        
+        # A failed scan leaves payloads unmatched; callers fall back to the
+        # discriminator in the onboarding payload
         try:
-            # Use bluetoothctl to scan for Matter devices
-            cmd = ["bluetoothctl", "scan", "on"]
-            await self._run_command(cmd, timeout=10)
-            
-            # Get scan results
-            cmd = ["bluetoothctl", "devices"]
-            result = await self._run_command(cmd, timeout=5)
-            
-            devices = []
-            if result["return_code"] == 0:
-                for line in result["stdout"].split('\n'):
-                    if "MATTER" in line:
-                        # Parse device info (e.g., "Device F8:17:2D:7F:BB:0D MATTER-0097")
-                        parts = line.split()
-                        if len(parts) >= 3:
-                            mac = parts[1]
-                            name = " ".join(parts[2:])
-                            devices.append({
-                                "mac": mac,
-                                "name": name
-                            })
-            
-            return {"devices": devices}
-            
+            # The background discovery cache already holds recent advertisements
+            if self.discovery is not None and self.discovery.running:
+                with BLE_SCAN_SECONDS.time(kind="commissioning_lookup"):
+                    await self.discovery.wait_for_device(record, timeout=self.ble_scanner.timeout)
+                return matches
+            
+            with BLE_SCAN_SECONDS.time(kind="commissioning_scan"):
+                async for device in self.ble_scanner.stream_devices(
+                    timeout=self.ble_scanner.timeout,
+                    stop_when=record
+                ):
+                    record(device)
         except Exception as e:
-            logger.error(f"Failed to scan for Matter devices: {e}")
-            return {"devices": []}
+            logger.warning(f"BLE lookup of commissionable devices failed: {e}")
+        return matches
+    
+    @asynccontextmanager
+    async def _ble_adapter_released(self, adapter: Optional[str] = None):
+        """Pause background BLE discovery while chip-tool uses its adapter"""
+        if self.discovery is None or (adapter is not None and adapter != self.ble_scanner.adapter):
+            yield
+        else:
+            async with self.discovery.paused():
+                yield
     
     async def _commission_wifi(self, device_id: str, commissioning_data: Dict) -> Dict:
         """Commission device via WiFi"""
@@ -416,7 +468,11 @@ class MatterClient:
     
     async def control_device(self, device_id: str, cluster: str, command: str, 
                            endpoint: str = "1", **kwargs) -> Dict:
-        """Control a commissioned device"""
+        """Control a commissioned device
+        
+        Commands are queued per node; a state-setting command still waiting
+        behind another is replaced by a newer one of the same kind.
+        """
         try:
             if not self.initialized:
                 raise Exception("Matter SDK client not initialized")
@@ -424,6 +480,26 @@ class MatterClient:
             # Get or generate Node ID for the device
             node_id = self._get_node_id_for_device(device_id)
             
+            key = (cluster, endpoint) if (cluster, command) in COALESCABLE_COMMANDS else None
+            return await self.command_queue.submit(
+                node_id,
+                lambda: self._send_control_command(device_id, node_id, cluster, command, endpoint, kwargs),
+                key=key,
+                value=command
+            )
+                
+        except Exception as e:
+            logger.error(f"Error controlling device {device_id}: {e}")
+            return {
+                "success": False,
+                "device_id": device_id,
+                "error": str(e)
+            }
+    
+    async def _send_control_command(self, device_id: str, node_id: str, cluster: str, command: str,
+                                    endpoint: str, kwargs: Dict) -> Dict:
+        """Run one control command with chip-tool"""
+        try:
             # Build chip-tool command with correct format
             cmd = [
                 self.chip_tool_path,
@@ -502,8 +578,32 @@ class MatterClient:
                 "error": str(e)
             }
     
-    async def _run_command(self, cmd: List[str], timeout: int = 30) -> Dict:
-        """Run a command and return the result"""
+    async def _run_command(self, cmd: List[str], timeout: int = 30,
+                           on_line: Optional[Callable[[str], None]] = None) -> Dict:
+        """Run a command and return the result
+        
+        on_line, if given, is called with each stdout line as it is printed.
+        """
+        pooled = on_line is None and self._use_pool(cmd)
+        labels = chip_tool_labels(cmd[1:])
+        try:
+            with CHIP_TOOL_COMMAND_SECONDS.time(**labels, mode="pool" if pooled else "spawn"):
+                if pooled:
+                    result = await self.pool.run(cmd[1:], timeout=timeout)
+                else:
+                    result = await self._spawn_command(cmd, timeout, on_line)
+        except Exception:
+            # Timeouts raised rather than reported; cancellation is not a failure
+            CHIP_TOOL_COMMAND_FAILURES.inc(**labels)
+            raise
+        if result["return_code"] != 0:
+            CHIP_TOOL_COMMAND_FAILURES.inc(**labels)
+        return result
+    
+    async def _spawn_command(self, cmd: List[str], timeout: int,
+                             on_line: Optional[Callable[[str], None]]) -> Dict:
+        """Run a command in a new process"""
+        SUBPROCESS_SPAWNS.inc(program=os.path.basename(cmd[0]))
         try:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
@@ -511,10 +611,17 @@ class MatterClient:
                 stderr=asyncio.subprocess.PIPE
             )
             
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=timeout
-            )
+            if on_line is None:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(),
+                    timeout=timeout
+                )
+            else:
+                stdout, stderr = await asyncio.wait_for(
+                    asyncio.gather(self._read_lines(process.stdout, on_line), process.stderr.read()),
+                    timeout=timeout
+                )
+                await process.wait()
             
             return {
                 "return_code": process.returncode,
@@ -536,6 +643,35 @@ class MatterClient:
                 "stderr": str(e)
             }
     
+    async def _read_lines(self, stream: asyncio.StreamReader, on_line: Callable[[str], None]) -> bytes:
+        """Read a stream to the end, passing each line to on_line"""
+        chunks = []
+        async for line in stream:
+            chunks.append(line)
+            on_line(line.decode('utf-8', errors='replace'))
+        return b"".join(chunks)
+    
+    def _phase_tracker(self, report: Callable[[str], None]) -> Callable[[str], None]:
+        """Line callback reporting commissioning phases as chip-tool's log reaches them"""
+        reached = [-1]
+        
+        def on_line(line: str):
+            for index, (phase, markers) in enumerate(COMMISSIONING_PHASE_MARKERS):
+                if index > reached[0] and any(marker in line for marker in markers):
+                    reached[0] = index
+                    report(phase)
+        
+        return on_line
+    
+    def _use_pool(self, cmd: List[str]) -> bool:
+        """Check if a command can be sent to a warm interactive chip-tool worker"""
+        return (
+            self.pool.running and
+            len(cmd) > 1 and
+            cmd[0] == self.chip_tool_path and
+            cmd[1] not in UNPOOLED_COMMANDS
+        )
+    
     def _parse_fabric_list(self, output: str) -> Dict:
         """Parse fabric list output from chip-tool"""
         fabrics = {}
@@ -596,5 +732,7 @@ class MatterClient:
     
     async def cleanup(self):
         """Cleanup Matter SDK client"""
+        await self.command_queue.close()
+        await self.pool.stop()
         self.initialized = False
         logger.info("Matter SDK client cleaned up") 
\ No newline at end of file
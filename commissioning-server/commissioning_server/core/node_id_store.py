@@ -0,0 +1,144 @@
+"""
+Persistent device_id -> Matter node id mappings
+
+Mappings are held in a dict loaded once at startup. The snapshot file is
+plain JSON (the format device_node_mappings.json has always had); every new
+mapping is appended to a sibling .log file as one fsync'd JSON line, so
+adding a device costs one small write however many devices exist. Once the
+log grows past compact_threshold entries it is folded into a new snapshot,
+written to a temp file and renamed over the old one. A crash at any point
+leaves either the old or the new snapshot plus a log that replays cleanly;
+a torn last log line is dropped by compacting on load.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Operational node ids are 0x0000_0000_0000_0001..0xFFFF_FFEF_FFFF_FFFF;
+# everything above is reserved for group, temporary and PAKE key ids
+MAX_OPERATIONAL_NODE_ID = 0xFFFFFFEFFFFFFFFF
+
+class NodeIdStore:
+    """Append-only, compacting store of device node ids"""
+
+    def __init__(self, path: str, compact_threshold: int = 1000):
+        self.path = Path(path)
+        self.log_path = self.path.with_name(self.path.name + ".log")
+        self.compact_threshold = compact_threshold
+
+        self.mappings: Dict[str, str] = {}
+        self._used: Set[int] = set()
+        self._log_entries = 0
+        self._load()
+
+    def get(self, device_id: str) -> Optional[str]:
+        return self.mappings.get(device_id)
+
+    def get_or_allocate(self, device_id: str) -> str:
+        """The device's node id, allocating and persisting one on first use"""
+        node_id = self.mappings.get(device_id)
+        if node_id is not None:
+            return node_id
+
+        node_id = f"{self._allocate(device_id):016X}"
+        self._append(device_id, node_id)
+        self._set(device_id, node_id)
+        logger.info(f"Allocated Node ID {node_id} for device {device_id}")
+        if self._log_entries >= self.compact_threshold:
+            self.compact()
+        return node_id
+
+    def compact(self):
+        """Fold the log into a new snapshot"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.mappings, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._fsync_dir()
+        # Everything in the log is now in the snapshot; replaying it again would be harmless
+        with open(self.log_path, 'w') as f:
+            os.fsync(f.fileno())
+        self._log_entries = 0
+        logger.info(f"Compacted {len(self.mappings)} device mappings into {self.path}")
+
+    def __len__(self) -> int:
+        return len(self.mappings)
+
+    def _allocate(self, device_id: str) -> int:
+        """Deterministic node id for a device, probing past ids already taken"""
+        attempt = 0
+        while True:
+            digest = hashlib.sha256(f"{device_id}:{attempt}".encode()).digest()
+            candidate = int.from_bytes(digest[:8], "big")
+            if 0 < candidate <= MAX_OPERATIONAL_NODE_ID and candidate not in self._used:
+                return candidate
+            attempt += 1
+
+    def _set(self, device_id: str, node_id: str):
+        previous = self.mappings.get(device_id)
+        if previous is not None:
+            self._used.discard(int(previous, 16))
+        self.mappings[device_id] = node_id
+        self._used.add(int(node_id, 16))
+
+    def _append(self, device_id: str, node_id: str):
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps({"device_id": device_id, "node_id": node_id}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_entries += 1
+
+    def _load(self):
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    snapshot = json.load(f)
+                for device_id, node_id in snapshot.items():
+                    int(node_id, 16)
+            except (ValueError, TypeError, AttributeError) as e:
+                # Compacting would replace the snapshot with whatever the log
+                # holds, so keep the unreadable one for recovery by hand
+                aside = self.path.with_name(f"{self.path.name}.corrupt-{int(time.time())}")
+                os.replace(self.path, aside)
+                logger.error(f"Device mappings snapshot {self.path} is unreadable ({e}), moved to {aside}")
+            else:
+                for device_id, node_id in snapshot.items():
+                    self._set(device_id, node_id)
+
+        torn = False
+        if self.log_path.exists():
+            with open(self.log_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._set(entry["device_id"], entry["node_id"])
+                    except (ValueError, KeyError):
+                        # Only the last line can be torn, by a crash mid-append
+                        logger.warning(f"Skipping unreadable device mapping log entry: {line!r}")
+                        torn = True
+                        continue
+                    self._log_entries += 1
+
+        logger.info(f"Loaded {len(self.mappings)} device mappings")
+        if torn:
+            # Appending after a torn line would glue the next entry onto it
+            self.compact()
+
+    def _fsync_dir(self):
+        try:
+            fd = os.open(self.path.parent, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -8,7 +8,10 @@ import subprocess
 import time
 from typing import Dict, List, Optional, Tuple
 
+from .ble_advertisement import annotate_matter_device, parse_bluetoothctl_service_data
+from .bluez_scanner import DBUS_AVAILABLE, BlueZScanner
 from .config import Config
+from .metrics import SUBPROCESS_SPAWNS
 
 logger = logging.getLogger(__name__)
 
@@ -114,6 +117,16 @@ class NordicBLEScanner:
             
             logger.info(f"Starting enhanced BLE scan for {scan_time} seconds...")
             
+            # BlueZ D-Bus reports RSSI and service data with each advertisement
+            if DBUS_AVAILABLE:
+                try:
+                    devices = await BlueZScanner(self.config).scan_devices(timeout=scan_time)
+                    matter_devices = self._filter_matter_devices_enhanced(devices)
+                    logger.info(f"Enhanced scan found {len(matter_devices)} Matter devices")
+                    return matter_devices
+                except Exception as e:
+                    logger.warning(f"BlueZ D-Bus scan failed, falling back to bluetoothctl: {e}")
+            
             # Start scanning with Nordic optimizations
             scan_cmd = [
                 "bluetoothctl", 
@@ -203,31 +216,29 @@ class NordicBLEScanner:
             return False
     
     def _filter_matter_devices_enhanced(self, devices: List[Dict]) -> List[Dict]:
-        """Enhanced filtering for Matter devices with Nordic-specific criteria"""
+        """Keep devices advertising Matter commissionable service data (UUID 0xFFF6)"""
         matter_devices = []
         
         for device in devices:
-            # Enhanced Matter device detection
-            name = device.get("name", "").lower()
+            name = device.get("name", "")
             address = device.get("address", "")
-            rssi = device.get("rssi", -100)
+            rssi = device.get("rssi")
             
             # Check RSSI filter
-            if rssi < self.filter_rssi:
+            if rssi is not None and rssi < self.filter_rssi:
                 continue
             
-            # Enhanced Matter device detection criteria
-            matter_indicators = [
-                "matter", "chip", "thread", "nous", "a8m", 
-                "philips", "hue", "ikea", "tradfri"
-            ]
-            
-            if any(indicator in name for indicator in matter_indicators):
+            annotate_matter_device(device)
+            if device["matter"]:
                 device["type"] = "matter"
                 device["nordic_optimized"] = True
                 device["scan_method"] = "enhanced"
                 matter_devices.append(device)
-                logger.info(f"Enhanced Matter device detected: {name} ({address}) RSSI: {rssi}")
+                logger.info(
+                    f"Enhanced Matter device detected: {name} ({address}) RSSI: {rssi} "
+                    f"discriminator: {device['discriminator']} "
+                    f"VID/PID: 0x{device['vendor_id']:04X}/0x{device['product_id']:04X}"
+                )
         
         return matter_devices
     
@@ -255,7 +266,10 @@ class NordicBLEScanner:
             ])
             
             if result["return_code"] == 0:
-                return self._parse_devices_enhanced(result["stdout"])
+                devices = self._parse_devices_enhanced(result["stdout"])
+                for device in devices:
+                    await self._add_advertisement_info(device)
+                return devices
             else:
                 logger.error(f"Failed to get devices: {result['stderr']}")
                 return []
@@ -264,6 +278,26 @@ class NordicBLEScanner:
             logger.error(f"Error getting discovered devices: {e}")
             return []
     
+    async def _add_advertisement_info(self, device: Dict):
+        """Fill in RSSI and service data from `bluetoothctl info`"""
+        result = await self._run_command([
+            "bluetoothctl",
+            "info", device["address"]
+        ], timeout=5)
+        if result["return_code"] != 0:
+            return
+        
+        device["service_data"] = parse_bluetoothctl_service_data(result["stdout"])
+        rssi = self._parse_device_info_enhanced(result["stdout"]).get("RSSI")
+        if rssi:
+            # Newer BlueZ prints "0xffffffc2 (-62)"
+            if "(" in rssi:
+                rssi = rssi.split("(")[1].rstrip(")")
+            try:
+                device["rssi"] = int(rssi)
+            except ValueError:
+                pass
+    
     def _parse_devices_enhanced(self, output: str) -> List[Dict]:
         """Enhanced device parsing with Nordic-specific information"""
         devices = []
@@ -316,6 +350,7 @@ class NordicBLEScanner:
     
     async def _run_command(self, cmd: List[str], timeout: int = 30) -> Dict:
         """Run a command and return the result"""
+        SUBPROCESS_SPAWNS.inc(program=cmd[0])
         try:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
@@ -0,0 +1,294 @@
+"""
+Matter onboarding payload decoding (Base38 QR codes and manual pairing codes)
+
+Kept in sync with Matter/app/setup_payload.py; the bridge image is built
+from Matter/ only and cannot import this package.
+"""
+
+import struct
+from typing import Dict, Optional, Tuple
+
+QR_CODE_PREFIX = "MT:"
+BASE38_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-."
+
+# Base38 character -> value, indexed by ord(); -1 marks invalid characters
+_BASE38_VALUES = [-1] * 128
+for _index, _char in enumerate(BASE38_ALPHABET):
+    _BASE38_VALUES[ord(_char)] = _index
+
+# Base38 chunk length -> number of bytes it encodes
+_BASE38_CHUNK_BYTES = {5: 3, 4: 2, 2: 1}
+
+# Fixed QR payload header: version(3) vid(16) pid(16) flow(2) discovery(8)
+# discriminator(12) passcode(27) padding(4) = 88 bits
+QR_HEADER_BYTES = 11
+
+# Onboarding optional data TLV tags (Matter Core spec 5.1.5)
+OPTIONAL_DATA_TAGS = {
+    0x00: "serial_number",
+    0x01: "pbkdf_iterations",
+    0x02: "pbkdf_salt",
+    0x03: "number_of_devices",
+    0x04: "commissioning_timeout"
+}
+
+INVALID_PASSCODES = {
+    0, 11111111, 22222222, 33333333, 44444444, 55555555,
+    66666666, 77777777, 88888888, 99999999, 12345678, 87654321
+}
+
+# Verhoeff check digit tables
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6),
+    (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8),
+    (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2),
+    (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4),
+    (9, 8, 7, 6, 5, 4, 3, 2, 1, 0)
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2),
+    (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0),
+    (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5),
+    (7, 0, 4, 6, 9, 1, 3, 2, 5, 8)
+)
+_VERHOEFF_INV = (0, 4, 3, 2, 1, 5, 6, 7, 8, 9)
+
+def parse_setup_payload(code: str) -> Dict:
+    """Decode a QR code ("MT:...") or an 11/21-digit manual pairing code"""
+    code = code.strip()
+    if code.startswith(QR_CODE_PREFIX):
+        return decode_qr_code(code)
+    return decode_manual_code(code)
+
+def decode_qr_code(qr_code: str) -> Dict:
+    """Decode a Base38 Matter QR code payload including its TLV optional data"""
+    if not qr_code.startswith(QR_CODE_PREFIX):
+        raise ValueError(f"QR code must start with '{QR_CODE_PREFIX}'")
+
+    # Concatenated payloads are separated by '*'; only the first is used
+    text = qr_code[len(QR_CODE_PREFIX):].split("*", 1)[0]
+    data = _base38_decode(text)
+    if len(data) < QR_HEADER_BYTES:
+        raise ValueError(f"QR code payload too short ({len(data)} bytes)")
+
+    header = int.from_bytes(data[:QR_HEADER_BYTES], "little")
+    version = header & 0x7
+    vendor_id = (header >> 3) & 0xFFFF
+    product_id = (header >> 19) & 0xFFFF
+    commissioning_flow = (header >> 35) & 0x3
+    discovery_capabilities = (header >> 37) & 0xFF
+    discriminator = (header >> 45) & 0xFFF
+    passcode = (header >> 57) & 0x7FFFFFF
+
+    if version != 0:
+        raise ValueError(f"Unsupported QR code version {version}")
+    _validate_passcode(passcode)
+
+    optional_data = {}
+    if len(data) > QR_HEADER_BYTES:
+        optional_data = _decode_optional_data(data, QR_HEADER_BYTES)
+
+    return {
+        "format": "qr",
+        "version": version,
+        "vendor_id": vendor_id,
+        "product_id": product_id,
+        "commissioning_flow": commissioning_flow,
+        "discovery_capabilities": discovery_capabilities,
+        "discriminator": discriminator,
+        "short_discriminator": discriminator >> 8,
+        "has_short_discriminator": False,
+        "passcode": passcode,
+        "optional_data": optional_data
+    }
+
+def decode_manual_code(manual_code: str) -> Dict:
+    """Decode an 11-digit or 21-digit manual pairing code"""
+    digits = manual_code.replace("-", "").replace(" ", "")
+    if not digits.isdigit() or len(digits) not in (11, 21):
+        raise ValueError("Manual pairing code must have 11 or 21 digits")
+    if _verhoeff_check_digit(digits[:-1]) != int(digits[-1]):
+        raise ValueError("Manual pairing code check digit mismatch")
+
+    chunk1 = ord(digits[0]) - 48
+    chunk2 = int(digits[1:6])
+    chunk3 = int(digits[6:10])
+    if chunk1 > 7 or chunk2 > 0xFFFF or chunk3 > 0x1FFF:
+        raise ValueError("Manual pairing code out of range")
+
+    vid_pid_present = bool(chunk1 & 0x4)
+    if vid_pid_present != (len(digits) == 21):
+        raise ValueError("Manual pairing code length does not match its VID/PID flag")
+
+    short_discriminator = ((chunk1 & 0x3) << 2) | (chunk2 >> 14)
+    passcode = (chunk3 << 14) | (chunk2 & 0x3FFF)
+    _validate_passcode(passcode)
+
+    return {
+        "format": "manual",
+        "version": 0,
+        "vendor_id": int(digits[10:15]) if vid_pid_present else None,
+        "product_id": int(digits[15:20]) if vid_pid_present else None,
+        "commissioning_flow": 2 if vid_pid_present else 0,
+        "discovery_capabilities": None,
+        "discriminator": short_discriminator << 8,
+        "short_discriminator": short_discriminator,
+        "has_short_discriminator": True,
+        "passcode": passcode,
+        "optional_data": {}
+    }
+
+def encode_qr_code(vendor_id: int, product_id: int, discriminator: int, passcode: int,
+                   commissioning_flow: int = 0, discovery_capabilities: int = 0x02,
+                   optional_data: bytes = b"") -> str:
+    """Encode a Matter QR code payload; optional_data is raw TLV"""
+    header = (
+        (vendor_id & 0xFFFF) << 3 |
+        (product_id & 0xFFFF) << 19 |
+        (commissioning_flow & 0x3) << 35 |
+        (discovery_capabilities & 0xFF) << 37 |
+        (discriminator & 0xFFF) << 45 |
+        (passcode & 0x7FFFFFF) << 57
+    )
+    data = header.to_bytes(QR_HEADER_BYTES, "little") + optional_data
+    return QR_CODE_PREFIX + _base38_encode(data)
+
+def encode_manual_code(discriminator: int, passcode: int, vendor_id: Optional[int] = None,
+                       product_id: Optional[int] = None) -> str:
+    """Encode an 11-digit (or 21-digit with VID/PID) manual pairing code"""
+    short_discriminator = (discriminator >> 8) & 0xF
+    vid_pid_present = vendor_id is not None and product_id is not None
+    chunk1 = (int(vid_pid_present) << 2) | (short_discriminator >> 2)
+    chunk2 = ((short_discriminator & 0x3) << 14) | (passcode & 0x3FFF)
+    chunk3 = (passcode >> 14) & 0x1FFF
+
+    digits = f"{chunk1}{chunk2:05d}{chunk3:04d}"
+    if vid_pid_present:
+        digits += f"{vendor_id:05d}{product_id:05d}"
+    return digits + str(_verhoeff_check_digit(digits))
+
+def _validate_passcode(passcode: int):
+    if passcode in INVALID_PASSCODES or passcode > 99999998:
+        raise ValueError(f"Invalid setup passcode {passcode}")
+
+def _verhoeff_check_digit(digits: str) -> int:
+    check = 0
+    for position, char in enumerate(reversed(digits)):
+        check = _VERHOEFF_D[check][_VERHOEFF_P[(position + 1) % 8][ord(char) - 48]]
+    return _VERHOEFF_INV[check]
+
+def _base38_decode(text: str) -> bytes:
+    length = len(text)
+    if length % 5 not in (0, 2, 4):
+        raise ValueError(f"Invalid Base38 length {length}")
+
+    out = bytearray()
+    values = _BASE38_VALUES
+    for start in range(0, length, 5):
+        chunk = text[start:start + 5]
+        value = 0
+        for char in reversed(chunk):
+            code = ord(char)
+            digit = values[code] if code < 128 else -1
+            if digit < 0:
+                raise ValueError(f"Invalid Base38 character '{char}'")
+            value = value * 38 + digit
+        byte_count = _BASE38_CHUNK_BYTES[len(chunk)]
+        if value >> (8 * byte_count):
+            raise ValueError("Base38 chunk out of range")
+        out += value.to_bytes(byte_count, "little")
+    return bytes(out)
+
+def _base38_encode(data: bytes) -> str:
+    chars = []
+    for start in range(0, len(data), 3):
+        chunk = data[start:start + 3]
+        value = int.from_bytes(chunk, "little")
+        for _ in range({3: 5, 2: 4, 1: 2}[len(chunk)]):
+            value, digit = divmod(value, 38)
+            chars.append(BASE38_ALPHABET[digit])
+    return "".join(chars)
+
+def _decode_optional_data(data: bytes, offset: int) -> Dict:
+    """Decode the TLV structure that follows the QR header"""
+    tag, value, _ = _read_tlv_element(data, offset)
+    if tag is not None or not isinstance(value, dict):
+        raise ValueError("QR optional data must be an anonymous TLV structure")
+
+    optional_data = {}
+    vendor_data = {}
+    for element_tag, element_value in value.items():
+        if element_tag in OPTIONAL_DATA_TAGS:
+            optional_data[OPTIONAL_DATA_TAGS[element_tag]] = element_value
+        elif isinstance(element_tag, int) and element_tag >= 0x80:
+            vendor_data[element_tag] = element_value
+    if vendor_data:
+        optional_data["vendor"] = vendor_data
+    return optional_data
+
+# TLV tag control -> tag length in bytes
+_TLV_TAG_SIZES = (0, 1, 2, 4, 2, 4, 6, 8)
+
+def _read_tlv_element(data: bytes, pos: int) -> Tuple[Optional[int], object, int]:
+    """Read one Matter TLV element, returning (tag, value, next position)"""
+    end = len(data)
+    if pos >= end:
+        raise ValueError("Truncated TLV data")
+
+    control = data[pos]
+    pos += 1
+    element_type = control & 0x1F
+    tag_size = _TLV_TAG_SIZES[control >> 5]
+    tag = int.from_bytes(data[pos:pos + tag_size], "little") if tag_size else None
+    pos += tag_size
+
+    if element_type <= 0x07:
+        size = 1 << (element_type & 0x3)
+        value = int.from_bytes(data[pos:pos + size], "little", signed=element_type < 0x04)
+        pos += size
+    elif element_type in (0x08, 0x09):
+        value = element_type == 0x09
+    elif element_type == 0x0A:
+        value = struct.unpack_from("<f", data, pos)[0]
+        pos += 4
+    elif element_type == 0x0B:
+        value = struct.unpack_from("<d", data, pos)[0]
+        pos += 8
+    elif 0x0C <= element_type <= 0x13:
+        length_size = 1 << (element_type & 0x3)
+        length = int.from_bytes(data[pos:pos + length_size], "little")
+        pos += length_size
+        raw = data[pos:pos + length]
+        pos += length
+        value = raw.decode("utf-8") if element_type <= 0x0F else bytes(raw)
+    elif element_type == 0x14:
+        value = None
+    elif element_type in (0x15, 0x16, 0x17):
+        members = []
+        while True:
+            if pos >= end:
+                raise ValueError("Unterminated TLV container")
+            if data[pos] == 0x18:
+                pos += 1
+                break
+            member_tag, member_value, pos = _read_tlv_element(data, pos)
+            members.append((member_tag, member_value))
+        if element_type == 0x15:
+            value = dict(members)
+        else:
+            value = [member_value for _, member_value in members]
+    else:
+        raise ValueError(f"Unsupported TLV element type 0x{element_type:02X}")
+
+    if pos > end:
+        raise ValueError("Truncated TLV data")
+    return tag, value, pos
@@ -0,0 +1,104 @@
+"""
+Long-lived SQLite connections in WAL mode, each driven from its own thread
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    # WAL + NORMAL only risks the last transactions on power loss, never corruption
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -8000,  # KiB
+}
+
+class SQLitePool:
+    """One writer connection plus a small pool of reader connections
+
+    aiosqlite runs every connection on a dedicated thread, so statements never
+    block the event loop. Writes are serialized through the single writer;
+    WAL mode lets readers proceed concurrently against the last committed state.
+    Statements are compiled once per connection and reused from sqlite3's
+    statement cache.
+    """
+
+    def __init__(self, db_path: str, readers: int = 2, busy_timeout: int = 5000,
+                 cached_statements: int = 128, pragmas: Optional[Dict] = None):
+        self.db_path = db_path
+        self.reader_count = max(1, readers)
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+
+        self.writer: Optional[aiosqlite.Connection] = None
+        self.readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._write_lock = asyncio.Lock()
+
+    async def open(self):
+        """Open the writer and reader connections"""
+        if self.writer is not None:
+            return
+        # The writer is opened first so it can switch the database to WAL
+        self.writer = await self._connect()
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            connection = await self._connect()
+            self.readers.append(connection)
+            self._idle_readers.put_nowait(connection)
+        logger.info(f"Opened SQLite pool for {self.db_path} ({self.reader_count} readers)")
+
+    async def close(self):
+        """Close all connections"""
+        for connection in self.readers:
+            await connection.close()
+        if self.writer is not None:
+            await self.writer.close()
+        self.readers = []
+        self.writer = None
+        self._idle_readers = None
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Run statements on the writer connection inside one transaction"""
+        if self.writer is None:
+            raise Exception("SQLite pool is not open")
+        async with self._write_lock:
+            await self.writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.writer
+            except BaseException:
+                await self.writer.execute("ROLLBACK")
+                raise
+            else:
+                await self.writer.execute("COMMIT")
+
+    @asynccontextmanager
+    async def reader(self):
+        """Borrow a reader connection"""
+        if self._idle_readers is None:
+            raise Exception("SQLite pool is not open")
+        connection = await self._idle_readers.get()
+        try:
+            yield connection
+        finally:
+            self._idle_readers.put_nowait(connection)
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # isolation_level=None: transactions are only opened explicitly by transaction()
+        connection = await aiosqlite.connect(
+            self.db_path,
+            isolation_level=None,
+            cached_statements=self.cached_statements
+        )
+        await connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        for name, value in self.pragmas.items():
+            await connection.execute(f"PRAGMA {name} = {value}")
+        return connection
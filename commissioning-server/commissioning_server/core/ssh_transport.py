@@ -0,0 +1,202 @@
+"""
+Persistent multiplexed SSH connections to Raspberry Pi hosts
+"""
+
+import asyncio
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .config import Config
+from .metrics import REGISTRY, SUBPROCESS_SPAWNS
+
+logger = logging.getLogger(__name__)
+
+SSH_COMMAND_SECONDS = REGISTRY.histogram(
+    "ssh_command_seconds",
+    "ssh invocations by operation: connect (master handshake), run (commands "
+    "and file transfers over the master), check and exit",
+    ["operation"]
+)
+
+class SSHTransport:
+    """Runs commands on Pis over one OpenSSH ControlMaster connection per host
+
+    The first command to a host starts a background master connection; every
+    later command, file write or health check is a new channel on that
+    connection, so a batch of transfers pays for a single handshake. The master
+    sends keepalives and is restarted transparently if it goes away.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.pi_config = config.get_pi_config()
+        self.ssh_key_path = os.path.expanduser(config.get("pi.ssh_key_path", "~/.ssh/backup_key"))
+        self.default_user = self.pi_config.get("default_user", "pi")
+        self.connect_timeout = self.pi_config.get("ssh_connect_timeout", 5)
+        self.keepalive_interval = self.pi_config.get("ssh_keepalive_interval", 15)
+        self.keepalive_count = self.pi_config.get("ssh_keepalive_count", 3)
+        self.control_persist = self.pi_config.get("ssh_control_persist", 600)
+        # Unix socket paths are limited to ~100 characters, so keep the directory short
+        self.control_dir = self.pi_config.get("ssh_control_dir")
+        self._owns_control_dir = not self.control_dir
+        if self._owns_control_dir:
+            self.control_dir = tempfile.mkdtemp(prefix="msh-ssh-")
+        self.connections: Dict[Tuple[str, str], Dict] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+    async def run(self, host: str, user: Optional[str], remote_command: str,
+                  input_data: Optional[bytes] = None, timeout: float = 30) -> Dict:
+        """Run a shell command on the host over the shared connection"""
+        user = user or self.default_user
+        try:
+            await self._ensure_master(host, user)
+        except Exception as e:
+            return {"return_code": -1, "stdout": "", "stderr": str(e)}
+
+        result = await self._ssh(self._ssh_options(host, user, master=False) +
+                                 [f"{user}@{host}", remote_command],
+                                 input_data=input_data, timeout=timeout, operation="run")
+        connection = self.connections[(host, user)]
+        connection["last_used"] = time.time()
+        connection["commands"] += 1
+        if result["return_code"] == 255:
+            # ssh itself failed: the master is probably gone, rebuild it next time
+            connection["connected"] = False
+            connection["last_error"] = result["stderr"].strip()
+        return result
+
+    async def write_file(self, host: str, user: Optional[str], remote_path: str,
+                         data: bytes, timeout: float = 30) -> Dict:
+        """Stream data into a remote file over stdin, replacing it atomically"""
+        path = shlex.quote(remote_path)
+        tmp_path = shlex.quote(remote_path + ".tmp")
+        return await self.run(host, user, f"cat > {tmp_path} && mv {tmp_path} {path}",
+                              input_data=data, timeout=timeout)
+
+    async def check(self, host: str, user: Optional[str] = None) -> bool:
+        """Check whether the master connection to a host is alive"""
+        user = user or self.default_user
+        if (host, user) not in self.connections:
+            return False
+        result = await self._ssh(["-O", "check"] + self._ssh_options(host, user, master=False) +
+                                 [f"{user}@{host}"], timeout=self.connect_timeout, operation="check")
+        connection = self.connections[(host, user)]
+        connection["connected"] = result["return_code"] == 0
+        connection["last_check"] = time.time()
+        return connection["connected"]
+
+    def get_status(self) -> Dict:
+        """Connection health for every host the transport has talked to"""
+        return {
+            "keepalive_interval": self.keepalive_interval,
+            "control_persist": self.control_persist,
+            "connections": [
+                {
+                    "host": host,
+                    "user": user,
+                    "connected": connection["connected"],
+                    "established_at": connection["established_at"],
+                    "handshakes": connection["handshakes"],
+                    "commands": connection["commands"],
+                    "last_used": connection["last_used"],
+                    "last_check": connection["last_check"],
+                    "last_error": connection["last_error"]
+                }
+                for (host, user), connection in self.connections.items()
+            ]
+        }
+
+    async def close(self):
+        """Close every master connection"""
+        for host, user in list(self.connections):
+            await self._ssh(["-O", "exit"] + self._ssh_options(host, user, master=False) +
+                            [f"{user}@{host}"], timeout=self.connect_timeout, operation="exit")
+            self.connections[(host, user)]["connected"] = False
+        if self._owns_control_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+        logger.info("Closed SSH master connections")
+
+    async def _ensure_master(self, host: str, user: str):
+        key = (host, user)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            connection = self.connections.setdefault(key, {
+                "connected": False,
+                "established_at": None,
+                "handshakes": 0,
+                "commands": 0,
+                "last_used": None,
+                "last_check": None,
+                "last_error": None
+            })
+            if connection["connected"] and os.path.exists(self._control_path(host, user)):
+                return
+
+            # close() removes a directory it created; a later command recreates it
+            os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+            # -f -N: authenticate, then background the master without a remote command
+            result = await self._ssh(["-f", "-N"] + self._ssh_options(host, user, master=True) +
+                                     [f"{user}@{host}"], timeout=self.connect_timeout + 10,
+                                     operation="connect")
+            connection["handshakes"] += 1
+            if result["return_code"] != 0:
+                connection["connected"] = False
+                connection["last_error"] = result["stderr"].strip()
+                raise Exception(f"SSH connection to {user}@{host} failed: {connection['last_error']}")
+
+            connection["connected"] = True
+            connection["established_at"] = time.time()
+            connection["last_error"] = None
+            logger.info(f"Opened SSH master connection to {user}@{host}")
+
+    def _control_path(self, host: str, user: str) -> str:
+        return os.path.join(self.control_dir, f"{user}@{host}")
+
+    def _ssh_options(self, host: str, user: str, master: bool) -> List[str]:
+        options = [
+            "-i", self.ssh_key_path,
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            "-o", f"ConnectTimeout={self.connect_timeout}",
+            "-o", f"ControlPath={self._control_path(host, user)}"
+        ]
+        if master:
+            options += [
+                "-o", "ControlMaster=yes",
+                "-o", f"ControlPersist={self.control_persist}",
+                "-o", f"ServerAliveInterval={self.keepalive_interval}",
+                "-o", f"ServerAliveCountMax={self.keepalive_count}"
+            ]
+        else:
+            options += ["-o", "ControlMaster=no"]
+        return options
+
+    async def _ssh(self, args: List[str], input_data: Optional[bytes] = None,
+                   timeout: float = 30, operation: str = "run") -> Dict:
+        with SSH_COMMAND_SECONDS.time(operation=operation):
+            return await self._spawn_ssh(args, input_data, timeout)
+
+    async def _spawn_ssh(self, args: List[str], input_data: Optional[bytes], timeout: float) -> Dict:
+        SUBPROCESS_SPAWNS.inc(program="ssh")
+        process = await asyncio.create_subprocess_exec(
+            "ssh", *args,
+            stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(input_data), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return {"return_code": -1, "stdout": "", "stderr": f"ssh timed out after {timeout}s"}
+        return {
+            "return_code": process.returncode,
+            "stdout": stdout.decode(errors="replace"),
+            "stderr": stderr.decode(errors="replace")
+        }
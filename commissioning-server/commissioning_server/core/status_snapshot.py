@@ -0,0 +1,91 @@
+"""
+Periodically refreshed server status
+
+Building the full status probes the Matter tools on disk and runs
+chip-tool fabric list, which is too slow and too heavy to repeat for every
+health check. A background task rebuilds the status every interval, or
+sooner when something that changes it happens (a commissioning job
+finishing, for example), and readers get the last snapshot and its age.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class StatusSnapshot:
+    """Latest result of an expensive status builder, refreshed in the background"""
+
+    def __init__(self, build: Callable[[], Awaitable[Dict]], interval: float = 30):
+        self.build = build
+        self.interval = interval
+        self.snapshot: Optional[Dict] = None
+        self.built_at: Optional[float] = None
+        self.build_duration: Optional[float] = None
+        self.refreshes = 0
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the snapshot was built, None before the first build"""
+        if self.built_at is None:
+            return None
+        return time.monotonic() - self.built_at
+
+    async def start(self):
+        """Build the first snapshot and keep it fresh"""
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def refresh_soon(self):
+        """Ask the background task to rebuild now; repeated calls collapse into one build"""
+        self._wake.set()
+
+    async def refresh(self) -> Dict:
+        """Rebuild the snapshot now, sharing a build already in progress"""
+        started = time.monotonic()
+        async with self._lock:
+            if self.built_at is not None and self.built_at >= started:
+                # Someone else finished a build while we waited for the lock
+                return self.snapshot
+            self._wake.clear()
+            try:
+                self.snapshot = await self.build()
+            except Exception as e:
+                # Keep serving the previous snapshot; its age shows it is stale
+                logger.error(f"Status refresh failed: {e}")
+                if self.snapshot is None:
+                    raise
+                return self.snapshot
+            self.built_at = time.monotonic()
+            self.build_duration = self.built_at - started
+            self.refreshes += 1
+            return self.snapshot
+
+    async def get(self) -> Dict:
+        """The current snapshot, building it first if there is none yet"""
+        if self.snapshot is None:
+            await self.refresh()
+        return self.snapshot
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.refresh()
+            except Exception:
+                pass
@@ -6,19 +6,26 @@ Handles BLE device discovery, commissioning, and credential transfer to Pi
 
 import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import json
 from datetime import datetime
-import time
 
 from commissioning_server.core.config import Config
 from commissioning_server.core.matter_client import MatterClient
 from commissioning_server.core.ble_scanner import BLEScanner
-from commissioning_server.core.credential_store import CredentialStore
+from commissioning_server.core.ble_discovery import BLEDiscoveryService
+from commissioning_server.core.bulk_commissioning import BulkCommissioner, manifest_run_id
+from commissioning_server.core.commissioning_jobs import (
+    CommissioningJob, CommissioningJobQueue, JobQueueFull, device_id_from_name
+)
+from commissioning_server.core.credential_store import CREDENTIAL_FIELDS, CredentialStore
 from commissioning_server.core.device_manager import DeviceManager
+from commissioning_server.core import metrics
+from commissioning_server.core.status_snapshot import StatusSnapshot
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -42,8 +49,9 @@ app.add_middleware(
 
 # Initialize components
 config = Config()
-matter_client = MatterClient(config)
 ble_scanner = BLEScanner(config)
+ble_discovery = BLEDiscoveryService(config, ble_scanner)
+matter_client = MatterClient(config, ble_scanner, ble_discovery)
 credential_store = CredentialStore(config)
 device_manager = DeviceManager(config)
 
@@ -58,14 +66,35 @@ class CommissioningRequest(BaseModel):
     pi_ip: str
     pi_user: str = "chregg"
 
+class BulkDeviceEntry(BaseModel):
+    device_name: str
+    qr_code: str
+    device_type: str = ""
+
+class BulkCommissioningRequest(BaseModel):
+    devices: List[BulkDeviceEntry]
+    network_ssid: str
+    network_password: str
+    pi_ip: str = ""
+    pi_user: str = "chregg"
+    concurrency: Optional[int] = None
+    run_id: Optional[str] = None
+
 class BLEScanRequest(BaseModel):
     scan_timeout: Optional[int] = 30
+    discriminator: Optional[int] = None
+    fresh_within: Optional[float] = None
 
 class CredentialTransferRequest(BaseModel):
     device_id: str
     pi_ip: str
     pi_user: str = "chregg"
 
+class BulkTransferRequest(BaseModel):
+    device_ids: List[str]
+    pi_ip: str
+    pi_user: str = "chregg"
+
 class DeviceControlRequest(BaseModel):
     device_id: str
     cluster: str
@@ -83,6 +112,10 @@ async def startup_event():
     # Initialize components
     await credential_store.initialize()
     
+    # Keep a warm cache of advertising BLE devices
+    if ble_discovery.enabled:
+        await ble_discovery.start()
+    
     # Initialize Matter client (optional)
     try:
         await matter_client.initialize()
@@ -91,51 +124,203 @@ async def startup_event():
         logger.warning(f"Matter SDK initialization failed: {e}")
         logger.info("Server will run in limited mode (BLE scanning only)")
     
+    await commissioning_jobs.start(default_workers=matter_client.adapters.size)
+    
+    # Serve /api/status from a snapshot instead of probing chip-tool per request
+    await matter_status.start()
+    
     logger.info("MSH Commissioning Server started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down MSH Commissioning Server...")
+    await matter_status.stop()
+    await commissioning_jobs.stop()
+    await ble_discovery.stop()
+    await matter_client.cleanup()
+    await credential_store.cleanup()
+    await device_manager.cleanup()
+
+# matter_client.get_status() probes the Matter tools on disk and runs chip-tool
+# fabric list, so only it is cached; everything else is read per request
+matter_status = StatusSnapshot(matter_client.get_status, config.get("server.status_refresh_interval", 30))
 
 @app.get("/api/status")
 async def get_status():
-    """Get server status"""
+    """Get server status
+    
+    The matter_client component comes from a snapshot refreshed in the
+    background; snapshot_age is how many seconds old it is. The other
+    components are live.
+    """
     return {
         "status": "running",
         "service": "MSH Commissioning Server",
         "version": "1.0.0",
         "timestamp": datetime.utcnow().isoformat(),
         "components": {
-            "matter_client": await matter_client.get_status(),
+            "matter_client": await matter_status.get(),
             "ble_scanner": "available",
+            "ble_discovery": ble_discovery.get_status(),
             "credential_store": "initialized",
-            "device_manager": "available"
-        }
+            "device_manager": "available",
+            "pi_transport": device_manager.get_transport_status(),
+            "commissioning_jobs": commissioning_jobs.get_status()
+        },
+        "snapshot_age": round(matter_status.age, 3)
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/api/devices/scan-ble")
 async def scan_ble_devices(request: BLEScanRequest):
-    """Scan for BLE Matter devices"""
+    """Scan for BLE Matter devices
+    
+    While background discovery runs, devices are served from its cache; pass
+    fresh_within (seconds) to force a short top-up scan when the cache is older.
+    """
     try:
-        logger.info(f"Starting BLE scan with timeout: {request.scan_timeout}s")
-        
-        devices = await ble_scanner.scan_devices(timeout=request.scan_timeout)
+        if ble_discovery.running:
+            devices = await ble_discovery.get_devices(fresh_within=request.fresh_within)
+            if request.discriminator is not None:
+                devices = [d for d in devices if d.get("discriminator") == request.discriminator]
+            source = "cache"
+        else:
+            logger.info(f"Starting BLE scan with timeout: {request.scan_timeout}s")
+            devices = await ble_discovery.scan(timeout=request.scan_timeout)
+            if request.discriminator is not None:
+                devices = [d for d in devices if d.get("discriminator") == request.discriminator]
+            source = "scan"
         
         return {
             "status": "success",
             "devices_found": len(devices),
             "devices": devices,
-            "scan_timeout": request.scan_timeout
+            "scan_timeout": request.scan_timeout,
+            "source": source
         }
         
     except Exception as e:
         logger.error(f"BLE scan failed: {e}")
         raise HTTPException(status_code=500, detail=f"BLE scan failed: {str(e)}")
 
-@app.post("/commission")
+def commissioning_error_detail(error_msg: str) -> str:
+    """A more helpful message for common commissioning failures"""
+    if "discriminator" in error_msg.lower():
+        return "Could not determine device discriminator. Please ensure the device is in pairing mode and try again."
+    elif "passcode" in error_msg.lower():
+        return "Could not extract passcode from QR code. Please verify the QR code is correct."
+    elif "network" in error_msg.lower():
+        return "Network credentials are required for BLE-WiFi commissioning."
+    elif "timeout" in error_msg.lower():
+        return "Commissioning timed out. Please ensure the device is in pairing mode and try again."
+    return error_msg
+
+async def run_commissioning_job(job: CommissioningJob, report) -> Dict[str, Any]:
+    """Commission a device and transfer its credentials to the Pi"""
+    request = CommissioningRequest(**job.params)
+    device_id = job.device_id
+    
+    # Perform commissioning
+    logger.info(f"Starting BLE-WiFi commissioning for device {device_id}")
+    commissioning_result = await matter_client.commission_device(
+        device_id=device_id,
+        commissioning_type="ble",
+        qr_code=request.qr_code,
+        network_ssid=request.network_ssid,
+        network_password=request.network_password,
+        progress=report,
+        ble_device=job.params.get("ble_device")
+    )
+    
+    if not commissioning_result.get("success"):
+        error_msg = commissioning_result.get("error", "Unknown commissioning error")
+        logger.error(f"Commissioning failed for device {device_id}: {error_msg}")
+        return {
+            "success": False,
+            "device_id": device_id,
+            "error": f"Commissioning failed: {commissioning_error_detail(error_msg)}"
+        }
+    
+    logger.info(f"Commissioning successful for device {device_id}")
+    
+    # Add commissioning data to result for transfer
+    commissioning_result.update({
+        "device_id": device_id,
+        "device_name": request.device_name,
+        "device_type": request.device_type,
+        "qr_code": request.qr_code,
+        "network_ssid": request.network_ssid,
+        "network_password": request.network_password
+    })
+    
+    # Transfer credentials to Pi if specified
+    if request.pi_ip:
+        report("transfer")
+        logger.info(f"Transferring credentials to Pi at {request.pi_ip}")
+        transfer_result = await device_manager.transfer_credentials_to_pi(
+            device_id=device_id,
+            commissioning_result=commissioning_result,
+            pi_ip=request.pi_ip,
+            pi_user=request.pi_user
+        )
+        
+        if transfer_result.get("success"):
+            logger.info(f"Successfully transferred device {device_id} to Pi")
+        else:
+            logger.warning(f"Failed to transfer device {device_id} to Pi: {transfer_result.get('message')}")
+        commissioning_result["transfer"] = transfer_result
+    
+    # The job result is served over the API; keep the network password out of it
+    commissioning_result.pop("network_password", None)
+    return {
+        "success": True,
+        "device_id": device_id,
+        "device_name": request.device_name,
+        "message": "Device commissioned successfully using BLE-WiFi method",
+        "commissioning_result": commissioning_result,
+        "method_used": "ble-wifi",
+        "node_id": commissioning_result.get("details", {}).get("node_id"),
+        "discriminator_used": commissioning_result.get("details", {}).get("discriminator_used")
+    }
+
+commissioning_jobs = CommissioningJobQueue(config, run_commissioning_job)
+
+async def broadcast(message: Dict[str, Any]):
+    """Send a message to every connected WebSocket client"""
+    text = json.dumps(message)
+    for websocket in list(active_connections):
+        try:
+            await websocket.send_text(text)
+        except Exception:
+            if websocket in active_connections:
+                active_connections.remove(websocket)
+
+async def broadcast_job_update(event: str, job: Dict[str, Any]):
+    await broadcast({"type": event, "job": job})
+
+commissioning_jobs.add_listener(broadcast_job_update)
+
+async def refresh_matter_status_on_job_finished(event: str, job: Dict[str, Any]):
+    # A commissioned device changes the fabric and node mappings in the status
+    if event == "job_finished":
+        matter_status.refresh_soon()
+
+commissioning_jobs.add_listener(refresh_matter_status_on_job_finished)
+
+bulk_commissioner = BulkCommissioner(config, matter_client, commissioning_jobs)
+
+@app.post("/commission", status_code=202)
 async def commission_device(request: CommissioningRequest):
-    """Commission a Matter device using the reliable BLE-WiFi method"""
+    """Queue commissioning of a Matter device using the reliable BLE-WiFi method
+    
+    Returns a job id at once; follow the job with GET /api/jobs/{job_id} or
+    the job_queued/job_phase/job_finished messages on /ws.
+    """
     try:
         logger.info(f"Commissioning request received for device: {request.device_name}")
         
@@ -148,106 +333,114 @@ async def commission_device(request: CommissioningRequest):
             raise HTTPException(status_code=400, detail="Network password is required")
         
         # Generate device ID using device name for better tracking
-        device_id = request.device_name.lower().replace(" ", "-").replace("_", "-")
-        if not device_id:
-            device_id = f"device_{int(time.time())}"
+        device_id = device_id_from_name(request.device_name)
         
         logger.info(f"Using device ID: {device_id}")
         
-        # Prepare commissioning data
-        commissioning_data = {
-            "device_name": request.device_name,
-            "device_type": request.device_type,
-            "qr_code": request.qr_code,
-            "network_ssid": request.network_ssid,
-            "network_password": request.network_password
+        # A retry while the device is still being commissioned gets the same job back
+        job = commissioning_jobs.submit(device_id, request.model_dump())
+        return {
+            "success": True,
+            "job_id": job.id,
+            "device_id": device_id,
+            "status": job.status,
+            "status_url": f"/api/jobs/{job.id}"
         }
         
-        # Perform commissioning
-        logger.info(f"Starting BLE-WiFi commissioning for device {device_id}")
-        commissioning_result = await matter_client.commission_device(
-            device_id=device_id,
-            commissioning_type="ble",
-            qr_code=request.qr_code,
-            network_ssid=request.network_ssid,
-            network_password=request.network_password
-        )
-        
-        if commissioning_result.get("success"):
-            logger.info(f"Commissioning successful for device {device_id}")
-            
-            # Add commissioning data to result for transfer
-            commissioning_result.update({
-                "device_id": device_id,
-                "device_name": request.device_name,
-                "device_type": request.device_type,
-                "qr_code": request.qr_code,
-                "network_ssid": request.network_ssid,
-                "network_password": request.network_password
-            })
-            
-            # Transfer credentials to Pi if specified
-            if request.pi_ip:
-                logger.info(f"Transferring credentials to Pi at {request.pi_ip}")
-                transfer_result = await device_manager.transfer_credentials_to_pi(
-                    device_id=device_id,
-                    commissioning_result=commissioning_result,
-                    pi_ip=request.pi_ip
-                )
-                
-                if transfer_result.get("success"):
-                    logger.info(f"Successfully transferred device {device_id} to Pi")
-                    commissioning_result["transfer"] = transfer_result
-                else:
-                    logger.warning(f"Failed to transfer device {device_id} to Pi: {transfer_result.get('message')}")
-                    commissioning_result["transfer"] = transfer_result
-            
-            return {
-                "success": True,
-                "device_id": device_id,
-                "device_name": request.device_name,
-                "message": "Device commissioned successfully using BLE-WiFi method",
-                "commissioning_result": commissioning_result,
-                "method_used": "ble-wifi",
-                "node_id": commissioning_result.get("node_id"),
-                "discriminator_used": commissioning_result.get("discriminator_used")
-            }
-        else:
-            error_msg = commissioning_result.get("error", "Unknown commissioning error")
-            logger.error(f"Commissioning failed for device {device_id}: {error_msg}")
-            
-            # Provide more specific error messages
-            if "discriminator" in error_msg.lower():
-                error_detail = "Could not determine device discriminator. Please ensure the device is in pairing mode and try again."
-            elif "passcode" in error_msg.lower():
-                error_detail = "Could not extract passcode from QR code. Please verify the QR code is correct."
-            elif "network" in error_msg.lower():
-                error_detail = "Network credentials are required for BLE-WiFi commissioning."
-            elif "timeout" in error_msg.lower():
-                error_detail = "Commissioning timed out. Please ensure the device is in pairing mode and try again."
-            else:
-                error_detail = error_msg
-            
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Commissioning failed: {error_detail}"
-            )
-            
     except HTTPException:
         raise
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
-        logger.error(f"Unexpected error during commissioning: {e}")
+        logger.error(f"Unexpected error queueing commissioning: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error during commissioning: {str(e)}")
 
+@app.post("/commission/bulk")
+async def commission_devices_bulk(request: BulkCommissioningRequest):
+    """Commission every device in a manifest, streaming an NDJSON report
+    
+    Each line is a run, device or summary record. Submitting the same
+    manifest again (or the same run_id) resumes the run, skipping devices
+    that already succeeded; the run continues if the client disconnects.
+    """
+    if not request.devices:
+        raise HTTPException(status_code=400, detail="Manifest has no devices")
+    if not request.network_ssid or not request.network_password:
+        raise HTTPException(status_code=400, detail="Network SSID and password are required")
+    
+    entries = [entry.model_dump() for entry in request.devices]
+    run_id = request.run_id or manifest_run_id(entries)
+    if bulk_commissioner.is_running(run_id):
+        raise HTTPException(status_code=409, detail=f"Bulk run {run_id} is already in progress")
+    
+    params = {
+        "network_ssid": request.network_ssid,
+        "network_password": request.network_password,
+        "pi_ip": request.pi_ip,
+        "pi_user": request.pi_user
+    }
+    
+    async def report():
+        async for record in bulk_commissioner.run(entries, params, run_id=run_id,
+                                                  concurrency=request.concurrency):
+            yield json.dumps(record) + "\n"
+    
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the state of a commissioning job"""
+    job = commissioning_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.get("/api/devices/credentials")
-async def get_all_credentials():
-    """Get all stored device credentials"""
+async def get_all_credentials(
+    request: Request,
+    after_device_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    fields: Optional[str] = None,
+    format: Optional[str] = None
+):
+    """Get stored device credentials
+    
+    - after_device_id/limit: keyset pagination in device_id order
+    - fields: comma-separated projection, e.g. "device_id,name" (skips credential decoding)
+    - format=ndjson (or Accept: application/x-ndjson): stream one device per line
+    """
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    unknown = [field for field in field_list or [] if field not in CREDENTIAL_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    if format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        async def stream():
+            try:
+                async for device in credential_store.iter_credentials(
+                    after_device_id=after_device_id, limit=limit, fields=field_list
+                ):
+                    yield json.dumps(device) + "\n"
+            except Exception as e:
+                logger.error(f"Failed to stream credentials: {e}")
+        
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    
     try:
-        credentials = await credential_store.get_all_credentials()
+        if limit is None and after_device_id is None and field_list is None:
+            credentials = await credential_store.get_all_credentials()
+        else:
+            credentials = await credential_store.get_credentials_page(
+                after_device_id=after_device_id, limit=limit, fields=field_list
+            )
+        
+        # Only a full page can have a successor
+        next_after = credentials[-1]["device_id"] if limit and len(credentials) == limit else None
         return {
             "status": "success",
             "devices_count": len(credentials),
-            "devices": credentials
+            "devices": credentials,
+            "next_after_device_id": next_after
         }
     except Exception as e:
         logger.error(f"Failed to get credentials: {e}")
@@ -277,16 +470,17 @@ async def transfer_credentials(request: CredentialTransferRequest):
     """Transfer existing device credentials to Pi"""
     try:
         # Get device credentials
-        credentials = await credential_store.get_credentials(request.device_id)
-        if not credentials:
+        devices = await credential_store.get_credentials_many([request.device_id])
+        if not devices:
             raise HTTPException(status_code=404, detail=f"Device {request.device_id} not found")
         
         # Transfer to Pi
-        transfer_result = await device_manager.transfer_to_pi(
-            credentials,
+        transfer_result = await device_manager.transfer_devices_to_pi(
+            devices,
             request.pi_ip,
             request.pi_user
         )
+        await credential_store.record_transfers(transfer_result["results"], request.pi_ip, request.pi_user)
         
         return {
             "status": "success",
@@ -300,6 +494,40 @@ async def transfer_credentials(request: CredentialTransferRequest):
         logger.error(f"Credential transfer failed: {e}")
         raise HTTPException(status_code=500, detail=f"Credential transfer failed: {str(e)}")
 
+@app.post("/api/devices/transfer-credentials/bulk")
+async def transfer_credentials_bulk(request: BulkTransferRequest):
+    """Transfer many devices' credentials to a Pi in a single archive"""
+    try:
+        devices = await credential_store.get_credentials_many(request.device_ids)
+        found = {device["device_id"] for device in devices}
+        not_found = [device_id for device_id in dict.fromkeys(request.device_ids) if device_id not in found]
+        
+        transfer_result = {"success": True, "results": {}}
+        if devices:
+            transfer_result = await device_manager.transfer_devices_to_pi(
+                devices,
+                request.pi_ip,
+                request.pi_user
+            )
+            await credential_store.record_transfers(transfer_result["results"], request.pi_ip, request.pi_user)
+        
+        results = dict(transfer_result["results"])
+        results.update({device_id: "not_found" for device_id in not_found})
+        
+        return {
+            "status": "success" if transfer_result["success"] and not not_found else "partial",
+            "pi_ip": request.pi_ip,
+            "devices_requested": len(results),
+            "devices_transferred": sum(status == "success" for status in results.values()),
+            "archive_bytes": transfer_result.get("archive_bytes", 0),
+            "results": results,
+            "error": transfer_result.get("error")
+        }
+        
+    except Exception as e:
+        logger.error(f"Bulk credential transfer failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Bulk credential transfer failed: {str(e)}")
+
 @app.post("/api/devices/control")
 async def control_device(request: DeviceControlRequest):
     """Control a Matter device"""
@@ -364,11 +592,26 @@ async def websocket_endpoint(websocket: WebSocket):
             if message.get("type") == "ping":
                 await websocket.send_text(json.dumps({"type": "pong", "timestamp": datetime.utcnow().isoformat()}))
             elif message.get("type") == "scan_ble":
-                # Handle BLE scan request
-                devices = await ble_scanner.scan_devices(timeout=30)
+                # Handle BLE scan request, pushing each device as it advertises
+                if ble_discovery.running:
+                    await websocket.send_text(json.dumps({
+                        "type": "scan_result",
+                        "devices": await ble_discovery.get_devices(fresh_within=message.get("fresh_within"))
+                    }))
+                    continue
+                devices = {}
+                async for device in ble_scanner.stream_devices(
+                    timeout=message.get("timeout", 30),
+                    discriminator=message.get("discriminator")
+                ):
+                    devices[device["address"]] = device
+                    await websocket.send_text(json.dumps({
+                        "type": "scan_device",
+                        "device": device
+                    }))
                 await websocket.send_text(json.dumps({
                     "type": "scan_result",
-                    "devices": devices
+                    "devices": list(devices.values())
                 }))
             else:
                 await websocket.send_text(json.dumps({
@@ -377,7 +620,8 @@ async def websocket_endpoint(websocket: WebSocket):
                 }))
                 
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        if websocket in active_connections:
+            active_connections.remove(websocket)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         if websocket in active_connections:
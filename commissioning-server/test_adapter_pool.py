@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for parallel commissioning across a pool of BLE adapters
+"""
+
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.adapter_pool import BLEAdapterPool
+from commissioning_server.core.config import Config
+from commissioning_server.core.matter_client import MatterClient
+
+def make_config(tmp_path, controllers, **pool):
+    sysfs = tmp_path / "sysfs"
+    for name in controllers:
+        (sysfs / name).mkdir(parents=True)
+    seed = tmp_path / "seed"
+    seed.mkdir(exist_ok=True)
+    (seed / "chip_tool_config.ini").write_text("[Default]\nExampleCARootCert0=abc\n")
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["bluetooth"]["adapter_pool"] = {
+        "storage_root": str(tmp_path / "storage"),
+        "seed_storage_dir": str(seed),
+        **pool
+    }
+    return config, str(sysfs)
+
+def test_discovers_controllers_and_seeds_storage(tmp_path):
+    config, sysfs = make_config(tmp_path, ["hci1", "hci0", "hci10"])
+    pool = BLEAdapterPool(config, sysfs_path=sysfs)
+    adapters = pool.discover()
+
+    assert [adapter.name for adapter in adapters] == ["hci0", "hci1", "hci10"]
+    assert adapters[2].chip_tool_args() == [
+        "--ble-adapter", "10", "--storage-directory", str(tmp_path / "storage" / "hci10")
+    ]
+    for adapter in adapters:
+        assert os.path.exists(os.path.join(adapter.storage_dir, "chip_tool_config.ini"))
+
+def test_single_adapter_keeps_default_storage(tmp_path):
+    config, sysfs = make_config(tmp_path, [])
+    pool = BLEAdapterPool(config, sysfs_path=sysfs)
+    pool.discover()
+    # No controllers found falls back to the configured adapter
+    assert [adapter.name for adapter in pool.adapters] == ["hci0"]
+    assert pool.adapters[0].chip_tool_args() == ["--ble-adapter", "0"]
+    assert not (tmp_path / "storage").exists()
+
+def test_each_concurrent_run_gets_its_own_adapter(tmp_path):
+    config, sysfs = make_config(tmp_path, ["hci0", "hci1"])
+    pool = BLEAdapterPool(config, sysfs_path=sysfs)
+    pool.discover()
+    held = []
+    peak = []
+
+    async def job():
+        async with pool.acquire() as adapter:
+            held.append(adapter.name)
+            peak.append(list(held))
+            await asyncio.sleep(0.02)
+            held.remove(adapter.name)
+
+    async def run():
+        await asyncio.gather(*[job() for _ in range(5)])
+
+    asyncio.run(run())
+    assert max(len(names) for names in peak) == 2
+    assert all(len(set(names)) == len(names) for names in peak)
+    assert sum(adapter.jobs_run for adapter in pool.adapters) == 5
+    assert pool.get_status()["free"] == 2
+
+def test_commissioning_runs_scale_with_adapters(tmp_path):
+    config, sysfs = make_config(tmp_path, ["hci0", "hci1"])
+    chip_tool = tmp_path / "chip-tool"
+    chip_tool.write_text('#!/bin/sh\necho "$@" >> "$(dirname "$0")/calls"\nsleep 0.3\n')
+    chip_tool.chmod(0o755)
+    config.config["matter"]["chip_tool_path"] = str(chip_tool)
+    config.config["matter"]["node_id_mappings_path"] = str(tmp_path / "mappings.json")
+
+    async def run():
+        client = MatterClient(config)
+        client.adapters.sysfs_path = sysfs
+        client.adapters.discover()
+        started = time.monotonic()
+        results = await asyncio.gather(*[
+            client._commission_ble(f"socket-{i}", {
+                "qr_code": "MT:Y.K9042C00KA0648G00",
+                "network_ssid": "home",
+                "network_password": "secret"
+            })
+            for i in range(2)
+        ])
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(run())
+    assert all(result["success"] for result in results)
+    assert elapsed < 0.55
+    calls = (tmp_path / "calls").read_text().splitlines()
+    assert sorted(call.split("--ble-adapter ")[1].split()[0] for call in calls) == ["0", "1"]
+
+def test_without_primary_fabric_only_one_adapter_is_used(tmp_path):
+    config, sysfs = make_config(tmp_path, ["hci0", "hci1"])
+    os.remove(tmp_path / "seed" / "chip_tool_config.ini")
+    pool = BLEAdapterPool(config, sysfs_path=sysfs)
+    pool.discover()
+    # A second adapter would pair devices into a fabric of its own
+    assert [adapter.name for adapter in pool.adapters] == ["hci0"]
+    assert pool.adapters[0].storage_dir is None
+    assert not (tmp_path / "storage").exists()
+
+def test_storage_not_seeded_from_primary_is_replaced(tmp_path):
+    config, sysfs = make_config(tmp_path, ["hci0", "hci1"])
+    forked = tmp_path / "storage" / "hci1"
+    forked.mkdir(parents=True)
+    (forked / "chip_tool_config.ini").write_text("[Default]\nExampleCARootCert0=other\n")
+
+    pool = BLEAdapterPool(config, sysfs_path=sysfs)
+    pool.discover()
+    assert "abc" in (forked / "chip_tool_config.ini").read_text()
+    assert [path.name.startswith("hci1.unseeded-") for path in (tmp_path / "storage").iterdir()].count(True) == 1
+
+    # Seeded storage is kept on the next start, along with what chip-tool wrote to it
+    (forked / "chip_tool_config.ini").write_text("[Default]\nExampleCARootCert0=abc\nCounter=5\n")
+    BLEAdapterPool(config, sysfs_path=sysfs).discover()
+    assert "Counter=5" in (forked / "chip_tool_config.ini").read_text()
@@ -53,45 +53,63 @@ async def test_api_commissioning(device_data, device_name):
             async with session.post(
                 "http://localhost:8888/commission",
                 json=device_data,
-                timeout=aiohttp.ClientTimeout(total=300)  # 5 minutes timeout
+                timeout=aiohttp.ClientTimeout(total=30)
             ) as response:
-                
-                if response.status == 200:
-                    result = await response.json()
-                    print(f"✅ Commissioning successful!")
-                    print(f"Device ID: {result.get('device_id')}")
-                    print(f"Node ID: {result.get('node_id')}")
-                    print(f"Method used: {result.get('method_used')}")
-                    print(f"Discriminator used: {result.get('discriminator_used')}")
-                    
-                    # Test device control
-                    print(f"\n🎛️  Testing device control...")
-                    control_data = {
-                        "device_id": result.get('device_id'),
-                        "cluster": "onoff",
-                        "command": "toggle",
-                        "endpoint": "1"
-                    }
-                    
-                    async with session.post(
-                        "http://localhost:8888/api/devices/control",
-                        json=control_data,
-                        timeout=aiohttp.ClientTimeout(total=30)
-                    ) as control_response:
-                        if control_response.status == 200:
-                            control_result = await control_response.json()
-                            print(f"✅ Device control successful: {control_result}")
-                        else:
-                            control_error = await control_response.text()
-                            print(f"⚠️  Device control failed: {control_error}")
-                    
-                    return True
-                else:
+                if response.status != 202:
                     error_text = await response.text()
-                    print(f"❌ Commissioning failed (status: {response.status})")
+                    print(f"❌ Commissioning request rejected (status: {response.status})")
                     print(f"Error: {error_text}")
                     return False
-                    
+                job_id = (await response.json())["job_id"]
+                print(f"📋 Commissioning job {job_id} queued")
+            
+            # Follow the job until it finishes (up to 5 minutes)
+            job = None
+            for _ in range(300):
+                async with session.get(f"http://localhost:8888/api/jobs/{job_id}") as response:
+                    job = await response.json()
+                if job["status"] in ("succeeded", "failed"):
+                    break
+                await asyncio.sleep(1)
+            else:
+                raise asyncio.TimeoutError()
+            print(f"Phases: {' -> '.join(entry['phase'] for entry in job['phases'])}")
+            
+            if job["status"] == "succeeded":
+                result = job["result"]
+                print(f"✅ Commissioning successful!")
+                print(f"Device ID: {result.get('device_id')}")
+                print(f"Node ID: {result.get('node_id')}")
+                print(f"Method used: {result.get('method_used')}")
+                print(f"Discriminator used: {result.get('discriminator_used')}")
+                
+                # Test device control
+                print(f"\n🎛️  Testing device control...")
+                control_data = {
+                    "device_id": result.get('device_id'),
+                    "cluster": "onoff",
+                    "command": "toggle",
+                    "endpoint": "1"
+                }
+                
+                async with session.post(
+                    "http://localhost:8888/api/devices/control",
+                    json=control_data,
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as control_response:
+                    if control_response.status == 200:
+                        control_result = await control_response.json()
+                        print(f"✅ Device control successful: {control_result}")
+                    else:
+                        control_error = await control_response.text()
+                        print(f"⚠️  Device control failed: {control_error}")
+                
+                return True
+            else:
+                print(f"❌ Commissioning failed")
+                print(f"Error: {job['error']}")
+                return False
+                
     except asyncio.TimeoutError:
         print(f"❌ Commissioning timed out after 5 minutes")
         return False
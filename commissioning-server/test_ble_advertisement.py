@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for Matter BLE advertisement (0xFFF6 service data) decoding
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.ble_advertisement import (
+    MATTER_SERVICE_UUID,
+    annotate_matter_device,
+    index_commissionable_devices,
+    matches_payload,
+    parse_bluetoothctl_service_data,
+    parse_matter_service_data,
+)
+from commissioning_server.core.config import Config
+from commissioning_server.core.matter_client import MatterClient
+from commissioning_server.core.setup_payload import parse_setup_payload
+
+# opcode 0, version 0 / discriminator 97, VID 0x125D, PID 0x06BC, no flags
+NOUS_SERVICE_DATA = "0061005d12bc0600"
+
+BLUETOOTHCTL_INFO = """Device F8:17:2D:7F:BB:0D (public)
+\tName: MATTER-0097
+\tAlias: MATTER-0097
+\tRSSI: 0xffffffc2 (-62)
+\tServiceData Key: 0000fff6-0000-1000-8000-00805f9b34fb
+\tServiceData Value:
+  00 61 00 5d 12 bc 06 00                          .a.]....
+\tAdvertisingFlags:
+  06                                               .
+"""
+
+def test_parses_commissionable_advertisement():
+    advertisement = parse_matter_service_data(bytes.fromhex(NOUS_SERVICE_DATA))
+
+    assert advertisement["discriminator"] == 97
+    assert advertisement["vendor_id"] == 0x125D
+    assert advertisement["product_id"] == 0x06BC
+    assert advertisement["advertisement_version"] == 0
+    assert not advertisement["additional_data"]
+
+    assert parse_matter_service_data(bytes.fromhex("0161005d12bc0600")) is None  # other opcode
+    assert parse_matter_service_data(b"\x00\x61") is None
+
+def test_nous_manual_code_matches_advertised_discriminator():
+    device = annotate_matter_device({"address": "F8:17:2D:7F:BB:0D",
+                                     "service_data": {MATTER_SERVICE_UUID: NOUS_SERVICE_DATA}})
+    other = annotate_matter_device({"address": "AA:AA:AA:AA:AA:01",
+                                    "service_data": {MATTER_SERVICE_UUID: "0000095d12bc0600"}})
+
+    payload = parse_setup_payload("0150-175-1910")  # short discriminator 0
+    assert matches_payload(device, payload)
+    assert not matches_payload(other, payload)  # discriminator 0x900, short 9
+    assert not matches_payload(annotate_matter_device({"name": "MATTER-0097"}), payload)
+
+    index = index_commissionable_devices([device, other])
+    assert index[(97, 0x125D, 0x06BC)] is device
+
+def test_parses_bluetoothctl_info_service_data():
+    service_data = parse_bluetoothctl_service_data(BLUETOOTHCTL_INFO)
+    assert service_data == {MATTER_SERVICE_UUID: NOUS_SERVICE_DATA}
+
+class FailingScanner:
+    """BLE scanner whose adapter has gone away"""
+
+    timeout = 5
+    adapter = "hci0"
+
+    async def stream_devices(self, timeout=None, discriminator=None, stop_when=None):
+        raise Exception("No such adapter: hci0")
+        yield
+
+def test_failed_scan_falls_back_to_payload_discriminator(tmp_path):
+    # Prints its arguments, so the test sees the discriminator chip-tool was given
+    chip_tool = tmp_path / "chip-tool"
+    chip_tool.write_text("#!/bin/sh\necho \"$@\"\n")
+    chip_tool.chmod(0o755)
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["matter"]["chip_tool_path"] = str(chip_tool)
+    config.config["matter"]["node_id_mappings_path"] = str(tmp_path / "mappings.json")
+    client = MatterClient(config, ble_scanner=FailingScanner())
+    client.adapters.sysfs_path = str(tmp_path / "no-sysfs")
+
+    async def run():
+        matches = await client.find_commissionable_devices([parse_setup_payload("0150-175-1910")])
+        result = await client._commission_ble("office-socket", {
+            "qr_code": "0150-175-1910",
+            "network_ssid": "home",
+            "network_password": "secret"
+        })
+        return matches, result
+
+    matches, result = asyncio.run(run())
+    assert matches == [None]
+    assert result["success"]
+    assert result["discriminator_used"] == result["qr_discriminator"]
+    assert result["advertisement"] is None
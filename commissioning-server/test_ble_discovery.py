@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for the background BLE discovery cache
+"""
+
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.ble_discovery import BLEDiscoveryService
+from commissioning_server.core.config import Config
+
+class FakeScanner:
+    """Replays scripted advertisements and counts how many scans were started"""
+
+    def __init__(self, advertisements, delay=0.01):
+        self.advertisements = advertisements
+        self.delay = delay
+        self.scans = 0
+
+    async def stream_devices(self, timeout=None, discriminator=None, stop_when=None):
+        self.scans += 1
+        for device in self.advertisements:
+            await asyncio.sleep(self.delay)
+            yield dict(device)
+
+def make_service(tmp_path, scanner, **discovery):
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["bluetooth"]["discovery"] = {"cycle_duration": 0.05, "retry_delay": 0.01, **discovery}
+    return BLEDiscoveryService(config, scanner)
+
+def device(address, rssi, discriminator=None):
+    return {"address": address, "name": "MATTER", "rssi": rssi, "discriminator": discriminator}
+
+def test_rssi_history_and_ttl_eviction(tmp_path):
+    async def run():
+        service = make_service(tmp_path, FakeScanner([]), ttl=60, rssi_history=2)
+        for rssi in (-70, -65, -60):
+            service.update(device("AA:AA:AA:AA:AA:01", rssi))
+        service.update(device("AA:AA:AA:AA:AA:02", -80))
+        service.cache["AA:AA:AA:AA:AA:02"]["last_seen"] = time.time() - 120
+        return await service.get_devices()
+
+    devices = asyncio.run(run())
+    assert [d["address"] for d in devices] == ["AA:AA:AA:AA:AA:01"]
+    assert devices[0]["rssi_history"] == [-65, -60]
+    assert devices[0]["first_seen"] <= devices[0]["last_seen"]
+
+def test_concurrent_top_ups_share_one_scan(tmp_path):
+    async def run():
+        scanner = FakeScanner([device("AA:AA:AA:AA:AA:01", -60)])
+        service = make_service(tmp_path, scanner)
+        results = await asyncio.gather(*[service.get_devices(fresh_within=10) for _ in range(5)])
+        # A fresh cache is answered without scanning again
+        await service.get_devices(fresh_within=10)
+        return scanner.scans, results
+
+    scans, results = asyncio.run(run())
+    assert scans == 1
+    assert all(len(devices) == 1 for devices in results)
+
+def test_background_loop_feeds_waiters(tmp_path):
+    async def run():
+        scanner = FakeScanner([device("AA:AA:AA:AA:AA:01", -60), device("AA:AA:AA:AA:AA:02", -50, 97)])
+        service = make_service(tmp_path, scanner)
+        await service.start()
+        try:
+            found = await service.wait_for_device(lambda d: d.get("discriminator") == 97, timeout=2)
+            missing = await service.wait_for_device(lambda d: d.get("discriminator") == 5, timeout=0.1)
+        finally:
+            await service.stop()
+        return found, missing
+
+    found, missing = asyncio.run(run())
+    assert found["address"] == "AA:AA:AA:AA:AA:02"
+    assert missing is None
+
+def test_paused_releases_adapter(tmp_path):
+    async def run():
+        scanner = FakeScanner([device("AA:AA:AA:AA:AA:01", -60)])
+        service = make_service(tmp_path, scanner)
+        await service.start()
+        await asyncio.sleep(0.1)
+        async with service.paused():
+            scans_before = scanner.scans
+            status = service.get_status()
+            # Top-ups are skipped while paused, even for a stale cache
+            await service.get_devices(fresh_within=0)
+            await asyncio.sleep(0.1)
+            scans_during = scanner.scans
+        await asyncio.sleep(0.1)
+        scans_after = scanner.scans
+        await service.stop()
+        return status, scans_before, scans_during, scans_after
+
+    status, scans_before, scans_during, scans_after = asyncio.run(run())
+    assert status["paused"]
+    assert scans_during == scans_before
+    assert scans_after > scans_during
+
+def test_failed_scan_does_not_mark_cache_fresh(tmp_path):
+    class FailingScanner(FakeScanner):
+        async def stream_devices(self, timeout=None, discriminator=None, stop_when=None):
+            self.scans += 1
+            yield device("AA:AA:AA:AA:AA:01", -60)
+            raise RuntimeError("adapter went away")
+
+    async def run():
+        scanner = FailingScanner([])
+        service = make_service(tmp_path, scanner)
+        for _ in range(2):
+            try:
+                await service.get_devices(fresh_within=10)
+            except RuntimeError:
+                pass
+        return scanner.scans, service
+
+    scans, service = asyncio.run(run())
+    # The second top-up scans again instead of trusting the half-finished one
+    assert scans == 2
+    assert service.last_scan_at is None
+    assert len(service.cache) == 1
+
+def test_first_background_cycle_serves_as_the_top_up(tmp_path):
+    async def run():
+        scanner = FakeScanner([device(f"AA:AA:AA:AA:AA:0{i}", -60) for i in range(5)], delay=0.05)
+        service = make_service(tmp_path, scanner, cycle_duration=10, top_up_duration=0.12)
+        await service.start()
+        await asyncio.sleep(0.01)
+        try:
+            # No scan has completed yet, but the cycle is scanning
+            devices = await service.get_devices(fresh_within=10)
+            scans = scanner.scans
+        finally:
+            await service.stop()
+        return devices, scans
+
+    devices, scans = asyncio.run(run())
+    assert len(devices) >= 2
+    # Waited on the cycle rather than starting a second scan next to it
+    assert scans == 1
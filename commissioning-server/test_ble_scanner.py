@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Test script for BLEScanner backend selection and fallback
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.ble_scanner import BLEScanner
+from commissioning_server.core.config import Config
+
+class BrokenBlueZScanner:
+    """Fails like BlueZ does when bluetoothd is not on the system bus"""
+
+    async def stream_devices(self, timeout=None, discriminator=None, stop_when=None):
+        raise Exception("org.freedesktop.DBus.Error.ServiceUnknown")
+        yield
+
+def test_stream_falls_back_to_bluetoothctl_when_dbus_fails(tmp_path):
+    scanner = BLEScanner(Config(str(tmp_path / "config.yaml")))
+    scanner._use_dbus = lambda: True
+    scanner.bluez_scanner = BrokenBlueZScanner()
+    fallback_scans = []
+
+    async def scan_bluetoothctl(timeout):
+        fallback_scans.append(timeout)
+        return [{"address": "F8:17:2D:7F:BB:0D", "name": "MATTER-0097"}]
+
+    scanner._scan_bluetoothctl = scan_bluetoothctl
+
+    async def run():
+        return [device async for device in scanner.stream_devices(timeout=5)]
+
+    devices = asyncio.run(run())
+    assert [device["address"] for device in devices] == ["F8:17:2D:7F:BB:0D"]
+    assert fallback_scans == [5]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming BlueZ scanner against a mock BlueZ on a private D-Bus
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+pytest.importorskip("dbus_next")
+if not shutil.which("dbus-daemon"):
+    pytest.skip("dbus-daemon not available", allow_module_level=True)
+
+from dbus_next import Message, Variant
+from dbus_next.aio import MessageBus
+from dbus_next.service import ServiceInterface, method
+
+from commissioning_server.core.ble_advertisement import MATTER_SERVICE_UUID
+from commissioning_server.core.bluez_scanner import BlueZScanner
+from commissioning_server.core.config import Config
+
+ADAPTER_PATH = "/org/bluez/hci0"
+
+class MockObjectManager(ServiceInterface):
+    def __init__(self, objects):
+        super().__init__("org.freedesktop.DBus.ObjectManager")
+        self.objects = objects
+
+    @method()
+    def GetManagedObjects(self) -> "a{oa{sa{sv}}}":
+        return self.objects
+
+class MockAdapter(ServiceInterface):
+    """Emits a scripted list of advertisements once discovery starts"""
+
+    def __init__(self, bus, advertisements):
+        super().__init__("org.bluez.Adapter1")
+        self.bus = bus
+        self.advertisements = advertisements
+        self.discovering = False
+
+    @method()
+    def SetDiscoveryFilter(self, properties: "a{sv}"):
+        pass
+
+    @method()
+    def StartDiscovery(self):
+        self.discovering = True
+        asyncio.get_running_loop().create_task(self._advertise())
+
+    @method()
+    def StopDiscovery(self):
+        self.discovering = False
+
+    async def _advertise(self):
+        for delay, message in self.advertisements:
+            await asyncio.sleep(delay)
+            if self.discovering:
+                await self.bus.send(message)
+
+def device_added(address, name, rssi, discriminator=None):
+    path = f"{ADAPTER_PATH}/dev_{address.replace(':', '_')}"
+    properties = {
+        "Address": Variant("s", address),
+        "Name": Variant("s", name),
+        "RSSI": Variant("n", rssi)
+    }
+    if discriminator is not None:
+        # Matter commissionable advertisement: opcode, discriminator, VID 0x125D, PID 0x06BC, flags
+        data = bytes([0x00, discriminator & 0xFF, discriminator >> 8, 0x5D, 0x12, 0xBC, 0x06, 0x00])
+        properties["ServiceData"] = Variant("a{sv}", {MATTER_SERVICE_UUID: Variant("ay", data)})
+    return Message.new_signal("/", "org.freedesktop.DBus.ObjectManager", "InterfacesAdded", "oa{sa{sv}}", [
+        path,
+        {"org.bluez.Device1": properties}
+    ])
+
+def rssi_changed(address, rssi):
+    path = f"{ADAPTER_PATH}/dev_{address.replace(':', '_')}"
+    return Message.new_signal(path, "org.freedesktop.DBus.Properties", "PropertiesChanged", "sa{sv}as", [
+        "org.bluez.Device1", {"RSSI": Variant("n", rssi)}, []
+    ])
+
+@pytest.fixture
+def bus_address(tmp_path):
+    daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address"],
+        stdout=subprocess.PIPE, text=True
+    )
+    address = daemon.stdout.readline().strip()
+    yield address
+    daemon.terminate()
+    daemon.wait()
+
+def run_with_mock_bluez(bus_address, tmp_path, advertisements, scenario):
+    async def run():
+        service_bus = await MessageBus(bus_address=bus_address).connect()
+        service_bus.export("/", MockObjectManager({
+            ADAPTER_PATH: {"org.bluez.Adapter1": {"Address": Variant("s", "00:11:22:33:44:55")}}
+        }))
+        service_bus.export(ADAPTER_PATH, MockAdapter(service_bus, advertisements))
+        await service_bus.request_name("org.bluez")
+        try:
+            scanner = BlueZScanner(Config(str(tmp_path / "config.yaml")), bus_address=bus_address)
+            return await scenario(scanner)
+        finally:
+            service_bus.disconnect()
+
+    return asyncio.run(run())
+
+def test_devices_are_yielded_as_they_advertise(bus_address, tmp_path):
+    advertisements = [
+        (0.05, device_added("F8:17:2D:7F:BB:0D", "MATTER-0097", -60)),
+        (0.05, rssi_changed("F8:17:2D:7F:BB:0D", -55)),
+    ]
+
+    async def scenario(scanner):
+        assert await scanner.is_available()
+        start = time.monotonic()
+        seen = []
+        async for device in scanner.stream_devices(timeout=5):
+            seen.append((time.monotonic() - start, device))
+            if len(seen) == 2:
+                break
+        return seen
+
+    seen = run_with_mock_bluez(bus_address, tmp_path, advertisements, scenario)
+    first_at, first = seen[0]
+    assert first_at < 1.0  # not held back until the scan window closes
+    assert first["address"] == "F8:17:2D:7F:BB:0D"
+    assert first["name"] == "MATTER-0097"
+    assert seen[1][1]["rssi"] == -55
+    assert seen[1][1]["name"] == "MATTER-0097"  # merged with earlier properties
+
+def test_scan_ends_early_on_target_discriminator(bus_address, tmp_path):
+    advertisements = [
+        (0.05, device_added("AA:AA:AA:AA:AA:01", "MATTER-0042", -70, discriminator=42)),
+        (0.05, device_added("AA:AA:AA:AA:AA:02", "MATTER-0097", -65, discriminator=97)),
+        (0.05, device_added("AA:AA:AA:AA:AA:03", "MATTER-0100", -65, discriminator=100)),
+    ]
+
+    async def scenario(scanner):
+        start = time.monotonic()
+        devices = await scanner.scan_devices(timeout=5, discriminator=97)
+        return time.monotonic() - start, devices
+
+    elapsed, devices = run_with_mock_bluez(bus_address, tmp_path, advertisements, scenario)
+    assert elapsed < 2.0
+    assert [d["address"] for d in devices] == ["AA:AA:AA:AA:AA:01", "AA:AA:AA:AA:AA:02"]
+    assert devices[1]["vendor_id"] == 0x125D
+    assert devices[1]["product_id"] == 0x06BC
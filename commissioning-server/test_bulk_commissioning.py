@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test script for manifest-driven bulk commissioning
+"""
+
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.bulk_commissioning import BulkCommissioner, load_manifest, manifest_run_id
+from commissioning_server.core.commissioning_jobs import CommissioningJobQueue
+from commissioning_server.core.config import Config
+
+MANIFEST = [
+    {"device_name": "Office Socket", "qr_code": "MT:Y.K9042C00KA0648G00", "device_type": "socket"},
+    {"device_name": "Kitchen Socket", "qr_code": "0150-175-1910", "device_type": "socket"},
+    {"device_name": "Hall Socket", "qr_code": "34970112332", "device_type": "socket"},
+    {"device_name": "Broken Socket", "qr_code": "0150-175-1911", "device_type": "socket"},
+]
+
+class FakeMatterClient:
+    """Counts shared scans and answers every payload with a fake advertisement"""
+
+    def __init__(self):
+        self.scans = []
+
+    async def find_commissionable_devices(self, payloads):
+        self.scans.append(len(payloads))
+        return [{"address": f"AA:AA:AA:AA:AA:0{i}"} for i in range(len(payloads))]
+
+def make_commissioner(tmp_path, runner, workers=2):
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["commissioning"]["jobs"]["workers"] = workers
+    config.config["commissioning"]["bulk"]["runs_dir"] = str(tmp_path / "runs")
+    jobs = CommissioningJobQueue(config, runner)
+    client = FakeMatterClient()
+    return BulkCommissioner(config, client, jobs), jobs, client
+
+async def collect(commissioner, jobs, entries, **kwargs):
+    await jobs.start()
+    try:
+        return [record async for record in commissioner.run(
+            entries, {"network_ssid": "home", "network_password": "secret", "pi_ip": ""}, **kwargs
+        )]
+    finally:
+        await jobs.stop()
+
+def test_load_manifest_csv_and_json(tmp_path):
+    csv_path = tmp_path / "manifest.csv"
+    csv_path.write_text("device_name,qr_code\nOffice Socket, MT:Y.K9042C00KA0648G00\n")
+    json_path = tmp_path / "manifest.json"
+    json_path.write_text(json.dumps({"devices": MANIFEST[:1]}))
+
+    assert load_manifest(str(csv_path)) == [
+        {"device_name": "Office Socket", "qr_code": "MT:Y.K9042C00KA0648G00", "device_type": ""}
+    ]
+    assert load_manifest(str(json_path)) == MANIFEST[:1]
+
+def test_bulk_run_streams_report_with_one_shared_scan(tmp_path):
+    running = []
+    peak = []
+
+    async def runner(job, report):
+        running.append(job.device_id)
+        peak.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(job.device_id)
+        assert job.params["network_ssid"] == "home"
+        # Manual-code devices arrive with their advertisement already resolved
+        has_device = "ble_device" in job.params
+        return {"success": True, "node_id": f"node-{job.device_id}", "had_ble_device": has_device}
+
+    commissioner, jobs, client = make_commissioner(tmp_path, runner)
+    records = asyncio.run(collect(commissioner, jobs, MANIFEST, concurrency=2))
+
+    assert records[0] == {"type": "run", "run_id": manifest_run_id(MANIFEST), "devices": 4, "already_succeeded": 0}
+    devices = {record["device_id"]: record for record in records if record["type"] == "device"}
+    assert devices["broken-socket"]["status"] == "failed"
+    assert "Invalid onboarding code" in devices["broken-socket"]["error"]
+    assert {devices[d]["status"] for d in ("office-socket", "kitchen-socket", "hall-socket")} == {"succeeded"}
+    assert devices["hall-socket"]["node_id"] == "node-hall-socket"
+    assert records[-1] == {"type": "summary", "run_id": manifest_run_id(MANIFEST),
+                           "succeeded": 3, "failed": 1, "skipped": 0}
+    # Only the two manual codes needed a scan, and they shared it
+    assert client.scans == [2]
+    assert max(peak) == 2
+    assert "secret" not in (tmp_path / "runs" / f"{manifest_run_id(MANIFEST)}.jsonl").read_text()
+
+def test_rerun_resumes_after_partial_failure(tmp_path):
+    attempts = {}
+
+    async def runner(job, report):
+        attempts[job.device_id] = attempts.get(job.device_id, 0) + 1
+        if job.device_id == "kitchen-socket" and attempts[job.device_id] == 1:
+            return {"success": False, "error": "Commissioning timed out"}
+        return {"success": True, "node_id": "1"}
+
+    commissioner, jobs, _ = make_commissioner(tmp_path, runner)
+    first = asyncio.run(collect(commissioner, jobs, MANIFEST[:3]))
+    assert first[-1]["failed"] == 1
+
+    # A new server process picks the run up from its log
+    commissioner, jobs, _ = make_commissioner(tmp_path, runner)
+    second = asyncio.run(collect(commissioner, jobs, MANIFEST[:3]))
+    assert second[0]["already_succeeded"] == 2
+    assert second[-1] == {"type": "summary", "run_id": manifest_run_id(MANIFEST[:3]),
+                          "succeeded": 1, "failed": 0, "skipped": 2}
+    assert attempts == {"office-socket": 1, "kitchen-socket": 2, "hall-socket": 1}
+
+def test_high_concurrency_never_overflows_the_job_queue(tmp_path):
+    async def runner(job, report):
+        await asyncio.sleep(0.01)
+        return {"success": True, "node_id": "1"}
+
+    commissioner, jobs, _ = make_commissioner(tmp_path, runner, workers=1)
+    jobs.max_queued = 1
+    commissioner.queue_full_retry = 0.01
+    manifest = [{"device_name": f"Socket {i}", "qr_code": "MT:Y.K9042C00KA0648G00", "device_type": "socket"}
+                for i in range(6)]
+
+    async def run():
+        await jobs.start()
+        # A job from outside the run holds the only queue slot at first
+        outside = jobs.submit("outside-socket", {})
+        try:
+            return [record async for record in commissioner.run(
+                manifest, {"network_ssid": "home", "network_password": "secret", "pi_ip": ""}, concurrency=50
+            )], outside
+        finally:
+            await jobs.stop()
+
+    records, outside = asyncio.run(run())
+    assert records[-1]["succeeded"] == 6
+    assert outside.status == "succeeded"
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test script for the interactive chip-tool pool using a fake chip-tool
+"""
+
+import asyncio
+import os
+import stat
+import sys
+import textwrap
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.chip_tool_pool import ChipToolPool
+from commissioning_server.core.config import Config
+
+FAKE_CHIP_TOOL = textwrap.dedent('''\
+    #!{python}
+    import asyncio, base64, json, os, sys
+    import websockets
+
+    port = int(sys.argv[sys.argv.index("--port") + 1])
+
+    async def handle(ws):
+        async for message in ws:
+            if message == "crash":
+                os._exit(1)
+            log = base64.b64encode(f"pid {{os.getpid()}} ran {{message}}".encode()).decode()
+            await ws.send(json.dumps({{"results": [], "logs": [{{"module": "TOO", "message": log}}]}}))
+
+    async def main():
+        async with websockets.serve(handle, "localhost", port):
+            await asyncio.Future()
+
+    asyncio.run(main())
+''').format(python=sys.executable)
+
+def make_pool(tmp_path, size=2, port=19302, with_fabric=True):
+    chip_tool = tmp_path / "chip-tool"
+    chip_tool.write_text(FAKE_CHIP_TOOL)
+    chip_tool.chmod(chip_tool.stat().st_mode | stat.S_IEXEC)
+
+    seed = tmp_path / "seed"
+    seed.mkdir(exist_ok=True)
+    if with_fabric:
+        (seed / "chip_tool_config.ini").write_text("[Default]\nExampleCARootCert0=abc\n")
+
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["matter"]["chip_tool_path"] = str(chip_tool)
+    config.config["matter"]["interactive_pool"] = {
+        "enabled": True,
+        "size": size,
+        "base_port": port,
+        "health_interval": 0.2,
+        "storage_root": str(tmp_path / "storage"),
+        "seed_storage_dir": str(seed)
+    }
+    return ChipToolPool(config)
+
+def test_commands_reuse_warm_workers(tmp_path):
+    async def run():
+        pool = make_pool(tmp_path)
+        await pool.start()
+        try:
+            results = await asyncio.gather(*[
+                pool.run(["onoff", "toggle", "0x1", "1"]) for _ in range(6)
+            ])
+            pids = {r["stdout"].split()[1] for r in results}
+            assert all(r["return_code"] == 0 for r in results)
+            assert "ran onoff toggle 0x1 1" in results[0]["stdout"]
+            assert len(pids) <= 2
+            assert sum(w.commands_run for w in pool.workers) == 6
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+
+def test_dead_worker_is_restarted(tmp_path):
+    async def run():
+        pool = make_pool(tmp_path, size=1, port=19312)
+        await pool.start()
+        try:
+            worker = pool.workers[0]
+            first_pid = worker.process.pid
+            await worker.websocket.send("crash")
+            await worker.process.wait()
+
+            result = await pool.run(["onoff", "on", "0x1", "1"])
+            assert result["return_code"] == 0
+            assert worker.process.pid != first_pid
+            assert worker.restarts == 1
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+
+def test_workers_get_their_own_seeded_storage(tmp_path):
+    async def run():
+        pool = make_pool(tmp_path, port=19322)
+        await pool.start()
+        try:
+            storage_dirs = [worker.extra_args[-1] for worker in pool.workers]
+            # Arguments with spaces reach chip-tool as one argument
+            result = await pool.run(["basicinformation", "write", "node-label", "Office Socket", "0x1", "0"])
+            return storage_dirs, result
+        finally:
+            await pool.stop()
+
+    storage_dirs, result = asyncio.run(run())
+    assert storage_dirs == [str(tmp_path / "storage" / "worker-0"), str(tmp_path / "storage" / "worker-1")]
+    for storage_dir in storage_dirs:
+        assert "abc" in open(os.path.join(storage_dir, "chip_tool_config.ini")).read()
+    assert "ran basicinformation write node-label 'Office Socket' 0x1 0" in result["stdout"]
+
+def test_pool_does_not_start_without_primary_fabric(tmp_path):
+    async def run():
+        pool = make_pool(tmp_path, port=19332, with_fabric=False)
+        await pool.start()
+        return pool
+
+    pool = asyncio.run(run())
+    assert not pool.running
+    assert pool.workers == []
+    assert not (tmp_path / "storage").exists()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test script for per-node command scheduling and coalescing
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.command_queue import NodeCommandQueue
+
+class FakeNode:
+    """Records the commands it receives and how many overlapped"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.received = []
+        self.active = 0
+        self.max_active = 0
+
+    def command(self, value, fail=False):
+        async def send():
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                await asyncio.sleep(self.delay)
+                if fail:
+                    raise RuntimeError("device unreachable")
+                self.received.append(value)
+                return {"success": True, "command": value}
+            finally:
+                self.active -= 1
+        return send
+
+def test_burst_collapses_to_last_command():
+    async def run():
+        queue = NodeCommandQueue(window=0.01)
+        node = FakeNode()
+        results = await asyncio.gather(*[
+            queue.submit(1, node.command(value), key="onoff", value=value)
+            for value in ("on", "off", "on", "off")
+        ])
+        return node, results, queue.get_status()
+
+    node, results, status = asyncio.run(run())
+    assert node.received == ["off"]
+    assert all(result == {"success": True, "command": "off"} for result in results)
+    assert status["coalesced"] == 3 and status["sent"] == 1 and status["queued"] == 0
+
+def test_commands_are_serialised_per_node_and_parallel_across_nodes():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        node_a, node_b = FakeNode(), FakeNode()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(
+            queue.submit("a", node_a.command("identify")),
+            queue.submit("a", node_a.command("read")),
+            queue.submit("b", node_b.command("identify")),
+            queue.submit("b", node_b.command("read")),
+        )
+        return node_a, node_b, loop.time() - started
+
+    node_a, node_b, elapsed = asyncio.run(run())
+    # Commands without a key never collapse and keep their order
+    assert node_a.received == ["identify", "read"] and node_b.received == ["identify", "read"]
+    assert node_a.max_active == 1 and node_b.max_active == 1
+    assert elapsed < 4 * 0.02
+
+def test_only_waiting_tail_command_is_superseded():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        node = FakeNode()
+        first = asyncio.create_task(queue.submit(1, node.command("on"), key="onoff", value="on"))
+        await asyncio.sleep(0.005)  # "on" is now running and must not be replaced
+        rest = [
+            asyncio.create_task(queue.submit(1, node.command("off"), key="onoff", value="off")),
+            asyncio.create_task(queue.submit(1, node.command("toggle"))),
+            asyncio.create_task(queue.submit(1, node.command("on"), key="onoff", value="on")),
+        ]
+        await asyncio.sleep(0)
+        pending = queue.pending_value(1, "onoff")
+        await asyncio.gather(first, *rest)
+        return node, pending
+
+    node, pending = asyncio.run(run())
+    # The toggle sits between the two on/off commands, so neither replaces the other
+    assert node.received == ["on", "off", "toggle", "on"]
+    assert pending == "on"
+
+def test_failure_reaches_every_coalesced_caller():
+    async def run():
+        queue = NodeCommandQueue(window=0.01)
+        node = FakeNode()
+        results = await asyncio.gather(
+            queue.submit(1, node.command("on"), key="onoff", value="on"),
+            queue.submit(1, node.command("off", fail=True), key="onoff", value="off"),
+            return_exceptions=True
+        )
+        # The node keeps working after a failure
+        after = await queue.submit(1, node.command("on"), key="onoff", value="on")
+        return results, after
+
+    results, after = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert after["command"] == "on"
+
+def test_idle_nodes_leave_no_worker_behind():
+    async def run():
+        queue = NodeCommandQueue(window=0)
+        node = FakeNode(delay=0)
+        await asyncio.gather(*[queue.submit(node_id, node.command(node_id)) for node_id in range(50)])
+        idle = dict(queue._workers)
+        # A node that went idle gets a fresh worker on its next command
+        again = await queue.submit(7, node.command("again"))
+        return idle, again, queue._workers
+
+    idle, again, workers = asyncio.run(run())
+    assert idle == {}
+    assert again == {"success": True, "command": "again"}
+    assert workers == {}
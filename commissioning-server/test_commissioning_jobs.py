@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test script for the asynchronous commissioning job queue
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from commissioning_server.core.commissioning_jobs import CommissioningJobQueue, JobQueueFull
+from commissioning_server.core.config import Config
+from commissioning_server.core.matter_client import MatterClient
+
+def make_config(tmp_path, **jobs):
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["commissioning"]["jobs"].update(jobs)
+    return config
+
+def test_job_reports_phases_and_result(tmp_path):
+    async def runner(job, report):
+        for phase in ("parse", "scan", "pase", "network", "case", "transfer"):
+            report(phase)
+            await asyncio.sleep(0)
+        return {"success": True, "device_id": job.device_id}
+
+    async def run():
+        queue = CommissioningJobQueue(make_config(tmp_path), runner)
+        events = []
+
+        async def listener(event, job):
+            events.append((event, job["phase"], job["status"]))
+
+        queue.add_listener(listener)
+        await queue.start()
+        job = queue.submit("office-socket", {"qr_code": "MT:Y.K9042C00KA0648G00"})
+        while not job.finished:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await queue.stop()
+        return job, events
+
+    job, events = asyncio.run(run())
+    assert job.status == "succeeded" and job.result["device_id"] == "office-socket"
+    assert [entry["phase"] for entry in job.phases] == ["parse", "scan", "pase", "network", "case", "transfer"]
+    assert events[0] == ("job_queued", None, "queued")
+    assert [phase for event, phase, _ in events if event == "job_phase"][-1] == "transfer"
+    assert events[-1][0] == "job_finished"
+    # The request parameters (and network password) never leave the server
+    assert "params" not in job.to_dict()
+
+def test_retries_get_the_running_job_and_workers_are_bounded(tmp_path):
+    running = []
+    peak = []
+    release = None
+
+    async def runner(job, report):
+        running.append(job.device_id)
+        peak.append(len(running))
+        await release.wait()
+        running.remove(job.device_id)
+        return {"success": False, "error": "Commissioning timed out"}
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        queue = CommissioningJobQueue(make_config(tmp_path, workers=2, max_queued=1), runner)
+        await queue.start()
+        first = queue.submit("socket-1", {})
+        await asyncio.sleep(0.01)
+        retry = queue.submit("socket-1", {})
+        queue.submit("socket-2", {})
+        await asyncio.sleep(0.01)
+        # Both workers are busy, so socket-3 waits and fills the queue
+        queue.submit("socket-3", {})
+        with pytest.raises(JobQueueFull):
+            queue.submit("socket-4", {})
+        release.set()
+        while not all(job.finished for job in queue.jobs.values()):
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return first, retry, queue
+
+    first, retry, queue = asyncio.run(run())
+    assert retry is first
+    assert max(peak) == 2
+    assert first.status == "failed" and first.error == "Commissioning timed out"
+    assert queue.get_status()["jobs"] == {"failed": 3}
+
+def test_phases_are_read_from_chip_tool_output(tmp_path):
+    script = tmp_path / "fake-chip-tool"
+    script.write_text(
+        "#!/bin/sh\n"
+        "echo 'CHIP:BLE: BLE connection established'\n"
+        "echo 'CHIP:SC: Sending PBKDFParamRequest'\n"
+        "echo \"CHIP:CTL: Performing next commissioning step 'WiFiNetworkSetup'\"\n"
+        "echo \"CHIP:CTL: Performing next commissioning step 'WiFiNetworkEnable'\"\n"
+        "echo \"CHIP:CTL: Performing next commissioning step 'FindOperationalForStayActive'\"\n"
+        "echo 'CHIP:TOO: Device commissioning completed with success' \n"
+    )
+    script.chmod(0o755)
+
+    async def run():
+        client = MatterClient(make_config(tmp_path))
+        phases = []
+        result = await client._run_command(
+            [str(script), "pairing", "ble-wifi"], on_line=client._phase_tracker(phases.append)
+        )
+        return result, phases
+
+    result, phases = asyncio.run(run())
+    assert result["return_code"] == 0
+    assert "commissioning completed" in result["stdout"]
+    assert phases == ["pase", "network", "case"]
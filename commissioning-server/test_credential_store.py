@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Test script for the pooled SQLite credential store
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.config import Config
+from commissioning_server.core.credential_store import (
+    SCHEMA_VERSION,
+    SELECT_ALL_TRANSFERS_SQL,
+    SELECT_CREDENTIALS_SQL,
+    SELECT_DEVICE_TRANSFERS_SQL,
+    CredentialStore,
+)
+
+def make_store(tmp_path) -> CredentialStore:
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["storage"]["path"] = str(tmp_path / "credentials.db")
+    config.config["security"]["credential_key_path"] = str(tmp_path / "credentials.key")
+    return CredentialStore(config)
+
+def test_round_trip_and_transfers(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            assert await store.store_credentials("plug-1", {"node_id": "42", "passcode": "20202021"},
+                                                 {"name": "Plug", "commissioning_type": "ble-wifi"})
+            await store.record_transfer("plug-1", "192.168.0.107", "pi")
+            credentials = await store.get_credentials("plug-1")
+            everything = await store.get_all_credentials()
+            history = await store.get_transfer_history("plug-1")
+            assert await store.delete_credentials("plug-1")
+            deleted = await store.get_credentials("plug-1")
+        finally:
+            await store.cleanup()
+        return credentials, everything, history, deleted
+
+    credentials, everything, history, deleted = asyncio.run(run())
+    assert credentials == {"node_id": "42", "passcode": "20202021"}
+    assert everything[0]["name"] == "Plug"
+    assert history[0]["pi_ip"] == "192.168.0.107"
+    assert deleted is None
+
+    conn = sqlite3.connect(str(tmp_path / "credentials.db"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+def test_concurrent_writes_and_reads(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            stored = await asyncio.gather(*[
+                store.store_credentials(f"plug-{i}", {"node_id": str(i)}) for i in range(50)
+            ])
+            read = await asyncio.gather(*[store.get_credentials(f"plug-{i}") for i in range(50)])
+        finally:
+            await store.cleanup()
+        return stored, read
+
+    stored, read = asyncio.run(run())
+    assert all(stored)
+    assert [c["node_id"] for c in read] == [str(i) for i in range(50)]
+
+def test_failed_write_rolls_back(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            # The device row is written, then binding the dict node_id fails;
+            # the whole transaction must be discarded
+            ok = await store.store_credentials("plug-1", {"node_id": {"bad": 1}}, {"name": "Plug"})
+            async with store.pool.reader() as conn:
+                async with conn.execute("SELECT COUNT(*) FROM devices") as cursor:
+                    devices = (await cursor.fetchone())[0]
+        finally:
+            await store.cleanup()
+        return ok, devices
+
+    ok, devices = asyncio.run(run())
+    assert not ok
+    assert devices == 0
+
+def test_migration_deduplicates_legacy_database(tmp_path):
+    # Pre-versioning schema, with a device that was commissioned three times
+    conn = sqlite3.connect(str(tmp_path / "credentials.db"))
+    conn.execute("""
+        CREATE TABLE credentials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            fabric_id TEXT,
+            node_id TEXT,
+            endpoint TEXT,
+            credentials_data TEXT,
+            encrypted BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for node_id in ("1", "2", "3"):
+        conn.execute("INSERT INTO credentials (device_id, node_id, credentials_data) VALUES (?, ?, ?)",
+                     ("plug-1", node_id, json.dumps({"node_id": node_id})))
+    conn.commit()
+    conn.close()
+
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            before = await store.get_credentials("plug-1")
+            await store.store_credentials("plug-1", {"node_id": "4"})
+            after = await store.get_credentials("plug-1")
+        finally:
+            await store.cleanup()
+        return store.schema_version, before, after
+
+    version, before, after = asyncio.run(run())
+    assert version == SCHEMA_VERSION
+    assert before == {"node_id": "3"}
+    assert after == {"node_id": "4"}
+
+    conn = sqlite3.connect(str(tmp_path / "credentials.db"))
+    assert conn.execute("SELECT COUNT(*) FROM credentials").fetchone()[0] == 1
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+def test_lookups_use_indexes(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        await store.cleanup()
+
+    asyncio.run(run())
+    conn = sqlite3.connect(str(tmp_path / "credentials.db"))
+    plans = {
+        "credentials": conn.execute("EXPLAIN QUERY PLAN " + SELECT_CREDENTIALS_SQL, ("x",)).fetchall(),
+        "device_transfers": conn.execute("EXPLAIN QUERY PLAN " + SELECT_DEVICE_TRANSFERS_SQL, ("x",)).fetchall(),
+        "all_transfers": conn.execute("EXPLAIN QUERY PLAN " + SELECT_ALL_TRANSFERS_SQL).fetchall()
+    }
+    conn.close()
+    for name, plan in plans.items():
+        details = " ".join(row[-1] for row in plan)
+        assert "INDEX" in details, f"{name}: {details}"
+        assert "TEMP B-TREE" not in details, f"{name}: {details}"
+
+def test_keyset_pages_and_projection(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            for i in range(7):
+                await store.store_credentials(f"plug-{i}", {"node_id": str(i)}, {"name": f"Plug {i}"})
+            pages = []
+            after = None
+            while True:
+                page = await store.get_credentials_page(after_device_id=after, limit=3)
+                pages.append([c["device_id"] for c in page])
+                if len(page) < 3:
+                    break
+                after = page[-1]["device_id"]
+
+            # Small batches exercise the internal keyset paging of the iterator
+            streamed = [c async for c in store.iter_credentials(fields=["name"], batch_size=2)]
+
+            # A projection without credentials never touches the blob
+            store._decrypt_data = None
+            store.encrypt_credentials = True
+            projected = await store.get_credentials_page(limit=1, fields=["device_id", "node_id"])
+        finally:
+            await store.cleanup()
+        return pages, streamed, projected
+
+    pages, streamed, projected = asyncio.run(run())
+    assert pages == [["plug-0", "plug-1", "plug-2"], ["plug-3", "plug-4", "plug-5"], ["plug-6"]]
+    assert streamed[6] == {"device_id": "plug-6", "name": "Plug 6"}
+    assert len(streamed) == 7
+    assert projected == [{"device_id": "plug-0", "node_id": "0"}]
+
+def test_credentials_are_encrypted_at_rest(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            await store.store_credentials("plug-1", {"passcode": "20202021"})
+            await store.store_credentials("plug-2", {"passcode": "11111111"})
+            async with store.pool.transaction() as conn:
+                # Legacy placeholder row: flagged encrypted but stored as plain JSON
+                await conn.execute("INSERT INTO credentials (device_id, credentials_data, encrypted) "
+                                   "VALUES ('legacy', '{\"passcode\": \"1\"}', 1)")
+            listing = await store.get_all_credentials()
+        finally:
+            await store.cleanup()
+
+        # A fresh store reuses the key file
+        reopened = make_store(tmp_path)
+        await reopened.initialize()
+        try:
+            again = await reopened.get_credentials("plug-1")
+            async with reopened.pool.transaction() as conn:
+                # Swap plug-2's blob onto plug-1: the device id binding must reject it
+                await conn.execute("UPDATE credentials SET credentials_data = "
+                                   "(SELECT credentials_data FROM credentials WHERE device_id = 'plug-2') "
+                                   "WHERE device_id = 'plug-1'")
+            swapped = await reopened.get_credentials("plug-1")
+        finally:
+            await reopened.cleanup()
+        return listing, again, swapped
+
+    listing, again, swapped = asyncio.run(run())
+    assert {c["device_id"]: c["credentials"]["passcode"] for c in listing} == {
+        "legacy": "1", "plug-1": "20202021", "plug-2": "11111111"
+    }
+    assert again == {"passcode": "20202021"}
+    assert swapped is None
+
+    conn = sqlite3.connect(str(tmp_path / "credentials.db"))
+    blobs = [row[0] for row in conn.execute("SELECT credentials_data FROM credentials WHERE encrypted = 1")]
+    conn.close()
+    assert not any("20202021" in blob for blob in blobs)
+    assert oct(os.stat(tmp_path / "credentials.key").st_mode & 0o777) == "0o600"
+
+def test_bulk_lookup_and_transfer_records(tmp_path):
+    async def run():
+        store = make_store(tmp_path)
+        await store.initialize()
+        try:
+            for i in range(3):
+                await store.store_credentials(f"plug-{i}", {"node_id": str(i)})
+            devices = await store.get_credentials_many(["plug-2", "missing", "plug-0", "plug-2"])
+            await store.record_transfers({"plug-0": "success", "plug-2": "failed"}, "192.168.0.107", "pi")
+            history = await store.get_transfer_history()
+        finally:
+            await store.cleanup()
+        return devices, history
+
+    devices, history = asyncio.run(run())
+    assert [d["device_id"] for d in devices] == ["plug-0", "plug-2"]
+    assert devices[1]["credentials"] == {"node_id": "2"}
+    assert {h["device_id"]: h["status"] for h in history} == {"plug-0": "success", "plug-2": "failed"}
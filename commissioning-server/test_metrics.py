@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-process metrics and their Prometheus rendering
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.commissioning_jobs import COMMISSIONING_PHASE_SECONDS, CommissioningJobQueue
+from commissioning_server.core.config import Config
+from commissioning_server.core.matter_client import CHIP_TOOL_COMMAND_FAILURES, MatterClient
+from commissioning_server.core.metrics import MetricsRegistry, chip_tool_labels
+
+def test_counter_and_histogram_render_in_prometheus_format():
+    registry = MetricsRegistry()
+    spawns = registry.counter("spawns_total", "Processes started", ["program"])
+    latency = registry.histogram("command_seconds", "Command latency", ["subcommand"], buckets=(0.1, 1))
+
+    spawns.inc(program="chip-tool")
+    spawns.inc(program="chip-tool")
+    spawns.inc(program='say "hi"')
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, subcommand="onoff")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP spawns_total Processes started", "# TYPE spawns_total counter"]
+    assert 'spawns_total{program="chip-tool"} 2' in lines
+    assert 'spawns_total{program="say \\"hi\\""} 1' in lines
+    assert "# TYPE command_seconds histogram" in lines
+    # Buckets are cumulative and le is inclusive
+    assert 'command_seconds_bucket{subcommand="onoff",le="0.1"} 2' in lines
+    assert 'command_seconds_bucket{subcommand="onoff",le="1"} 3' in lines
+    assert 'command_seconds_bucket{subcommand="onoff",le="+Inf"} 4' in lines
+    assert 'command_seconds_sum{subcommand="onoff"} 3.65' in lines
+    assert 'command_seconds_count{subcommand="onoff"} 4' in lines
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("spawns_total", "Processes started", ["program"])
+    assert registry.counter("spawns_total", "Processes started", ["program"]) is first
+
+def test_registering_a_name_with_other_labels_raises():
+    registry = MetricsRegistry()
+    registry.counter("spawns_total", "Processes started", ["program"])
+    for register in (lambda: registry.counter("spawns_total", "Processes started", ["binary"]),
+                     lambda: registry.histogram("spawns_total", "Processes started", ["program"])):
+        try:
+            register()
+        except ValueError:
+            continue
+        raise AssertionError("conflicting registration was accepted")
+
+def test_chip_tool_commands_are_labelled_by_cluster_and_command():
+    assert chip_tool_labels(["onoff", "toggle", "1", "1"]) == {"cluster": "onoff", "command": "toggle"}
+    assert chip_tool_labels(["pairing", "ble-wifi", "1", "home"]) == {"cluster": "pairing", "command": "ble-wifi"}
+    assert chip_tool_labels(["interactive", "--help"]) == {"cluster": "interactive", "command": ""}
+    assert chip_tool_labels([]) == {"cluster": "", "command": ""}
+
+def test_chip_tool_timeouts_count_as_failures(tmp_path):
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["matter"]["node_id_mappings_path"] = str(tmp_path / "mappings.json")
+    client = MatterClient(config)
+
+    async def timed_out(cmd, timeout, on_line):
+        raise asyncio.TimeoutError()
+
+    client._spawn_command = timed_out
+    before = CHIP_TOOL_COMMAND_FAILURES.value(cluster="levelcontrol", command="move-to-level")
+    try:
+        asyncio.run(client._run_command(["chip-tool", "levelcontrol", "move-to-level", "10", "0", "0", "0", "1", "1"],
+                                        on_line=lambda line: None))
+    except asyncio.TimeoutError:
+        pass
+    assert CHIP_TOOL_COMMAND_FAILURES.value(cluster="levelcontrol", command="move-to-level") == before + 1
+
+def test_timer_decorates_coroutines_and_times_blocks():
+    registry = MetricsRegistry()
+    latency = registry.histogram("db_operation_seconds", "DB latency", ["operation"])
+
+    @latency.time(operation="get")
+    async def get():
+        await asyncio.sleep(0.01)
+        return "row"
+
+    assert asyncio.run(get()) == "row"
+    try:
+        with latency.time(operation="put"):
+            raise ValueError("locked")
+    except ValueError:
+        pass
+
+    assert latency.count(operation="get") == 1
+    assert latency.count(operation="put") == 1
+
+def test_commissioning_jobs_record_phase_durations(tmp_path):
+    async def runner(job, report):
+        for phase in ("parse", "scan", "pase"):
+            report(phase)
+            await asyncio.sleep(0.01)
+        return {"success": True}
+
+    async def run():
+        queue = CommissioningJobQueue(Config(str(tmp_path / "config.yaml")), runner)
+        await queue.start()
+        job = queue.submit("office-socket", {})
+        await job.wait()
+        await queue.stop()
+
+    before = {phase: COMMISSIONING_PHASE_SECONDS.count(phase=phase) for phase in ("parse", "scan", "pase")}
+    asyncio.run(run())
+    # The last phase is closed by the end of the job
+    assert all(COMMISSIONING_PHASE_SECONDS.count(phase=phase) == before[phase] + 1 for phase in before)
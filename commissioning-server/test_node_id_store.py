@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script for the append-only device -> Node ID mapping store
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.node_id_store import MAX_OPERATIONAL_NODE_ID, NodeIdStore
+
+def test_ids_are_deterministic_and_survive_restart(tmp_path):
+    store = NodeIdStore(str(tmp_path / "mappings.json"))
+    first = {device_id: store.get_or_allocate(device_id) for device_id in ("socket-1", "socket-2", "lamp")}
+    assert len(set(first.values())) == 3
+    assert all(0 < int(node_id, 16) <= MAX_OPERATIONAL_NODE_ID for node_id in first.values())
+
+    # A fresh store in another directory derives the same ids
+    other = NodeIdStore(str(tmp_path / "other.json"))
+    assert {device_id: other.get_or_allocate(device_id) for device_id in first} == first
+
+    reloaded = NodeIdStore(str(tmp_path / "mappings.json"))
+    assert reloaded.mappings == first
+
+def test_new_mappings_are_appended_not_rewritten(tmp_path):
+    path = tmp_path / "mappings.json"
+    store = NodeIdStore(str(path))
+    store.get_or_allocate("socket-1")
+    store.get_or_allocate("socket-2")
+    assert not path.exists()
+    lines = (tmp_path / "mappings.json.log").read_text().splitlines()
+    assert [json.loads(line)["device_id"] for line in lines] == ["socket-1", "socket-2"]
+
+def test_collisions_probe_to_the_next_id(tmp_path):
+    store = NodeIdStore(str(tmp_path / "mappings.json"))
+    expected = store.get_or_allocate("socket-1")
+
+    # Another device already holds the id socket-1 would get
+    store = NodeIdStore(str(tmp_path / "taken.json"))
+    store._set("legacy-device", expected)
+    assert store.get_or_allocate("socket-1") != expected
+
+def test_compaction_and_torn_log_tail(tmp_path):
+    path = tmp_path / "mappings.json"
+    store = NodeIdStore(str(path), compact_threshold=3)
+    ids = [store.get_or_allocate(f"device-{i}") for i in range(4)]
+    # The third allocation compacted the log into the snapshot
+    assert len(json.loads(path.read_text())) == 3
+    assert len((tmp_path / "mappings.json.log").read_text().splitlines()) == 1
+
+    # Simulate a crash halfway through appending an entry
+    with open(tmp_path / "mappings.json.log", "a") as f:
+        f.write('{"device_id": "device-4", "node')
+    store = NodeIdStore(str(path), compact_threshold=3)
+    assert [store.get(f"device-{i}") for i in range(4)] == ids
+    assert store.get("device-4") is None
+
+    store.get_or_allocate("device-5")
+    assert NodeIdStore(str(path)).get("device-5") == store.get("device-5")
+
+def test_legacy_mappings_file_is_loaded(tmp_path):
+    path = tmp_path / "device_node_mappings.json"
+    path.write_text(json.dumps({"office-socket": "00000000000004D2"}))
+    store = NodeIdStore(str(path))
+    assert store.get_or_allocate("office-socket") == "00000000000004D2"
+
+def test_unreadable_snapshot_is_moved_aside_not_compacted_over(tmp_path):
+    path = tmp_path / "mappings.json"
+    path.write_text(json.dumps({"office-socket": "not-hex"}))
+    with open(tmp_path / "mappings.json.log", "w") as f:
+        f.write(json.dumps({"device_id": "kitchen-socket", "node_id": "00000000000004D2"}) + "\n")
+        f.write('{"device_id": "hall')
+
+    store = NodeIdStore(str(path))
+    assert store.get("office-socket") is None
+    assert store.get("kitchen-socket") == "00000000000004D2"
+    aside = [name for name in os.listdir(tmp_path) if name.startswith("mappings.json.corrupt-")]
+    assert len(aside) == 1
+    assert json.loads((tmp_path / aside[0]).read_text()) == {"office-socket": "not-hex"}
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for native Matter onboarding payload decoding
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from commissioning_server.core.setup_payload import (
+    decode_manual_code,
+    decode_qr_code,
+    encode_manual_code,
+    encode_qr_code,
+    parse_setup_payload,
+)
+
+def test_decodes_reference_qr_code():
+    payload = parse_setup_payload("MT:Y.K9042C00KA0648G00")
+
+    assert payload["format"] == "qr"
+    assert payload["vendor_id"] == 0xFFF1
+    assert payload["product_id"] == 0x8000
+    assert payload["discovery_capabilities"] == 0x02  # BLE
+    assert payload["discriminator"] == 3840
+    assert payload["passcode"] == 20202021
+
+def test_decodes_nous_manual_codes():
+    payload = parse_setup_payload("0150-175-1910")
+    assert payload["format"] == "manual"
+    assert payload["passcode"] == 85064361
+    assert payload["has_short_discriminator"]
+
+    assert decode_manual_code("34970112332")["short_discriminator"] == 15
+
+def test_long_manual_code_carries_vendor_and_product():
+    code = encode_manual_code(3840, 20202021, vendor_id=0x125D, product_id=0x06BC)
+    payload = decode_manual_code(code)
+
+    assert len(code) == 21
+    assert payload["vendor_id"] == 0x125D
+    assert payload["product_id"] == 0x06BC
+    assert payload["commissioning_flow"] == 2
+
+def test_decodes_tlv_optional_data():
+    # Anonymous structure { 0: "SN-42", 0x83: 7 }
+    tlv = bytes([0x15, 0x2C, 0x00, 0x05]) + b"SN-42" + bytes([0x24, 0x83, 0x07, 0x18])
+    qr_code = encode_qr_code(0x125D, 0x06BC, 97, 85064361, optional_data=tlv)
+
+    payload = decode_qr_code(qr_code)
+    assert payload["discriminator"] == 97
+    assert payload["optional_data"] == {"serial_number": "SN-42", "vendor": {0x83: 7}}
+
+@pytest.mark.parametrize("code", [
+    "MT:Y.K9042C00KA0648G0",      # bad Base38 length
+    "MT:Y.K9042C00KA0648G0a",     # invalid character
+    "0150-175-1911",              # wrong check digit
+    "1234",                       # too short
+    encode_manual_code(0, 12345678),  # disallowed passcode
+])
+def test_rejects_invalid_codes(code):
+    with pytest.raises(ValueError):
+        parse_setup_payload(code)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for the multiplexed SSH transport, using a fake ssh on PATH
+
+The fake ssh records every invocation, "opens" a master by creating the
+ControlPath socket file, and runs remote commands locally with sh.
+"""
+
+import asyncio
+import json
+import os
+import stat
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.config import Config
+from commissioning_server.core.device_manager import DeviceManager
+
+FAKE_SSH = r'''#!/usr/bin/env python3
+import os, subprocess, sys
+args = sys.argv[1:]
+with open(os.environ["FAKE_SSH_LOG"], "a") as log:
+    log.write(" ".join(args) + "\n")
+control_path = next(a.split("=", 1)[1] for a in args if a.startswith("ControlPath="))
+if "-O" in args:
+    operation = args[args.index("-O") + 1]
+    if operation == "exit" and os.path.exists(control_path):
+        os.unlink(control_path)
+    sys.exit(0 if os.path.exists(control_path) or operation == "exit" else 255)
+if "ControlMaster=yes" in args:
+    open(control_path, "w").close()
+    sys.exit(0)
+if not os.path.exists(control_path):
+    sys.exit(255)
+sys.exit(subprocess.call(["sh", "-c", args[-1]]))
+'''
+
+def setup_fake_ssh(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ssh = bin_dir / "ssh"
+    ssh.write_text(FAKE_SSH)
+    ssh.chmod(ssh.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_SSH_LOG", str(tmp_path / "ssh.log"))
+
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["pi"]["ssh_control_dir"] = str(tmp_path / "ctl")
+    os.makedirs(tmp_path / "ctl")
+    return DeviceManager(config)
+
+def ssh_calls(tmp_path):
+    return (tmp_path / "ssh.log").read_text().splitlines()
+
+def test_batch_of_transfers_uses_one_handshake(tmp_path, monkeypatch):
+    manager = setup_fake_ssh(tmp_path, monkeypatch)
+    out_dir = tmp_path / "pi"
+    out_dir.mkdir()
+
+    async def run():
+        results = await asyncio.gather(*[
+            manager.transport.write_file("192.168.0.107", "pi", str(out_dir / f"device-{i}.json"),
+                                         json.dumps({"device_id": f"device-{i}"}).encode())
+            for i in range(5)
+        ])
+        ping = await manager.ping_pi("192.168.0.107", "pi")
+        healthy = await manager.transport.check("192.168.0.107", "pi")
+        status = manager.get_transport_status()
+        await manager.cleanup()
+        return results, ping, healthy, status
+
+    results, ping, healthy, status = asyncio.run(run())
+    assert all(result["return_code"] == 0 for result in results)
+    assert json.loads((out_dir / "device-3.json").read_text()) == {"device_id": "device-3"}
+    assert not list(out_dir.glob("*.tmp"))
+    assert ping and healthy
+
+    connection = status["connections"][0]
+    assert connection["handshakes"] == 1
+    assert connection["commands"] == 6
+    assert sum("ControlMaster=yes" in call for call in ssh_calls(tmp_path)) == 1
+
+def test_master_is_reopened_after_it_dies(tmp_path, monkeypatch):
+    manager = setup_fake_ssh(tmp_path, monkeypatch)
+
+    async def run():
+        assert await manager.ping_pi("192.168.0.107", "pi")
+        # The master exits (e.g. Pi rebooted): its socket disappears
+        os.unlink(manager.transport._control_path("192.168.0.107", "pi"))
+        alive = await manager.transport.check("192.168.0.107", "pi")
+        ping = await manager.ping_pi("192.168.0.107", "pi")
+        return alive, ping, manager.get_transport_status()
+
+    alive, ping, status = asyncio.run(run())
+    assert not alive
+    assert ping
+    assert status["connections"][0]["handshakes"] == 2
+
+def test_bulk_transfer_sends_one_archive(tmp_path, monkeypatch):
+    manager = setup_fake_ssh(tmp_path, monkeypatch)
+    manager.transfer_dir = str(tmp_path / "pi")
+    devices = [
+        {
+            "device_id": f"plug-{i}",
+            "name": f"Plug {i}",
+            "type": "socket",
+            "commissioning_type": "ble",
+            "credentials": {"qr_code": "MT:Y.K9042C00KA0648G00", "network_ssid": "home", "node_id": str(i)}
+        }
+        for i in range(200)
+    ]
+
+    async def run():
+        result = await manager.transfer_devices_to_pi(devices, "192.168.0.107", "pi")
+        await manager.cleanup()
+        return result
+
+    result = asyncio.run(run())
+    assert result["success"]
+    assert set(result["results"].values()) == {"success"}
+    # The same commissioning data document a single transfer writes
+    data = json.loads((tmp_path / "pi" / "commissioning_data_plug-42.json").read_text())
+    single = manager._build_commissioning_data("plug-42", {})
+    assert set(data) == set(single)
+    assert data["device_id"] == "plug-42"
+    assert data["device_name"] == "Plug 42"
+    assert data["device_type"] == "socket"
+    assert data["commissioning_method"] == "ble"
+    assert data["passcode"] == "20202021"
+    assert data["network_ssid"] == "home"
+    # One master handshake and one data channel for the whole batch
+    calls = [call for call in ssh_calls(tmp_path) if "-O" not in call]
+    assert len(calls) == 2
+
+def test_close_removes_only_its_own_control_dir(tmp_path, monkeypatch):
+    configured = setup_fake_ssh(tmp_path, monkeypatch)
+    config = Config(str(tmp_path / "config.yaml"))
+    config.config["pi"].pop("ssh_control_dir", None)
+    manager = DeviceManager(config)
+    control_dir = manager.transport.control_dir
+
+    async def run():
+        assert await manager.ping_pi("192.168.0.107", "pi")
+        await manager.transport.close()
+        removed = not os.path.exists(control_dir)
+        # The transport stays usable after close
+        ping = await manager.ping_pi("192.168.0.107", "pi")
+        await manager.transport.close()
+        await configured.transport.close()
+        return removed, ping
+
+    removed, ping = asyncio.run(run())
+    assert removed
+    assert ping
+    assert not os.path.exists(control_dir)
+    assert os.path.isdir(tmp_path / "ctl")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for the background-refreshed status snapshot
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from commissioning_server.core.status_snapshot import StatusSnapshot
+
+class CountingBuilder:
+    def __init__(self, delay: float = 0):
+        self.calls = 0
+        self.delay = delay
+        self.fail = False
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise Exception("chip-tool fabric list failed")
+        return {"build": self.calls}
+
+def test_reads_are_served_from_the_snapshot():
+    async def run():
+        build = CountingBuilder()
+        snapshot = StatusSnapshot(build, interval=60)
+        assert snapshot.age is None
+        await snapshot.start()
+        statuses = [await snapshot.get() for _ in range(100)]
+        await snapshot.stop()
+        return build, statuses, snapshot
+
+    build, statuses, snapshot = asyncio.run(run())
+    assert build.calls == 1
+    assert statuses[-1] == {"build": 1}
+    assert 0 <= snapshot.age < 60
+
+def test_refreshes_on_interval_and_on_request():
+    async def run():
+        build = CountingBuilder()
+        snapshot = StatusSnapshot(build, interval=0.05)
+        await snapshot.start()
+        await asyncio.sleep(0.12)
+        on_interval = build.calls
+
+        snapshot.interval = 60
+        await asyncio.sleep(0.06)
+        before = build.calls
+        # A burst of events collapses into one rebuild
+        for _ in range(10):
+            snapshot.refresh_soon()
+        await asyncio.sleep(0.02)
+        await snapshot.stop()
+        return on_interval, before, build.calls
+
+    on_interval, before, after = asyncio.run(run())
+    assert on_interval >= 3
+    assert after == before + 1
+
+def test_concurrent_refreshes_share_one_build():
+    async def run():
+        build = CountingBuilder(delay=0.02)
+        snapshot = StatusSnapshot(build)
+        results = await asyncio.gather(*(snapshot.get() for _ in range(5)))
+        return build.calls, results
+
+    calls, results = asyncio.run(run())
+    assert calls == 1
+    assert all(result == {"build": 1} for result in results)
+
+def test_failed_refresh_keeps_previous_snapshot():
+    async def run():
+        build = CountingBuilder()
+        snapshot = StatusSnapshot(build)
+        await snapshot.refresh()
+        build.fail = True
+        return await snapshot.refresh(), snapshot.refreshes
+
+    status, refreshes = asyncio.run(run())
+    assert status == {"build": 1}
+    assert refreshes == 1